@@ -7,6 +7,7 @@ import { setSortBy as sliceSortBy } from "../store/FilterSlice";
 import { useDispatch, useSelector } from "react-redux";
 
 const sortOptions = [
+  { value: "trending", label: "Trending", emoji: "🔥" },
   { value: "newest", label: "Newest", emoji: "🆕" },
   { value: "oldest", label: "Oldest", emoji: "📜" },
   { value: "most_liked", label: "Most Liked", emoji: "❤️" },
@@ -92,8 +93,10 @@ const DynamicSearch = ({ className = "", notification }) => {
         return;
       }
       try {
-        const response = await api.get(`posts/search/?q=${q}&sort=${sortBy}`);
-        setResults(response.data);
+        const response = await api.get(
+          `posts/suggest/?q=${encodeURIComponent(q)}`
+        );
+        setResults(response.data.results);
       } catch (err) {
         console.error("Search error:", err);
         setResults([]);
@@ -104,7 +107,14 @@ const DynamicSearch = ({ className = "", notification }) => {
   useEffect(() => {
     debouncedSearch(query);
     setShowDropdown(true);
-  }, [query, sortBy, debouncedSearch]);
+  }, [query, debouncedSearch]);
+
+  const openResult = (item) => {
+    setQuery(item.label);
+    setShowDropdown(false);
+    setHighlightedIndex(-1);
+    navigate(item.type === "user" ? `/user/${item.id}` : `/post/${item.id}`);
+  };
 
   const handleKeyDown = (e) => {
     if (!results.length) return;
@@ -117,10 +127,7 @@ const DynamicSearch = ({ className = "", notification }) => {
       );
     } else if (e.key === "Enter") {
       if (highlightedIndex >= 0 && highlightedIndex < results.length) {
-        setQuery(results[highlightedIndex].title);
-        setShowDropdown(false);
-        setHighlightedIndex(-1);
-        navigate(`/post/${results[highlightedIndex].id}`);
+        openResult(results[highlightedIndex]);
       }
     }
   };
@@ -158,24 +165,19 @@ const DynamicSearch = ({ className = "", notification }) => {
           {results.length > 0 ? (
             results.map((item, idx) => (
               <li
-                key={item.id}
-                onMouseDown={() => {
-                  setQuery(item.title);
-                  setShowDropdown(false);
-                  setHighlightedIndex(-1);
-                  navigate(`/post/${item.id}`);
-                }}
+                key={`${item.type}-${item.id}`}
+                onMouseDown={() => openResult(item)}
                 className={`px-4 py-2 cursor-pointer hover:bg-gray-200 dark:hover:bg-gray-700 ${
                   highlightedIndex === idx ? "bg-gray-200 dark:bg-gray-700" : ""
                 } text-black dark:text-white`}
               >
                 <span className="font-semibold">
-                  {item.title.length > 24
-                    ? item.title.slice(0, 24) + "..."
-                    : item.title}
+                  {item.label.length > 24
+                    ? item.label.slice(0, 24) + "..."
+                    : item.label}
                 </span>{" "}
                 <span className="text-xs text-gray-500 ml-1">
-                  by {item.author_username}
+                  {item.type === "user" ? "author" : "post"}
                 </span>
               </li>
             ))
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import {
   LogOut,
   Menu as LucideMenu,
@@ -31,6 +31,10 @@ const Nav = () => {
   const navigate = useNavigate();
   const dispatch = useDispatch();
   const [socket, setSocket] = useState(null);
+  const lastSeenRef = useRef(null); // seq of the last socket frame
+  const accessToken = useSelector((state) => state.auth.access_token);
+  const tokenRef = useRef(accessToken); // read on every reconnect
+  tokenRef.current = accessToken;
   const [user, setUser] = useState(null);
   const [mobileMenuOpen, setMobileMenuOpen] = useState(false);
   const unread_count = useSelector((state) => state.notifications.unread_count);
@@ -74,46 +78,66 @@ const Nav = () => {
 
   useEffect(() => {
     if (!reduxUser?.id) return;
+    lastSeenRef.current = null;
+    let socket;
+    let retryTimer;
+    let closed = false;
 
-    const socket = new WebSocket(
-      `${import.meta.VITE_WEBSOCKET_URL}/ws/notifications/${reduxUser.id}/`
-    );
-    setSocket(socket);
+    const connect = () => {
+      // after a drop the server replays everything since last_seen, so the
+      // count and toasts catch up without refetching notifications; the
+      // token limits the socket to its own user's group
+      const params = new URLSearchParams({ token: tokenRef.current || "" });
+      if (lastSeenRef.current) params.set("last_seen", lastSeenRef.current);
+      socket = new WebSocket(
+        `${import.meta.VITE_WEBSOCKET_URL}/ws/notifications/${reduxUser.id}/?${params}`
+      );
+      setSocket(socket);
 
-    socket.onopen = () => {
-      console.log("✅ Websocket connected");
-    };
+      socket.onopen = () => {
+        console.log("✅ Websocket connected");
+      };
 
-    socket.onmessage = (e) => {
-      const data = JSON.parse(e.data);
-      console.log("📨 Incoming Notification:", data);
-      if (data.type === "count_update") {
-        console.log("coming.....");
-        dispatch(setUnreadCount(data.unread_count));
-      } else if (
-        [
-          "comment_notification",
-          "follow_notification",
-          "like_notification",
-        ].includes(data.type)
-      ) {
-        dispatch(setUnreadCount(data.unread_count));
-        toast(data.message, {
-          icon: <MessageCircle />,
-        });
-      } else {
-        dispatch(setUnreadCount(data.unread_count));
-        toast(data?.notification);
-      }
-    };
+      socket.onmessage = (e) => {
+        const data = JSON.parse(e.data);
+        console.log("📨 Incoming Notification:", data);
+        if (data.seq) {
+          lastSeenRef.current = data.seq;
+        }
+        if (data.type === "count_update") {
+          console.log("coming.....");
+          dispatch(setUnreadCount(data.unread_count));
+        } else if (
+          [
+            "comment_notification",
+            "follow_notification",
+            "like_notification",
+          ].includes(data.type)
+        ) {
+          dispatch(setUnreadCount(data.unread_count));
+          toast(data.message, {
+            icon: <MessageCircle />,
+          });
+        } else {
+          dispatch(setUnreadCount(data.unread_count));
+          toast(data?.notification);
+        }
+      };
 
-    socket.error = (error) => {
-      console.error("websocket error : ", error);
-    };
-    socket.onclose = () => {
-      console.log("🔌 Disconnected, retrying...");
+      socket.error = (error) => {
+        console.error("websocket error : ", error);
+      };
+      socket.onclose = () => {
+        if (closed) return;
+        console.log("🔌 Disconnected, retrying...");
+        retryTimer = setTimeout(connect, 3000);
+      };
     };
+
+    connect();
     return () => {
+      closed = true;
+      clearTimeout(retryTimer);
       socket.close();
     };
   }, [reduxUser?.id]);
@@ -121,14 +145,14 @@ const Nav = () => {
   useEffect(() => {
     const fetchNotificationCount = async () => {
       try {
-        const res = await api.get(`posts/list-notifications/${reduxUser.id}`);
-        dispatch(setUnreadCount(res.data.count));
+        const res = await api.get("posts/notifications/?page_size=1");
+        dispatch(setUnreadCount(res.data.unread_count));
       } catch (error) {
         console.log("Error while fetching notification count", error);
       }
     };
     if (reduxUser?.id) fetchNotificationCount();
-  }, [reduxUser]);
+  }, [reduxUser?.id]);
 
   const handleLogout = async () => {
     try {
@@ -4,15 +4,24 @@ import { toast } from 'react-toastify';
 import { setUnreadCount } from '@/store/notificationsSlice';
 const WebSocketManager = () => {
   const reduxUser = useSelector((state) => state.user);
+  // read on every (re)connect so a refreshed token is picked up
+  const accessToken = useSelector((state) => state.auth.access_token);
+  const tokenRef = useRef(accessToken);
+  tokenRef.current = accessToken;
   const dispatch = useDispatch();
 
   const socketRef = useRef(null);
   const reconnectTimerRef = useRef(null);
+  // seq of the last frame; a reconnect asks the server to replay what came after it
+  const lastSeenRef = useRef(null);
   const [isConnected, setIsConnected] = useState(false);
   const connectWebSocket = () => {  
     if (!reduxUser?.id) return;
     
-    const socket = new WebSocket(`${import.meta.VITE_WEBSOCKET_URL}/ws/notifications/${reduxUser.id}/`);
+    // the server only lets the token's own user join the group
+    const params = new URLSearchParams({ token: tokenRef.current || '' });
+    if (lastSeenRef.current) params.set('last_seen', lastSeenRef.current);
+    const socket = new WebSocket(`${import.meta.VITE_WEBSOCKET_URL}/ws/notifications/${reduxUser.id}/?${params}`);
     console.log(socket)
     socketRef.current = socket;
 
@@ -26,21 +35,14 @@ const WebSocketManager = () => {
       const data = JSON.parse(e.data);
       console.log("📨 Incoming Notification:", data);
 
-      if (data.type === "follow_notification"){ 
-        dispatch(setUnreadCount(data.unread_count))
-        toast.success(data.message)
-
-      } else if(data.type === "like_notification"){
-        dispatch(setUnreadCount(data.unread_count))
-        toast.success(data.message)
-
-      }else {
-        dispatch(setUnreadCount(data.unread_count))
-        toast.success(data?.notification)
+      // one frame per coalescing window: the latest unread_count, plus a
+      // summary message and the merged events when anything new arrived
+      if (data.seq) {
+        lastSeenRef.current = data.seq
       }
-
-      if (notifications){
-        alert(data.notifications)
+      dispatch(setUnreadCount(data.unread_count))
+      if (data.message) {
+        toast.success(data.message)
       }
     } 
 
@@ -63,6 +65,7 @@ const WebSocketManager = () => {
   };
 
   useEffect(() => {
+    lastSeenRef.current = null;
     connectWebSocket();
 
     return () => {
@@ -43,21 +43,28 @@ const Home = () => {
   const [selectedTab, setSelectedTab] = useState(0);
 
   useEffect(() => {
-    const fetchSavedPostIds = async () => {
-      if (isAuthenticated) {
-        try {
-          const res = await api.get("posts/save-post/");
-          if (res.status === 200) {
-            const savedIds = new Set(res.data.map((post) => post.id));
-            setSavedPostIds(savedIds);
-          }
-        } catch (error) {
-          console.error("Error fetching saved post ids");
+    // one request fills in the save buttons for every post on the page
+    const fetchViewerState = async (posts) => {
+      if (!isAuthenticated || posts.length === 0) return;
+      try {
+        const ids = posts.map((post) => post.id).join(",");
+        const res = await api.get(`posts/viewer-state/?ids=${ids}`);
+        if (res.status === 200) {
+          setSavedPostIds((prev) => {
+            const next = new Set(prev);
+            Object.entries(res.data.results).forEach(([id, state]) => {
+              if (state.is_saved) next.add(Number(id));
+              else next.delete(Number(id));
+            });
+            return next;
+          });
         }
+      } catch (error) {
+        console.error("Error fetching viewer state");
       }
     };
-    fetchSavedPostIds();
-  }, [api, isAuthenticated]);
+    fetchViewerState(selectedTab === 0 ? explorePosts : followingPosts);
+  }, [api, isAuthenticated, selectedTab, explorePosts, followingPosts]);
 
   useEffect(() => {
     if (selectedTab === 0) {
@@ -65,7 +65,7 @@ const SavedPost = () => {
         setLoading(true);
         const res = await api.get("posts/save-post/");
         if (res.status === 200) {
-          setSavedPosts(res.data || []);
+          setSavedPosts(res.data.results || []);
         }
       } catch (err) {
         console.error("Error fetching saved posts:", err);
@@ -11,44 +11,26 @@ import {
 import Nav from "../components/Nav";
 import useApi from "../components/useApi";
 import { HashLoader } from "react-spinners";
-import { useSelector } from "react-redux";
 
 const ShowNotifications = () => {
   const api = useApi();
   const [activeTab, setActiveTab] = useState("All");
   const [notifications, setNotifications] = useState([]);
   const [loading, setLoading] = useState(true);
-  const reduxUser = useSelector((state) => state.auth.user);
-
-  const [counts, setCounts] = useState({
-    comment_count: 0,
-    like_count: 0,
-    follow_count: 0,
-    unread_count: 0,
-  });
+  // cursor link to the next page of the inbox, null once everything is loaded
+  const [nextUrl, setNextUrl] = useState(null);
+  const [unreadCount, setUnreadCount] = useState(0);
 
   useEffect(() => {
-    fetchAllNotifications();
+    fetchNotifications("posts/notifications/");
   }, []);
 
-  const fetchAllNotifications = async () => {
+  const fetchNotifications = async (url) => {
     try {
-      const res = await api.get(`posts/list-notifications/${reduxUser.id}`);
-      const sampleNotifications = res.data.notification_data;
-      console.log(sampleNotifications);
-      setNotifications(sampleNotifications);
-      setCounts({
-        comment_count: sampleNotifications.filter(
-          (n) => n.notification_type === "comment"
-        ).length,
-        like_count: sampleNotifications.filter(
-          (n) => n.notification_type === "like"
-        ).length,
-        follow_count: sampleNotifications.filter(
-          (n) => n.notification_type === "follow"
-        ).length,
-        unread_count: sampleNotifications.filter((n) => !n.is_read).length,
-      });
+      const res = await api.get(url);
+      setNotifications((prev) => [...prev, ...res.data.results]);
+      setNextUrl(res.data.next);
+      setUnreadCount(res.data.unread_count);
     } catch (error) {
       console.log("error fetching notifications", error);
     } finally {
@@ -56,6 +38,9 @@ const ShowNotifications = () => {
     }
   };
 
+  const countOf = (type) =>
+    notifications.filter((n) => n.notification_type === type).length;
+
   const getFilteredNotifications = () => {
     if (activeTab === "All") return notifications;
     if (activeTab === "General")
@@ -68,23 +53,28 @@ const ShowNotifications = () => {
     return notifications;
   };
 
-  const handleNotificationAction = async (notificationId, action) => {
+  // one request for any selection; the loaded pages are updated in place
+  const runBulkAction = async (action, ids = []) => {
     try {
-      const res = await api.post(
-        `posts/notification-actions/${notificationId}/`,
-        { action }
-      );
-      console.log(res.data.message);
-      fetchAllNotifications();
+      const res = await api.post("posts/notifications/bulk/", { action, ids });
+      setUnreadCount(res.data.unread_count);
+      setNotifications((prev) => {
+        if (action === "delete") return prev.filter((n) => !ids.includes(n.id));
+        return prev.map((n) =>
+          action === "mark_all_read" || ids.includes(n.id)
+            ? { ...n, is_read: action !== "mark_unread" }
+            : n
+        );
+      });
     } catch (error) {
       console.log(error, "error while notification actions");
     }
   };
 
-  const markAllAsRead = () => {
-    setNotifications((prev) => prev.map((n) => ({ ...n, is_read: true })));
-    setCounts((prev) => ({ ...prev, unread_count: 0 }));
-  };
+  const handleNotificationAction = (notificationId, action) =>
+    runBulkAction(action, [notificationId]);
+
+  const markAllAsRead = () => runBulkAction("mark_all_read");
 
   const getNotificationIcon = (type) => {
     switch (type) {
@@ -100,13 +90,15 @@ const ShowNotifications = () => {
   };
 
   const getNotificationText = (notification) => {
+    const others = (notification.actor_count || 1) - 1;
+    const prefix = others > 0 ? `and ${others} other${others > 1 ? "s" : ""} ` : "";
     switch (notification.notification_type) {
       case "like":
-        return `liked your post "${notification.post_title}"`;
+        return `${prefix}liked your post "${notification.post_title}"`;
       case "comment":
-        return `commented on your post "${notification.post_title}"`;
+        return `${prefix}commented on your post "${notification.post_title}"`;
       case "follow":
-        return "started following you";
+        return `${prefix}started following you`;
       default:
         return "sent you a notification";
     }
@@ -129,8 +121,8 @@ const ShowNotifications = () => {
 
   const tabs = [
     { name: "All", count: notifications.length },
-    { name: "General", count: counts.comment_count + counts.like_count },
-    { name: "Followers", count: counts.follow_count },
+    { name: "General", count: countOf("comment") + countOf("like") },
+    { name: "Followers", count: countOf("follow") },
   ];
 
   if (loading) {
@@ -153,7 +145,7 @@ const ShowNotifications = () => {
         <div className="flex items-center justify-center px-4 py-3">
           <h1 className="text-2xl mt-4 font-semibold mx-auto">Notifications</h1>
           <div className="flex items-center gap-3">
-            {counts.unread_count > 0 && (
+            {unreadCount > 0 && (
               <button
                 onClick={markAllAsRead}
                 className="text-sm  dark:hover:text-purple-400 dark:text-purple-500 cursor-pointer transition-colors font-medium"
@@ -281,6 +273,17 @@ const ShowNotifications = () => {
                 )}
               </div>
             ))}
+
+            {nextUrl && (
+              <div className="flex justify-center mt-6">
+                <button
+                  onClick={() => fetchNotifications(nextUrl)}
+                  className="text-sm dark:hover:text-purple-400 dark:text-purple-500 cursor-pointer transition-colors font-medium"
+                >
+                  Load older notifications
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>
@@ -21,7 +21,6 @@ import { HeartIcon as HeartSolid } from "@heroicons/react/24/solid";
 import { toast } from "react-toastify";
 import Comments from "./Comments";
 import ActionButton from "@/components/ActionButton";
-import { useSelector } from "react-redux";
 
 const CodeBlock = ({ block }) => {
   const [copied, setCopied] = useState(false);
@@ -191,25 +190,9 @@ const ShowPost = () => {
   const [likes, setLikes] = useState(0);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
-  const isAuthenticated = useSelector((state) => state.auth.is_login);
 
   const [savedPostIds, setSavedPostIds] = useState(new Set());
 
-  useEffect(() => {
-    const fetchSavedPostIds = async () => {
-      if (isAuthenticated) {
-        try {
-          const res = await api.get("posts/save-post/");
-          const savedIds = new Set(res.data.map((post) => post.id));
-          setSavedPostIds(savedIds);
-        } catch (error) {
-          console.error("Error fetching saved post ids");
-        }
-      }
-    };
-    fetchSavedPostIds();
-  }, [api, isAuthenticated]);
-
   useEffect(() => {
     const fetchPost = async () => {
       try {
@@ -218,6 +201,9 @@ const ShowPost = () => {
           setPost(response.data);
           setIsLiked(response.data.is_liked);
           setLikes(response.data.like);
+          setSavedPostIds(
+            response.data.is_saved ? new Set([Number(id)]) : new Set()
+          );
         }
       } catch (error) {
         setError(error);
@@ -24,6 +24,8 @@ const ShowUserDetail = () => {
   const api = useApi();
   const [user, setUser] = useState(null);
   const [userPosts, setUserPosts] = useState([]);
+  // cursor link to the next page of posts, null once everything is loaded
+  const [nextPostsUrl, setNextPostsUrl] = useState(null);
   const [isFollowing, setIsFollowing] = useState(false);
   const [followingLoading, setFollowingLoading] = useState(false);
   const [followCount, setFollowCount] = useState(null);
@@ -33,7 +35,9 @@ const ShowUserDetail = () => {
   const reduxUser = useSelector((state) => state.auth.user);
 
   useEffect(() => {
+    setUserPosts([]);
     fetchUserDetails();
+    fetchUserPosts(`posts/user-posts/${id}/`);
     checkFollowStatus();
     getFollowCount();
   }, [id]);
@@ -45,9 +49,7 @@ const ShowUserDetail = () => {
       if (userResponse.status === 200) {
         const fetchedUser = userResponse.data[0];
         setUser(fetchedUser);
-        setUserPosts(fetchedUser.posts);
         console.log(`User details: ${JSON.stringify(fetchedUser)}`);
-        console.log(`User Posts: ${JSON.stringify(fetchedUser.posts)}`);
       }
     } catch (error) {
       console.error(`Error while fetching user details: ${error}`);
@@ -57,6 +59,16 @@ const ShowUserDetail = () => {
     }
   };
 
+  const fetchUserPosts = async (url) => {
+    try {
+      const response = await api.get(url);
+      setUserPosts((prev) => [...prev, ...response.data.results]);
+      setNextPostsUrl(response.data.next);
+    } catch (error) {
+      console.error(`Error while fetching user posts: ${error}`);
+    }
+  };
+
   const checkFollowStatus = async () => {
     try {
       const res = await api.get(`posts/follow/status/${id}/`);
@@ -229,7 +241,7 @@ const ShowUserDetail = () => {
               <div className="flex items-center space-x-8 mb-6">
                 <div className="text-center">
                   <div className="text-2xl font-bold text-gray-900 dark:text-white">
-                    {userPosts.length}
+                    {user.post_count}
                   </div>
                   <div className="text-sm text-gray-500 dark:text-gray-400">
                     Posts
@@ -415,6 +427,17 @@ const ShowUserDetail = () => {
                     </div>
                   </motion.div>
                 ))}
+
+                {nextPostsUrl && (
+                  <div className="flex justify-center mt-8">
+                    <button
+                      onClick={() => fetchUserPosts(nextPostsUrl)}
+                      className="px-8 py-3 bg-white/70 dark:bg-gray-800/70 hover:bg-white/90 dark:hover:bg-gray-800/90 text-gray-800 dark:text-gray-200 font-semibold rounded-xl shadow-lg backdrop-blur-sm transition-all duration-200"
+                    >
+                      Show More Posts
+                    </button>
+                  </div>
+                )}
               </div>
             )}
           </motion.div>
@@ -42,12 +42,14 @@ const UserProfile = () => {
   const [previewImage, setPreviewImage] = useState(null);
   const fileInputRef = useRef(null);
   const [searchText, setSearchText] = useState("");
+  const [posts, setPosts] = useState([]);
   const [displayedPosts, setDisplayedPosts] = useState([]);
   const [filteredPosts, setFilteredPosts] = useState([]);
-  const [postsToShow, setPostsToShow] = useState(10);
   const [followCount, setFollowCount] = useState(null);
 
-  const [hasMore, setHasMore] = useState(false);
+  // cursor link to the next page of posts, null once everything is loaded
+  const [nextPostsUrl, setNextPostsUrl] = useState(null);
+  const hasMore = nextPostsUrl !== null;
   const reduxUser = useSelector((state) => state.auth.user);
 
 
@@ -56,6 +58,7 @@ const UserProfile = () => {
 
   useEffect(() => {
     fetchUserProfile();
+    fetchPosts(`posts/user-posts/${reduxUser.id}/?page_size=10`);
     getFollowCount();
   }, []);
 
@@ -71,10 +74,6 @@ const UserProfile = () => {
           bio: response.data.bio || "",
           profile_image: null,
         });
-
-        setFilteredPosts(response.data.posts || []);
-        setDisplayedPosts(response.data.posts?.slice(0, postsToShow) || []);
-        setHasMore((response.data.posts?.length || 0) > postsToShow);
       }
     } catch (error) {
       toast.error("Failed to load user profile.", {
@@ -87,6 +86,19 @@ const UserProfile = () => {
     }
   }
 
+  async function fetchPosts(url) {
+    try {
+      const response = await api.get(url);
+      setPosts((prev) => [...prev, ...response.data.results]);
+      setNextPostsUrl(response.data.next);
+    } catch (error) {
+      toast.error("Failed to load posts.", {
+        position: "top-right",
+        autoClose: 3000,
+      });
+    }
+  }
+
   const getFollowCount = async () => {
     try {
       const response = await api.get(`posts/get-follow-count/${reduxUser.id}`);
@@ -97,33 +109,23 @@ const UserProfile = () => {
   };
 
   useEffect(() => {
-    if (user?.posts) {
-      const filteredPosts = user.posts.filter(
-        (post) =>
-          (post?.title || "")
-            .toLowerCase()
-            .includes(searchText.toLowerCase()) ||
-          (post?.description || "")
-            .toLowerCase()
-            .includes(searchText.toLowerCase())
-      );
-
-      setFilteredPosts(filteredPosts);
-      setDisplayedPosts(filteredPosts.slice(0, postsToShow));
-      setHasMore(filteredPosts.length > postsToShow);
-    }
-  }, [searchText, user?.posts, postsToShow]);
+    // the search box filters the pages loaded so far
+    const filteredPosts = posts.filter(
+      (post) =>
+        (post?.title || "").toLowerCase().includes(searchText.toLowerCase()) ||
+        (post?.excerpt || "").toLowerCase().includes(searchText.toLowerCase())
+    );
+
+    setFilteredPosts(filteredPosts);
+    setDisplayedPosts(filteredPosts);
+  }, [searchText, posts]);
 
   const handleSearchChange = (e) => {
     setSearchText(e.target.value);
-    setPostsToShow(10);
   };
 
   const handleShowMore = () => {
-    const newPostsToShow = postsToShow + 10;
-    setPostsToShow(newPostsToShow);
-    setDisplayedPosts(filteredPosts.slice(0, newPostsToShow));
-    setHasMore(filteredPosts.length > newPostsToShow);
+    if (nextPostsUrl) fetchPosts(nextPostsUrl);
   };
 
   const handleDeletePost = async (postId) => {
@@ -131,23 +133,11 @@ const UserProfile = () => {
       try {
         const response = await api.delete(`/posts/delete-post/${postId}/`);
         if (response.status === 204 || response.status === 200) {
-          const updatedPosts = user.posts.filter((p) => p.id !== postId);
+          setPosts((prev) => prev.filter((p) => p.id !== postId));
           setUser((prevUser) => ({
             ...prevUser,
-            posts: updatedPosts,
+            post_count: Math.max((prevUser.post_count || 1) - 1, 0),
           }));
-          setFilteredPosts(
-            updatedPosts.filter(
-              (post) =>
-                (post.title || "")
-                  .toLowerCase()
-                  .includes(searchText.toLowerCase()) ||
-                (post.content || "")
-                  .toLowerCase()
-                  .includes(searchText.toLowerCase())
-            )
-          );
-          setDisplayedPosts((prev) => prev.filter((p) => p.id !== postId));
 
           toast.success("Post deleted successfully.", {
             position: "top-right",
@@ -419,7 +409,7 @@ const UserProfile = () => {
                 <div className="flex items-center space-x-8 mb-6">
                   <div className="text-center">
                     <div className="text-2xl font-bold text-gray-900 dark:text-white">
-                      {user?.posts?.length || 0}
+                      {user?.post_count || 0}
                     </div>
                     <div className="text-sm text-gray-500 dark:text-gray-400">
                       Posts
@@ -31,6 +31,9 @@ class CustomUser(AbstractUser):
         upload_to="profile_images/", null=True, blank=True
     )
     bio = models.TextField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # last post written or deleted, set by posts.signals for the profile ETag
+    last_activity_at = models.DateTimeField(null=True, blank=True)
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
 
@@ -18,14 +18,14 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "codblog.settings")
 
 django.setup()
 
+from posts.middleware import JWTAuthMiddleware
 from posts.routing import websocket_urlpatterns
 
-
 application = ProtocolTypeRouter(
     {
         "http": get_asgi_application(),
         "websocket": SessionMiddlewareStack(
-            AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+            AuthMiddlewareStack(JWTAuthMiddleware(URLRouter(websocket_urlpatterns)))
         ),
     }
 )
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from datetime import timedelta
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv  # type: ignore
 
 load_dotenv()
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "posts",
     "accounts",
     "channels",
@@ -121,6 +123,28 @@ CHANNEL_LAYERS = {
     },
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": f"redis://{os.getenv('REDIS_HOST')}:{os.getenv('REDIS_PORT')}/1",
+    }
+}
+
+if "test" in sys.argv:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+POST_SEARCH_BACKEND = "posts.search.PostgresSearchBackend"
+
+if "test" in sys.argv:
+    POST_SEARCH_BACKEND = "posts.search.MemorySearchBackend"
+
+POSTS_RESPONSE_CACHE_TIMEOUT = 60
+POSTS_RESPONSE_CACHE_STALE_GRACE = 300
+
 AUTHENTICATION_BACKENDS = [
     "django.contrib.auth.backends.ModelBackend",
     "allauth.account.auth_backends.AuthenticationBackend",
@@ -145,6 +169,83 @@ print(os.getenv("DATABASE_PASSWORD"))
 CELERY_BROKER_URL = "redis://127.0.0.1:6379/0"
 CELERY_RESULT_BACKEND = "redis://127.0.0.1:6379/0"
 
+if "test" in sys.argv:
+    # tasks run inline instead of needing a broker
+    CELERY_TASK_ALWAYS_EAGER = True
+
+CELERY_BEAT_SCHEDULE = {
+    # fan-outs and backfills whose task could not be queued
+    "repair-timelines": {
+        "task": "posts.tasks.repair_timelines",
+        "schedule": timedelta(minutes=5),
+    },
+    "recompute-hot-scores": {
+        "task": "posts.tasks.recompute_hot_scores",
+        "schedule": timedelta(minutes=10),
+    },
+    # likes are counted without post_save, so typeahead weights catch up here
+    "refresh-suggest-weights": {
+        "task": "posts.tasks.refresh_suggest_weights",
+        "schedule": timedelta(minutes=10),
+    },
+    "flush-like-buffer": {
+        "task": "posts.tasks.flush_like_buffer",
+        "schedule": timedelta(seconds=5),
+    },
+    # picks up events whose scheduled drain was lost
+    "drain-notifications": {
+        "task": "posts.tasks.drain_notifications",
+        "schedule": timedelta(seconds=30),
+    },
+    "reconcile-unread-counts": {
+        "task": "posts.tasks.reconcile_unread_counts",
+        "schedule": timedelta(hours=1),
+    },
+    # also creates upcoming monthly partitions once the table is partitioned
+    "prune-notifications": {
+        "task": "posts.tasks.prune_notifications",
+        "schedule": timedelta(hours=1),
+    },
+}
+
+# Buffer like/unlike counts and flush them to Post.like in batches; the
+# liked_by rows are still written immediately.
+LIKE_WRITE_BEHIND = False
+LIKE_BUFFER_REDIS_URL = f"redis://{os.getenv('REDIS_HOST')}:{os.getenv('REDIS_PORT')}/2"
+
+if "test" in sys.argv:
+    LIKE_BUFFER_REDIS_URL = None
+
+# like/comment/follow events wait here until drain_notifications writes them
+NOTIFICATION_QUEUE_REDIS_URL = (
+    f"redis://{os.getenv('REDIS_HOST')}:{os.getenv('REDIS_PORT')}/2"
+)
+NOTIFICATION_BATCH_SIZE = 500
+NOTIFICATION_DRAIN_DELAY = 1  # seconds a burst is collected before draining
+NOTIFICATION_COALESCE_WINDOW = 0.5  # seconds of pushes merged into one socket frame
+# every push is also kept in a per-user stream so a reconnecting socket can
+# replay what it missed; the stream keeps about NOTIFICATION_LOG_LENGTH events
+NOTIFICATION_LOG_REDIS_URL = (
+    f"redis://{os.getenv('REDIS_HOST')}:{os.getenv('REDIS_PORT')}/2"
+)
+NOTIFICATION_LOG_LENGTH = 200
+
+if "test" in sys.argv:
+    NOTIFICATION_QUEUE_REDIS_URL = None
+    NOTIFICATION_LOG_REDIS_URL = None
+
+# read notifications go after NOTIFICATION_READ_TTL, everything after
+# NOTIFICATION_UNREAD_TTL; each prune run touches at most
+# BATCH_SIZE * MAX_BATCHES rows
+NOTIFICATION_READ_TTL = timedelta(days=30)
+NOTIFICATION_UNREAD_TTL = timedelta(days=90)
+NOTIFICATION_RETENTION_BATCH_SIZE = 1000
+NOTIFICATION_RETENTION_MAX_BATCHES = 100
+NOTIFICATION_ARCHIVE = False  # copy pruned rows to NotificationArchive
+
+TRENDING_GRAVITY = 1.8
+TRENDING_WINDOW_DAYS = 7
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
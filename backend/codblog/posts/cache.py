@@ -0,0 +1,101 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+RESPONSE_TIMEOUT = getattr(settings, "POSTS_RESPONSE_CACHE_TIMEOUT", 60)
+# How long a superseded entry may still be served while one worker rebuilds it.
+STALE_GRACE = getattr(settings, "POSTS_RESPONSE_CACHE_STALE_GRACE", 300)
+LOCK_TIMEOUT = 10
+COLD_WAIT_STEPS = 20
+COLD_WAIT_INTERVAL = 0.05
+
+GLOBAL_VERSION_KEY = "posts:version"
+
+
+def post_version_key(post_id):
+    return f"posts:version:{post_id}"
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # a clock-based seed never collides with versions stored before eviction
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def bump_post(post_id):
+    bump_version(post_version_key(post_id))
+    bump_version(GLOBAL_VERSION_KEY)
+
+
+def viewer_version_key(user_id):
+    return f"posts:viewer-version:{user_id}"
+
+
+def bump_viewer(user_id):
+    # saves and follows change what a viewer sees without touching the post
+    bump_version(viewer_version_key(user_id))
+
+
+def viewer_version(user_id):
+    return get_version(viewer_version_key(user_id))
+
+
+def list_version():
+    return get_version(GLOBAL_VERSION_KEY)
+
+
+def post_version(post_id):
+    return get_version(post_version_key(post_id))
+
+
+def request_key(prefix, request):
+    digest = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f"posts:response:{prefix}:{digest}"
+
+
+def cached_response(key, version, build):
+    # Entries are stored under an unversioned key together with the version
+    # they were built for, so a version bump leaves the old body around as a
+    # stale fallback and only the worker holding the lock hits the database.
+    entry = cache.get(key)
+    if entry and entry["version"] == version and entry["expires"] > time.time():
+        return entry["data"]
+
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            data = build()
+            cache.set(
+                key,
+                {
+                    "version": version,
+                    "expires": time.time() + RESPONSE_TIMEOUT,
+                    "data": data,
+                },
+                RESPONSE_TIMEOUT + STALE_GRACE,
+            )
+            return data
+        finally:
+            cache.delete(lock_key)
+
+    if entry is not None:
+        return entry["data"]
+
+    for _ in range(COLD_WAIT_STEPS):
+        time.sleep(COLD_WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry and entry["version"] == version:
+            return entry["data"]
+    return build()
@@ -0,0 +1,99 @@
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
+
+from . import cache as response_cache
+from . import like_buffer
+from .models import Post
+
+User = get_user_model()
+
+
+def make_etag(*parts):
+    return hashlib.md5(":".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def conditional(stamp_func):
+    # stamp_func(request, **kwargs) -> (etag, last_modified) or None; it runs
+    # once per request and before the view, so a 304 never serializes a body
+    def stamp(request, *args, **kwargs):
+        if not hasattr(request, "_conditional_stamp"):
+            request._conditional_stamp = stamp_func(request, *args, **kwargs)
+        return request._conditional_stamp
+
+    def etag_func(request, *args, **kwargs):
+        result = stamp(request, *args, **kwargs)
+        return result[0] if result else None
+
+    def last_modified_func(request, *args, **kwargs):
+        result = stamp(request, *args, **kwargs)
+        return result[1] if result else None
+
+    def decorator(view_method):
+        view_method = condition(etag_func, last_modified_func)(view_method)
+        return vary_on_headers("Authorization")(view_method)
+
+    return method_decorator(decorator)
+
+
+def viewer_parts(request):
+    # viewer-specific fields (is_liked, is_saved, ...) make the body per-user;
+    # Last-Modified is only offered when the body is the same for everyone
+    user = request.user
+    if user.is_authenticated:
+        return (user.id, response_cache.viewer_version(user.id)), False
+    return (), True
+
+
+def post_detail_stamp(request, pk):
+    post = (
+        Post.objects.filter(pk=pk)
+        .only("updated_at", "last_activity_at", "last_like_flush")
+        .first()
+    )
+    if post is None:
+        return None
+    modified = max(post.updated_at, post.last_activity_at)
+    # likes still in the write-behind buffer are in the body but have not
+    # touched the row yet, so they go into the ETag and rule out a date
+    buffered = like_buffer.pending([post]).get(post.pk, 0)
+    parts, public = viewer_parts(request)
+    etag = make_etag(
+        "post",
+        pk,
+        request.accepted_renderer.format,
+        modified.timestamp(),
+        buffered,
+        *parts,
+    )
+    return etag, modified if public and not buffered else None
+
+
+def user_profile_stamp(request, user_id):
+    # last_activity_at moves when the user writes or deletes a post, which is
+    # all of the body that updated_at does not cover
+    row = (
+        User.objects.filter(pk=user_id)
+        .values_list("updated_at", "last_activity_at")
+        .first()
+    )
+    if row is None:
+        return None
+    modified = max(stamp for stamp in row if stamp)
+    etag = make_etag("profile", user_id, modified.timestamp())
+    return etag, modified
+
+
+def comment_list_stamp(request, post_id):
+    last_activity_at = (
+        Post.objects.filter(pk=post_id)
+        .values_list("last_activity_at", flat=True)
+        .first()
+    )
+    if last_activity_at is None:
+        return None
+    etag = make_etag("comments", post_id, last_activity_at.timestamp())
+    return etag, last_activity_at
@@ -1,25 +1,66 @@
+import asyncio
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 import json
 from channels.db import database_sync_to_async
-from django.contrib.auth import get_user_model
+from django.conf import settings
+from . import event_log, unread
 
-User = get_user_model()
+COALESCE_WINDOW = getattr(settings, "NOTIFICATION_COALESCE_WINDOW", 0.5)  # seconds
+MAX_FRAME_EVENTS = 20
 
 
 class NotificationConsumer(AsyncWebsocketConsumer):
+    # Group messages are buffered for coalesce_window seconds after the first
+    # one and then sent as a single frame with the latest unread_count and
+    # the last few events, so a burst costs one frame per window. Frames
+    # carry the seq of the newest event in posts.event_log; a client that
+    # reconnects with ?last_seen=<seq> first gets what it missed.
+    coalesce_window = COALESCE_WINDOW
+
     async def connect(self):
+        self.pending = []
+        self.unread_count = None
+        self.flush_task = None
+        self.seq = None
         self.user_id = self.scope["url_route"]["kwargs"]["user_id"]
         self.user_group_name = f"user_{self.user_id}"
         if await self.is_valid_user():
             await self.channel_layer.group_add(self.user_group_name, self.channel_name)
             print(f"connection wass success full on group : {self.user_group_name}")
             await self.accept()
+            last_seen = parse_qs(self.scope.get("query_string", b"").decode()).get(
+                "last_seen"
+            )
+            if last_seen:
+                await self.replay(last_seen[0])
         else:
             await self.close()
 
+    async def replay(self, last_seen):
+        # we joined the group before reading the log, so nothing falls in
+        # between; live messages the replay already covered are dropped by seq
+        missed = await sync_to_async(event_log.since)(self.user_id, last_seen)
+        if missed is None:
+            # the log no longer reaches back to last_seen: skip the partial
+            # history and resume from the newest seq with the current count
+            self.seq = await sync_to_async(event_log.latest)(self.user_id)
+        else:
+            self.seq = last_seen
+        for seq, payload in missed or []:
+            await self.dispatch({**payload, "seq": seq})
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        self.unread_count = await database_sync_to_async(unread.get)(self.user_id)
+        await self.flush()
+
     async def disconnect(self, close_code):
 
         print(f"websocket connection closed with code : {close_code}")
+        if self.flush_task is not None:
+            self.flush_task.cancel()
         try:
 
             await self.channel_layer.group_discard(
@@ -29,41 +70,65 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             print(f"Error during disconnect: {str(e)}")
 
     async def send_notification(self, event):
-        print(f"Websocker Consumer received: {event}")
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "type": event.get("event_type"),
-                    "message": event.get("message"),
-                    "unread_count": event.get("unread_count"),
-                }
-            )
+        await self.queue_event(
+            {"type": event.get("event_type"), "message": event.get("message")},
+            event.get("unread_count"),
+            event.get("seq"),
         )
 
     async def send_unfollow_notification(self, event):
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "type": event.get("event_type"),
-                    "notification": event["notification"],
-                    "unread_count": event.get("unread_count", 0),
-                }
-            )
+        await self.queue_event(
+            {"type": event.get("event_type"), "message": event["notification"]},
+            event.get("unread_count", 0),
+            event.get("seq"),
         )
 
     async def send_count_update(self, event):
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "type": event.get("event_type", "count_update"),
-                    "unread_count": event.get("unread_count", 0),
-                }
+        await self.queue_event(None, event.get("unread_count", 0), event.get("seq"))
+
+    async def queue_event(self, item, unread_count, seq=None):
+        if seq is not None:
+            if not event_log.is_after(seq, self.seq):
+                return  # already replayed
+            self.seq = seq
+            if item is not None:
+                item["seq"] = seq
+        if item is not None:
+            self.pending.append(item)
+        if unread_count is not None:
+            self.unread_count = unread_count
+        if self.coalesce_window <= 0:
+            await self.flush()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.coalesce_window)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        events, self.pending = self.pending, []
+        frame = {
+            "type": "count_update",
+            "unread_count": self.unread_count,
+            "seq": self.seq,
+        }
+        if events:
+            frame["type"] = events[-1]["type"]
+            frame["message"] = (
+                events[-1]["message"]
+                if len(events) == 1
+                else f"you have {len(events)} new notifications"
             )
-        )
+            frame["events"] = events[-MAX_FRAME_EVENTS:]
+        await self.send(text_data=json.dumps(frame))
 
-    @database_sync_to_async
-    def is_valid_user(self):
-        try:
-            return User.objects.filter(id=self.user_id).exists()
-        except:
-            return False
+    async def is_valid_user(self):
+        # only the user the group belongs to may join it (see JWTAuthMiddleware)
+        user = self.scope.get("user")
+        return (
+            user is not None
+            and user.is_authenticated
+            and str(user.pk) == str(self.user_id)
+        )
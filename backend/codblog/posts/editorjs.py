@@ -0,0 +1,392 @@
+import hashlib
+import html
+import json
+import math
+import re
+from html.parser import HTMLParser
+
+from django.utils.html import strip_tags
+
+WORDS_PER_MINUTE = 200
+EXCERPT_LENGTH = 280
+TITLE_LENGTH = 200
+
+
+def blocks_of(content):
+    if not isinstance(content, dict):
+        return []
+    blocks = content.get("blocks") or []
+    return [block for block in blocks if isinstance(block, dict)]
+
+
+def plain_text(value):
+    if not isinstance(value, str):
+        return ""
+    return " ".join(html.unescape(strip_tags(value)).split())
+
+
+def list_item_texts(items):
+    for item in items or []:
+        if isinstance(item, dict):
+            # nested-list tool stores {"content": ..., "items": [...]}
+            yield plain_text(item.get("content") or item.get("text"))
+            yield from list_item_texts(item.get("items"))
+        else:
+            yield plain_text(item)
+
+
+def block_text(block):
+    data = block.get("data") or {}
+    block_type = block.get("type")
+
+    if block_type in ("paragraph", "header"):
+        return plain_text(data.get("text"))
+    if block_type in ("list", "checklist"):
+        return " ".join(text for text in list_item_texts(data.get("items")) if text)
+    if block_type == "quote":
+        return " ".join(
+            text
+            for text in (plain_text(data.get("text")), plain_text(data.get("caption")))
+            if text
+        )
+    if block_type in ("image", "embed"):
+        return plain_text(data.get("caption"))
+    return ""
+
+
+def extract_title(content):
+    for block in blocks_of(content):
+        if block.get("type") == "header":
+            title = plain_text((block.get("data") or {}).get("text"))
+            if title:
+                return title[:TITLE_LENGTH]
+    return None
+
+
+def extract_cover_image(content):
+    for block in blocks_of(content):
+        if block.get("type") == "image":
+            data = block.get("data") or {}
+            url = (data.get("file") or {}).get("url") or data.get("url")
+            if url:
+                return url
+    return ""
+
+
+def extract_excerpt(content):
+    for block in blocks_of(content):
+        if block.get("type") == "paragraph":
+            text = block_text(block)
+            if text:
+                break
+    else:
+        return ""
+
+    if len(text) <= EXCERPT_LENGTH:
+        return text
+    cut = text[:EXCERPT_LENGTH].rsplit(" ", 1)[0]
+    return f"{cut}…"
+
+
+def document_text(content):
+    return " ".join(
+        text for text in (block_text(block) for block in blocks_of(content)) if text
+    )
+
+
+def summarize(content):
+    word_count = sum(len(block_text(block).split()) for block in blocks_of(content))
+    return {
+        "excerpt": extract_excerpt(content),
+        "word_count": word_count,
+        "reading_time": max(1, math.ceil(word_count / WORDS_PER_MINUTE)),
+        "cover_image": extract_cover_image(content),
+    }
+
+
+INLINE_TAGS = {
+    "a": {"href"},
+    "b": set(),
+    "strong": set(),
+    "i": set(),
+    "em": set(),
+    "u": set(),
+    "s": set(),
+    "mark": {"class"},
+    "code": {"class"},
+    "br": set(),
+}
+VOID_TAGS = {"br"}
+DROP_CONTENT_TAGS = {"script", "style", "iframe", "object", "template"}
+SAFE_URL_SCHEMES = ("http://", "https://", "mailto:", "/")
+URL_IGNORED_CHARS = re.compile(r"[\t\n\r]")
+EMBED_HOSTS = (
+    "https://www.youtube.com/",
+    "https://player.vimeo.com/",
+    "https://codepen.io/",
+    "https://gist.github.com/",
+    "https://twitter.com/",
+    "https://platform.twitter.com/",
+    "https://www.instagram.com/",
+)
+
+
+def safe_url(url):
+    if not isinstance(url, str):
+        return None
+    # browsers drop tabs and newlines inside URLs and read a backslash as "/",
+    # so /\evil.com or /<tab>/evil.com would leave the site like //evil.com
+    url = URL_IGNORED_CHARS.sub("", url.strip()).replace("\\", "/")
+    if url.lower().startswith(SAFE_URL_SCHEMES) and not url.startswith("//"):
+        return url
+    return None
+
+
+class InlineSanitizer(HTMLParser):
+    # Editor.js inline markup is a small tag set; everything else is escaped
+    # away, keeping the text of unknown tags and dropping script-like bodies.
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.open_tags = []
+        self.dropping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping or tag not in INLINE_TAGS:
+            return
+
+        rendered = []
+        for name, value in attrs:
+            if name not in INLINE_TAGS[tag] or value is None:
+                continue
+            if name == "href":
+                value = safe_url(value)
+                if value is None:
+                    continue
+            rendered.append(f' {name}="{html.escape(value)}"')
+        if tag == "a":
+            rendered.append(' rel="nofollow noopener"')
+
+        self.parts.append(f"<{tag}{''.join(rendered)}>")
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping = max(0, self.dropping - 1)
+            return
+        if self.dropping or tag not in self.open_tags:
+            return
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.parts.append(f"</{open_tag}>")
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.parts.append(html.escape(data, quote=False))
+
+    def render(self, value):
+        self.feed(value)
+        self.close()
+        self.parts.extend(f"</{tag}>" for tag in reversed(self.open_tags))
+        return "".join(self.parts)
+
+
+def sanitize_inline(value):
+    if not isinstance(value, str) or not value:
+        return ""
+    return InlineSanitizer().render(value)
+
+
+def render_list_items(items, tag):
+    rendered = []
+    for item in items or []:
+        if isinstance(item, dict):
+            text = sanitize_inline(item.get("content") or item.get("text"))
+            nested = item.get("items")
+            if nested:
+                text += render_list_items(nested, tag)
+        else:
+            text = sanitize_inline(item)
+        rendered.append(f"<li>{text}</li>")
+    return f"<{tag}>{''.join(rendered)}</{tag}>"
+
+
+def render_caption(caption):
+    caption = sanitize_inline(caption)
+    return f"<figcaption>{caption}</figcaption>" if caption else ""
+
+
+def render_header(data):
+    try:
+        level = min(6, max(1, int(data.get("level", 2))))
+    except (TypeError, ValueError):
+        level = 2
+    return f"<h{level}>{sanitize_inline(data.get('text'))}</h{level}>"
+
+
+def render_paragraph(data):
+    return f"<p>{sanitize_inline(data.get('text'))}</p>"
+
+
+def render_list(data):
+    tag = "ol" if data.get("style") == "ordered" else "ul"
+    return render_list_items(data.get("items"), tag)
+
+
+def render_code(data):
+    code = data.get("code") if isinstance(data.get("code"), str) else ""
+    return f"<pre><code>{html.escape(code)}</code></pre>"
+
+
+def render_image(data):
+    url = safe_url((data.get("file") or {}).get("url") or data.get("url"))
+    if url is None:
+        return ""
+    alt = html.escape(plain_text(data.get("caption")))
+    classes = " ".join(
+        name
+        for name, flag in (
+            ("with-border", data.get("withBorder")),
+            ("stretched", data.get("stretched")),
+            ("with-background", data.get("withBackground")),
+        )
+        if flag
+    )
+    class_attr = f' class="{classes}"' if classes else ""
+    return (
+        f'<figure{class_attr}><img src="{html.escape(url)}" alt="{alt}" loading="lazy">'
+        f"{render_caption(data.get('caption'))}</figure>"
+    )
+
+
+def render_quote(data):
+    caption = sanitize_inline(data.get("caption"))
+    cite = f"<cite>{caption}</cite>" if caption else ""
+    return f"<blockquote><p>{sanitize_inline(data.get('text'))}</p>{cite}</blockquote>"
+
+
+def render_embed(data):
+    embed = safe_url(data.get("embed"))
+    if embed is None or not embed.startswith(EMBED_HOSTS):
+        source = safe_url(data.get("source"))
+        if source is None:
+            return ""
+        source = html.escape(source)
+        return f'<p><a href="{source}" rel="nofollow noopener">{source}</a></p>'
+
+    try:
+        width, height = int(data.get("width") or 580), int(data.get("height") or 320)
+    except (TypeError, ValueError):
+        width, height = 580, 320
+    return (
+        f'<figure class="embed"><iframe src="{html.escape(embed)}" width="{width}" '
+        f'height="{height}" frameborder="0" allowfullscreen loading="lazy" '
+        f'sandbox="allow-scripts allow-same-origin allow-popups"></iframe>'
+        f"{render_caption(data.get('caption'))}</figure>"
+    )
+
+
+def render_delimiter(data):
+    return "<hr>"
+
+
+BLOCK_RENDERERS = {
+    "header": render_header,
+    "paragraph": render_paragraph,
+    "list": render_list,
+    "checklist": render_list,
+    "code": render_code,
+    "image": render_image,
+    "quote": render_quote,
+    "embed": render_embed,
+    "delimiter": render_delimiter,
+}
+
+
+def render_html(content):
+    parts = []
+    for block in blocks_of(content):
+        renderer = BLOCK_RENDERERS.get(block.get("type"))
+        data = block.get("data")
+        if renderer is not None and isinstance(data, dict):
+            parts.append(renderer(data))
+    return "\n".join(part for part in parts if part)
+
+
+def content_hash(content):
+    canonical = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class BlockOperationError(ValueError):
+    pass
+
+
+def block_position(blocks, block_id):
+    for index, block in enumerate(blocks):
+        if block.get("id") == block_id:
+            return index
+    raise BlockOperationError(f"Block {block_id!r} not found")
+
+
+def insertion_index(blocks, after):
+    # after=None places the block first
+    if after is None:
+        return 0
+    return block_position(blocks, checked_id(after)) + 1
+
+
+def checked_id(block_id):
+    # blocks are addressed by their Editor.js id, so every op needs one
+    if not isinstance(block_id, str) or not block_id:
+        raise BlockOperationError("Operation needs a block id")
+    return block_id
+
+
+def checked_block(op):
+    block = op.get("block")
+    if not isinstance(block, dict) or not isinstance(block.get("type"), str):
+        raise BlockOperationError("Operation needs a block with a type")
+    if not isinstance(block.get("data", {}), dict):
+        raise BlockOperationError("Block data must be an object")
+    return block
+
+
+def apply_block_ops(content, ops):
+    if not isinstance(ops, list):
+        raise BlockOperationError("ops must be a list")
+
+    content = dict(content) if isinstance(content, dict) else {}
+    blocks = list(blocks_of(content))
+
+    for op in ops:
+        if not isinstance(op, dict):
+            raise BlockOperationError("Each operation must be an object")
+        kind = op.get("op")
+
+        if kind == "insert":
+            block = checked_block(op)
+            block_id = checked_id(block.get("id"))
+            if any(existing.get("id") == block_id for existing in blocks):
+                raise BlockOperationError(f"Block {block_id!r} already exists")
+            blocks.insert(insertion_index(blocks, op.get("after")), block)
+        elif kind == "replace":
+            block_id = checked_id(op.get("id"))
+            index = block_position(blocks, block_id)
+            blocks[index] = dict(checked_block(op), id=block_id)
+        elif kind == "delete":
+            del blocks[block_position(blocks, checked_id(op.get("id")))]
+        elif kind == "move":
+            block = blocks.pop(block_position(blocks, checked_id(op.get("id"))))
+            blocks.insert(insertion_index(blocks, op.get("after")), block)
+        else:
+            raise BlockOperationError(f"Unknown operation {kind!r}")
+
+    content["blocks"] = blocks
+    return content
@@ -0,0 +1,132 @@
+import json
+import threading
+from collections import defaultdict, deque
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+KEY = "posts:notification-log:{}"
+MAX_LENGTH = getattr(settings, "NOTIFICATION_LOG_LENGTH", 200)
+TTL = 7 * 24 * 60 * 60  # idle logs expire after a week
+
+
+def parse_id(event_id):
+    # stream ids look like "<ms>-<n>" and compare as integer pairs
+    try:
+        ms, sequence = str(event_id).split("-")
+        return int(ms), int(sequence)
+    except ValueError:
+        return None
+
+
+def is_after(event_id, other):
+    return other is None or parse_id(event_id) > parse_id(other)
+
+
+class RedisEventLog:
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+
+    def append(self, user_id, payload):
+        key = KEY.format(user_id)
+        pipe = self.client.pipeline()
+        pipe.xadd(
+            key, {"payload": json.dumps(payload)}, maxlen=MAX_LENGTH, approximate=True
+        )
+        pipe.expire(key, TTL)
+        event_id, _ = pipe.execute()
+        return event_id
+
+    def latest(self, user_id):
+        entries = self.client.xrevrange(KEY.format(user_id), count=1)
+        return entries[0][0] if entries else None
+
+    def since(self, user_id, last_seen):
+        key = KEY.format(user_id)
+        pipe = self.client.pipeline()
+        pipe.xrange(key, min=f"({last_seen}", max="+")
+        pipe.xrange(key, count=1)
+        pipe.xlen(key)
+        entries, oldest, length = pipe.execute()
+        # a full log whose oldest entry is past last_seen may have dropped
+        # events in between
+        trimmed = (
+            length >= MAX_LENGTH
+            and oldest
+            and parse_id(oldest[0][0]) > parse_id(last_seen)
+        )
+        if trimmed:
+            return None
+        return [
+            (event_id, json.loads(fields["payload"])) for event_id, fields in entries
+        ]
+
+
+class LocalEventLog:
+    # single-process stand-in for development and tests
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.logs = defaultdict(lambda: deque(maxlen=MAX_LENGTH))
+        self.counters = defaultdict(int)
+
+    def append(self, user_id, payload):
+        key = KEY.format(user_id)
+        with self.lock:
+            self.counters[key] += 1
+            event_id = f"0-{self.counters[key]}"
+            self.logs[key].append((event_id, payload))
+            return event_id
+
+    def latest(self, user_id):
+        with self.lock:
+            log = self.logs.get(KEY.format(user_id))
+            return log[-1][0] if log else None
+
+    def since(self, user_id, last_seen):
+        last = parse_id(last_seen)
+        with self.lock:
+            log = list(self.logs.get(KEY.format(user_id), ()))
+        if len(log) == MAX_LENGTH and parse_id(log[0][0]) > last:
+            return None
+        return [
+            (event_id, payload)
+            for event_id, payload in log
+            if parse_id(event_id) > last
+        ]
+
+
+_log = None
+
+
+def get_log():
+    global _log
+    if _log is None:
+        url = getattr(settings, "NOTIFICATION_LOG_REDIS_URL", None)
+        _log = RedisEventLog(url) if url else LocalEventLog()
+    return _log
+
+
+def append(user_id, payload):
+    return get_log().append(user_id, payload)
+
+
+def latest(user_id):
+    return get_log().latest(user_id)
+
+
+def publish(user_id, payload):
+    # log the socket message first so its seq goes out with it
+    payload = {**payload, "seq": append(user_id, payload)}
+    async_to_sync(get_channel_layer().group_send)(f"user_{user_id}", payload)
+    return payload["seq"]
+
+
+def since(user_id, last_seen):
+    # events after last_seen, oldest first, or None when the log no longer
+    # reaches back that far and the caller has to resync
+    if parse_id(last_seen) is None:
+        return None
+    return get_log().since(user_id, last_seen)
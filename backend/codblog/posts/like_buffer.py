@@ -0,0 +1,210 @@
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import LikeFlush, Post
+
+KEY = "posts:like-deltas"
+INFLIGHT_KEY = "posts:like-deltas:inflight"
+FLUSH_LOCK_KEY = "posts:like-flush-lock"
+FLUSH_LOCK_TIMEOUT = 60
+FLUSH_RECORD_TTL = timedelta(days=7)
+
+# Move the live deltas aside under a flush id, in one step so a like arriving
+# mid-flush lands in a fresh hash. A batch left behind by an interrupted flush
+# is handed out again, with its original id, before anything new.
+CLAIM_SCRIPT = """
+if redis.call("EXISTS", KEYS[2]) == 0 then
+    if redis.call("EXISTS", KEYS[1]) == 0 then
+        return {}
+    end
+    redis.call("RENAME", KEYS[1], KEYS[2])
+    redis.call("HSET", KEYS[2], "flush", ARGV[1])
+end
+return redis.call("HGETALL", KEYS[2])
+"""
+
+RELEASE_SCRIPT = """
+if redis.call("HGET", KEYS[1], "flush") == ARGV[1] then
+    redis.call("DEL", KEYS[1])
+end
+"""
+
+
+def enabled():
+    return getattr(settings, "LIKE_WRITE_BEHIND", False)
+
+
+class RedisLikeBuffer:
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+
+    def add(self, post_id, delta):
+        self.client.hincrby(KEY, post_id, delta)
+
+    def pending(self, post_ids):
+        # (claimed batch id, live deltas, claimed deltas)
+        post_ids = list(post_ids)
+        pipe = self.client.pipeline()
+        pipe.hmget(KEY, post_ids)
+        pipe.hmget(INFLIGHT_KEY, [*post_ids, "flush"])
+        live, inflight = pipe.execute()
+        flush_id = inflight.pop()
+        return (
+            flush_id,
+            {post_id: int(value or 0) for post_id, value in zip(post_ids, live)},
+            {post_id: int(value or 0) for post_id, value in zip(post_ids, inflight)},
+        )
+
+    def claim(self):
+        fields = self.client.eval(CLAIM_SCRIPT, 2, KEY, INFLIGHT_KEY, uuid.uuid4().hex)
+        batch = dict(zip(fields[::2], fields[1::2]))
+        flush_id = batch.pop("flush", None)
+        deltas = {
+            int(post_id): int(delta) for post_id, delta in batch.items() if int(delta)
+        }
+        return flush_id, deltas
+
+    def release(self, flush_id):
+        self.client.eval(RELEASE_SCRIPT, 1, INFLIGHT_KEY, flush_id)
+
+
+class LocalLikeBuffer:
+    # single-process stand-in for development and tests
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.deltas = defaultdict(int)
+        self.inflight = None  # (flush id, deltas)
+
+    def add(self, post_id, delta):
+        with self.lock:
+            self.deltas[post_id] += delta
+
+    def pending(self, post_ids):
+        with self.lock:
+            flush_id, inflight = self.inflight or (None, {})
+            return (
+                flush_id,
+                {post_id: self.deltas.get(post_id, 0) for post_id in post_ids},
+                {post_id: inflight.get(post_id, 0) for post_id in post_ids},
+            )
+
+    def claim(self):
+        with self.lock:
+            if self.inflight is None and self.deltas:
+                self.inflight = (uuid.uuid4().hex, dict(self.deltas))
+                self.deltas = defaultdict(int)
+            if self.inflight is None:
+                return None, {}
+            flush_id, deltas = self.inflight
+            return flush_id, {
+                post_id: delta for post_id, delta in deltas.items() if delta
+            }
+
+    def release(self, flush_id):
+        with self.lock:
+            if self.inflight and self.inflight[0] == flush_id:
+                self.inflight = None
+
+
+_buffer = None
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        url = getattr(settings, "LIKE_BUFFER_REDIS_URL", None)
+        _buffer = RedisLikeBuffer(url) if url else LocalLikeBuffer()
+    return _buffer
+
+
+def add(post_id, delta):
+    get_buffer().add(post_id, delta)
+
+
+def pending(posts):
+    # A claimed batch is already in Post.like once its UPDATE commits, but
+    # stays in the buffer until it is released. The UPDATE also stamps the
+    # rows with the batch id, read in the same row as the count, so a post
+    # shows the batch exactly once either side of the commit.
+    if not enabled():
+        return {}
+    posts = list(posts)
+    if not posts:
+        return {}
+    flush_id, live, inflight = get_buffer().pending([post.pk for post in posts])
+    return {
+        post.pk: live[post.pk]
+        + (0 if post.last_like_flush == flush_id else inflight[post.pk])
+        for post in posts
+    }
+
+
+def flush():
+    if not cache.add(FLUSH_LOCK_KEY, 1, FLUSH_LOCK_TIMEOUT):
+        return 0  # another worker is flushing
+    try:
+        return apply_claimed(get_buffer())[1]
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+
+
+def drain(wait=FLUSH_LOCK_TIMEOUT):
+    # Applies everything buffered so far, after waiting out a flush already
+    # running, for jobs that recount Post.like from the through table.
+    deadline = time.monotonic() + wait
+    while not cache.add(FLUSH_LOCK_KEY, 1, FLUSH_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            raise TimeoutError("A like buffer flush is still running")
+        time.sleep(0.1)
+    try:
+        buffer = get_buffer()
+        applied = 0
+        # a batch left claimed by an interrupted flush, then the live deltas
+        for _ in range(2):
+            flush_id, count = apply_claimed(buffer)
+            if flush_id is None:
+                break
+            applied += count
+        return applied
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+
+
+def apply_claimed(buffer):
+    # The batch stays claimed in the buffer until its UPDATEs have committed
+    # together with a LikeFlush row for its id. A flush that dies after the
+    # commit leaves the batch behind; the next one finds the row, skips the
+    # UPDATEs and only releases it, so deltas are applied exactly once.
+    flush_id, deltas = buffer.claim()
+    if flush_id is None:
+        return None, 0
+
+    # posts with the same delta share one UPDATE
+    by_delta = defaultdict(list)
+    for post_id, delta in deltas.items():
+        by_delta[delta].append(post_id)
+    now = timezone.now()
+    with transaction.atomic():
+        _, created = LikeFlush.objects.get_or_create(id=flush_id)
+        if created:
+            for delta, post_ids in by_delta.items():
+                Post.objects.filter(pk__in=sorted(post_ids)).update(
+                    like=Greatest(F("like") + delta, Value(0)),
+                    last_like_flush=flush_id,
+                    last_activity_at=now,
+                )
+        LikeFlush.objects.filter(created_at__lt=now - FLUSH_RECORD_TTL).delete()
+    buffer.release(flush_id)
+    return flush_id, (len(deltas) if created else 0)
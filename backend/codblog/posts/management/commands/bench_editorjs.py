@@ -0,0 +1,75 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import editorjs
+
+
+def generate_document(block_count):
+    samples = [
+        {"type": "header", "data": {"text": "Section <b>heading</b>", "level": 2}},
+        {
+            "type": "paragraph",
+            "data": {
+                "text": "Lorem <i>ipsum</i> dolor sit amet, "
+                '<a href="https://example.com">consectetur</a> adipiscing elit. ' * 4
+            },
+        },
+        {
+            "type": "list",
+            "data": {"style": "unordered", "items": ["first", "second", "third"]},
+        },
+        {"type": "code", "data": {"code": "def f(x):\n    return x < 1 and '<tag>'\n"}},
+        {
+            "type": "image",
+            "data": {
+                "file": {"url": "https://example.com/a.png"},
+                "caption": "An image",
+            },
+        },
+        {"type": "quote", "data": {"text": "Quoted text", "caption": "Someone"}},
+        {
+            "type": "embed",
+            "data": {
+                "service": "youtube",
+                "source": "https://youtu.be/x",
+                "embed": "https://www.youtube.com/embed/x",
+            },
+        },
+    ]
+    return {
+        "blocks": [
+            dict(samples[index % len(samples)], id=f"b{index}")
+            for index in range(block_count)
+        ]
+    }
+
+
+class Command(BaseCommand):
+    help = "Benchmark Editor.js rendering and summarizing on large generated posts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--blocks", type=int, nargs="+", default=[100, 1000, 5000])
+        parser.add_argument("--repeat", type=int, default=10)
+
+    def handle(self, *args, **options):
+        for block_count in options["blocks"]:
+            document = generate_document(block_count)
+            for label, step in (
+                ("render_html", editorjs.render_html),
+                ("summarize", editorjs.summarize),
+                ("content_hash", editorjs.content_hash),
+            ):
+                timings = []
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    step(document)
+                    timings.append((time.perf_counter() - started) * 1000)
+                self.stdout.write(
+                    f"{block_count:>6} blocks  {label:<13} "
+                    f"median {statistics.median(timings):8.2f} ms  "
+                    f"max {max(timings):8.2f} ms"
+                )
+            html = editorjs.render_html(document)
+            self.stdout.write(f"{block_count:>6} blocks  html size {len(html)} bytes")
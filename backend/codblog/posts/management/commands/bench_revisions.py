@@ -0,0 +1,77 @@
+import copy
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import revisions
+from posts.management.commands.bench_editorjs import generate_document
+
+
+def random_edit(content, rng, counter):
+    content = copy.deepcopy(content)
+    blocks = content["blocks"]
+    roll = rng.random()
+    if roll < 0.6 and blocks:
+        block = rng.choice(blocks)
+        block["data"] = {"text": f"edited {counter} " * rng.randint(5, 40)}
+        block["type"] = "paragraph"
+    elif roll < 0.8:
+        blocks.insert(
+            rng.randint(0, len(blocks)),
+            {"id": f"n{counter}", "type": "paragraph", "data": {"text": "added"}},
+        )
+    elif roll < 0.9 and len(blocks) > 1:
+        blocks.pop(rng.randrange(len(blocks)))
+    elif blocks:
+        blocks.insert(rng.randint(0, len(blocks) - 1), blocks.pop())
+    content["time"] = counter
+    return content
+
+
+class Command(BaseCommand):
+    help = "Benchmark revision storage size and rebuild time over long edit histories."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--blocks", type=int, default=300)
+        parser.add_argument("--edits", type=int, nargs="+", default=[100, 500, 1000])
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        interval = revisions.SNAPSHOT_INTERVAL
+        for edit_count in options["edits"]:
+            rng = random.Random(options["seed"])
+            content = generate_document(options["blocks"])
+            history = [content]
+            stored = [(True, revisions.encode(content))]
+            full_copies = len(revisions.encode(content))
+
+            for number in range(2, edit_count + 2):
+                previous, content = content, random_edit(content, rng, number)
+                history.append(content)
+                full_copies += len(revisions.encode(content))
+                if (number - 1) % interval == 0:
+                    stored.append((True, revisions.encode(content)))
+                else:
+                    delta = revisions.compute_delta(previous, content)
+                    stored.append((False, revisions.encode(delta)))
+
+            worst = 0.0
+            for number in range(1, len(history) + 1):
+                started = time.perf_counter()
+                base = max(index for index in range(number) if stored[index][0])
+                rebuilt = revisions.decode(stored[base][1])
+                for index in range(base + 1, number):
+                    rebuilt = revisions.apply_delta(
+                        rebuilt, revisions.decode(stored[index][1])
+                    )
+                worst = max(worst, time.perf_counter() - started)
+                assert rebuilt == history[number - 1], number
+
+            total = sum(len(data) for _, data in stored)
+            self.stdout.write(
+                f"{edit_count:>5} edits  stored {total / 1024:9.1f} KiB  "
+                f"full copies {full_copies / 1024:9.1f} KiB  "
+                f"ratio {total / full_copies:6.3f}  "
+                f"worst rebuild {worst * 1000:7.2f} ms"
+            )
@@ -0,0 +1,149 @@
+import random
+import statistics
+import time
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts import search
+from posts.models import Post
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "vi", "so", "de", "pa", "zu", "ri"]
+
+
+def generate_vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    # sorted first because set order varies between runs; shuffled so that
+    # frequency rank is unrelated to spelling
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+def generate_corpus(count, vocabulary, body_words, rng):
+    # Zipf-like term frequencies, so a few terms have very long posting lists
+    cumulative = list(accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    for post_id in range(1, count + 1):
+        title = " ".join(rng.choices(vocabulary, cum_weights=cumulative, k=6))
+        body = " ".join(rng.choices(vocabulary, cum_weights=cumulative, k=body_words))
+        yield post_id, title, f"author{post_id % 500}", body
+
+
+def generate_queries(vocabulary, count, rng):
+    queries = []
+    for _ in range(count):
+        # mix of common and rare terms, some typed as prefixes
+        words = [rng.choice(vocabulary[: rng.choice([50, 1000, len(vocabulary)])])]
+        if rng.random() < 0.5:
+            words.append(rng.choice(vocabulary))
+        if rng.random() < 0.3:
+            words[-1] = words[-1][:3]
+        queries.append(" ".join(words))
+    return queries
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Benchmark the in-memory BM25 and Postgres search backends on a generated corpus."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=100_000)
+        parser.add_argument("--body-words", type=int, default=150)
+        parser.add_argument("--vocabulary", type=int, default=20_000)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        vocabulary = generate_vocabulary(options["vocabulary"], rng)
+        corpus = list(
+            generate_corpus(options["posts"], vocabulary, options["body_words"], rng)
+        )
+        queries = generate_queries(vocabulary, options["queries"], rng)
+
+        self.bench_memory(corpus, queries)
+        if connection.vendor == "postgresql":
+            self.bench_postgres(corpus, queries)
+        else:
+            self.stdout.write(
+                self.style.WARNING(
+                    "Skipping Postgres backend: database is not Postgres"
+                )
+            )
+
+    def report(self, label, build_seconds, timings, extra=""):
+        timings = [seconds * 1000 for seconds in timings]
+        self.stdout.write(
+            f"{label:<9} build {build_seconds:8.2f} s  "
+            f"p50 {statistics.median(timings):8.2f} ms  "
+            f"p95 {percentile(timings, 0.95):8.2f} ms  "
+            f"max {max(timings):8.2f} ms{extra}"
+        )
+
+    def bench_memory(self, corpus, queries):
+        backend = search.MemorySearchBackend()
+        backend.loaded = True  # the corpus is not in the database
+
+        started = time.perf_counter()
+        for document in corpus:
+            backend.add_document(*document)
+        build_seconds = time.perf_counter() - started
+
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            backend.score(search.query_terms(query), 20)
+            timings.append(time.perf_counter() - started)
+
+        self.report(
+            "bm25",
+            build_seconds,
+            timings,
+            f"  postings {backend.memory_usage() / 2**20:7.1f} MiB"
+            f"  terms {len(backend.postings)}",
+        )
+
+    def bench_postgres(self, corpus, queries):
+        backend = search.PostgresSearchBackend()
+        with transaction.atomic():
+            author, _ = get_user_model().objects.get_or_create(
+                username="bench-search", defaults={"email": "bench-search@example.com"}
+            )
+            Post.objects.bulk_create(
+                (
+                    Post(
+                        author=author,
+                        title=title,
+                        content={
+                            "blocks": [{"type": "paragraph", "data": {"text": body}}]
+                        },
+                    )
+                    for _, title, _, body in corpus
+                ),
+                batch_size=2000,
+            )
+
+            started = time.perf_counter()
+            backend.reindex(batch_size=2000)
+            build_seconds = time.perf_counter() - started
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {Post._meta.db_table}")
+
+            timings = []
+            for query in queries:
+                started = time.perf_counter()
+                backend.search(query, 0, 20)
+                timings.append(time.perf_counter() - started)
+
+            # the generated corpus never outlives the benchmark
+            transaction.set_rollback(True)
+
+        self.report("postgres", build_seconds, timings)
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from posts import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Manage monthly range partitions of the notifications table on Postgres: "
+        "convert the table once, then keep partitions created ahead of time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help="Rebuild the table as partitioned; locks it while rows are copied.",
+        )
+        parser.add_argument(
+            "--months-ahead", type=int, default=retention.PARTITION_MONTHS_AHEAD
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Partitioning needs PostgreSQL.")
+
+        if options["convert"]:
+            if retention.is_partitioned():
+                raise CommandError("The notifications table is already partitioned.")
+            before = retention.storage_report()
+            created = retention.convert_to_partitioned(options["months_ahead"])
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Moved {before['rows']} notifications into {len(created)} "
+                    "monthly partitions"
+                )
+            )
+            return
+
+        if not retention.is_partitioned():
+            raise CommandError("Run with --convert first.")
+        created = retention.ensure_partitions(months_ahead=options["months_ahead"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Partitions up to date: {', '.join(created)}")
+        )
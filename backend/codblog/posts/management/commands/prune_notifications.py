@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from posts import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete (or archive) notifications past their retention TTL and report "
+        "the notifications table and index size before and after."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=retention.BATCH_SIZE)
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            default=retention.MAX_BATCHES,
+            help="Stop after this many batches; the next run picks up the rest.",
+        )
+        parser.add_argument(
+            "--archive",
+            action="store_true",
+            default=retention.ARCHIVE,
+            help="Copy pruned rows to NotificationArchive before deleting them.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many notifications have expired.",
+        )
+
+    def handle(self, *args, **options):
+        self.report("Before", retention.storage_report())
+        if options["dry_run"]:
+            expired = retention.expired().count()
+            self.stdout.write(f"{expired} notifications are past their TTL")
+            return
+
+        removed = retention.prune(
+            batch_size=options["batch_size"],
+            max_batches=options["max_batches"],
+            archive=options["archive"],
+        )
+        verb = "Archived" if options["archive"] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {removed} notifications"))
+        self.report("After", retention.storage_report())
+
+    def report(self, label, report):
+        sizes = ""
+        if report["table_bytes"] is not None:
+            sizes = (
+                f", table {filesizeformat(report['table_bytes'])}"
+                f", indexes {filesizeformat(report['index_bytes'])}"
+            )
+        self.stdout.write(f"{label}: {report['rows']} rows{sizes}")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Re-render and recompute the fields Post derives from its Editor.js content."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        fields = Post.CONTENT_DERIVED_FIELDS  # titles stay as their authors set them
+
+        batch = []
+        total = 0
+        for post in Post.objects.order_by("id").iterator(chunk_size=batch_size):
+            post.apply_content_metadata(force=True)
+            batch.append(post)
+            if len(batch) == batch_size:
+                total += Post.objects.bulk_update(batch, fields)
+                batch = []
+        if batch:
+            total += Post.objects.bulk_update(batch, fields)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt content fields for {total} posts")
+        )
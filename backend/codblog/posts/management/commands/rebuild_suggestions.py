@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts import suggest
+
+
+class Command(BaseCommand):
+    help = "Rebuild the typeahead prefix table from post titles and usernames."
+
+    def handle(self, *args, **options):
+        total = suggest.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} posts and users"))
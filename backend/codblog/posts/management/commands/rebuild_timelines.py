@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = "Rebuild every materialized home timeline from the follow graph."
+
+    def handle(self, *args, **options):
+        TimelineEntry.objects.all().delete()
+        follows = Follow.objects.values_list("follower_id", "following_id")
+
+        total = 0
+        for follower_id, following_id in follows.iterator():
+            timeline.backfill(follower_id, following_id)
+            total += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {total} follow edges"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search index of every post with the configured backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=search.REINDEX_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        total = search.get_backend().reindex(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Reindexed {total} posts"))
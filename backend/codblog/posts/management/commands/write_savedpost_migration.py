@@ -0,0 +1,114 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import migrations, models
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+from django.utils import timezone
+
+
+def saved_post_operations():
+    # The auto-created posts_post_saved_by table already has the id, post_id
+    # and customuser_id columns and the unique pair, so SavedPost only takes it
+    # over in the migration state; the database just gains saved_at (existing
+    # saves get the migration time) and the (user, saved_at) index.
+    return [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name="SavedPost",
+                    fields=[
+                        (
+                            "id",
+                            models.BigAutoField(
+                                auto_created=True,
+                                primary_key=True,
+                                serialize=False,
+                                verbose_name="ID",
+                            ),
+                        ),
+                        (
+                            "post",
+                            models.ForeignKey(
+                                on_delete=models.CASCADE,
+                                related_name="saves",
+                                to="posts.post",
+                            ),
+                        ),
+                        (
+                            "user",
+                            models.ForeignKey(
+                                db_column="customuser_id",
+                                on_delete=models.CASCADE,
+                                related_name="+",
+                                to=settings.AUTH_USER_MODEL,
+                            ),
+                        ),
+                    ],
+                    options={
+                        "db_table": "posts_post_saved_by",
+                        "unique_together": {("post", "user")},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name="post",
+                    name="saved_by",
+                    field=models.ManyToManyField(
+                        blank=True,
+                        related_name="saved_posts",
+                        through="posts.SavedPost",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="savedpost",
+            name="saved_at",
+            field=models.DateTimeField(default=timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name="savedpost",
+            index=models.Index(
+                fields=["user", "-saved_at", "-id"], name="saved_post_user_idx"
+            ),
+        ),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the migration that turns Post.saved_by's auto-created table into "
+        "SavedPost without losing saves. Run it before makemigrations on a "
+        "database created before SavedPost existed."
+    )
+
+    def handle(self, *args, **options):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        leaves = loader.graph.leaf_nodes("posts")
+        if not leaves:
+            raise CommandError(
+                "posts has no migrations yet; a fresh database only needs makemigrations."
+            )
+        if len(leaves) > 1:
+            raise CommandError("posts has several leaf migrations; merge them first.")
+        if ("posts", "savedpost") in loader.project_state().models:
+            self.stdout.write("SavedPost is already in the migration history.")
+            return
+
+        number = MigrationAutodetector.parse_number(leaves[0][1]) or 0
+        migration = migrations.Migration(f"{number + 1:04d}_savedpost_through", "posts")
+        migration.dependencies = [
+            *leaves,
+            migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ]
+        migration.operations = saved_post_operations()
+
+        writer = MigrationWriter(migration)
+        if os.path.exists(writer.path):
+            raise CommandError(f"{writer.path} already exists.")
+        with open(writer.path, "w") as migration_file:
+            migration_file.write(writer.as_string())
+        self.stdout.write(self.style.SUCCESS(f"Wrote {writer.path}"))
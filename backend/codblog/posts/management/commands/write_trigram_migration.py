@@ -0,0 +1,75 @@
+import os
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.core.management.base import BaseCommand, CommandError
+from django.db import migrations
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+
+TRIGRAM_INDEX = "post_title_trgm_idx"
+
+
+def operations_of(migration):
+    for operation in migration.operations:
+        if isinstance(operation, migrations.SeparateDatabaseAndState):
+            yield from operation.database_operations
+        else:
+            yield operation
+
+
+def creates_trigram_index(operation):
+    if isinstance(operation, migrations.AddIndex):
+        indexes = [operation.index]
+    elif isinstance(operation, migrations.CreateModel):
+        indexes = operation.options.get("indexes", [])
+    else:
+        return False
+    return any(index.name == TRIGRAM_INDEX for index in indexes)
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the migration that installs the pg_trgm extension, which the "
+        f"{TRIGRAM_INDEX} index on Post.title needs. Run it before makemigrations."
+    )
+
+    def handle(self, *args, **options):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        posts_migrations = [
+            migration
+            for (app_label, name), migration in sorted(loader.disk_migrations.items())
+            if app_label == "posts"
+        ]
+        for migration in posts_migrations:
+            for operation in operations_of(migration):
+                if isinstance(operation, TrigramExtension):
+                    self.stdout.write(f"{migration.name} already installs pg_trgm.")
+                    return
+                if creates_trigram_index(operation):
+                    # the extension has to exist before that migration runs
+                    raise CommandError(
+                        f"{migration.name} creates {TRIGRAM_INDEX} without pg_trgm; "
+                        "add TrigramExtension() as its first operation, or run "
+                        "CREATE EXTENSION pg_trgm as a database superuser."
+                    )
+
+        leaves = loader.graph.leaf_nodes("posts")
+        if len(leaves) > 1:
+            raise CommandError("posts has several leaf migrations; merge them first.")
+
+        if leaves:
+            number = (MigrationAutodetector.parse_number(leaves[0][1]) or 0) + 1
+        else:
+            number = 1
+        migration = migrations.Migration(f"{number:04d}_trigram_extension", "posts")
+        migration.initial = not leaves
+        migration.dependencies = list(leaves)
+        migration.operations = [TrigramExtension()]
+
+        writer = MigrationWriter(migration)
+        if os.path.exists(writer.path):
+            raise CommandError(f"{writer.path} already exists.")
+        with open(writer.path, "w") as migration_file:
+            migration_file.write(writer.as_string())
+        self.stdout.write(self.style.SUCCESS(f"Wrote {writer.path}"))
@@ -1,24 +1,136 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth import get_user_model
 from django.db.models import JSONField
+from django.utils import timezone
 from accounts.models import *
+from . import editorjs
 
 user = get_user_model()
 
 
+class PostQuerySet(models.QuerySet):
+    def for_list(self):
+        # feed rows never need the Editor.js document itself
+        return self.select_related("author").defer(
+            "content", "content_html", "search_vector"
+        )
+
+
 class Post(models.Model):
+    CONTENT_DERIVED_FIELDS = [
+        "excerpt",
+        "word_count",
+        "reading_time",
+        "cover_image",
+        "content_html",
+        "content_hash",
+    ]
+
     author = models.ForeignKey(user, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
     content = models.JSONField(null=True, blank=True)
+    excerpt = models.TextField(blank=True, default="")
+    word_count = models.PositiveIntegerField(default=0)
+    reading_time = models.PositiveSmallIntegerField(default=1)  # minutes
+    cover_image = models.URLField(max_length=500, blank=True, default="")
+    content_html = models.TextField(blank=True, default="")
+    content_hash = models.CharField(max_length=64, blank=True, default="")
+    revision = models.PositiveIntegerField(default=1)
     like = models.IntegerField(default=0)
+    # like-buffer batch last added to like; see posts.like_buffer.pending
+    last_like_flush = models.CharField(max_length=32, blank=True, default="")
+    comment_count = models.PositiveIntegerField(default=0)
+    reply_count = models.PositiveIntegerField(default=0)
     liked_by = models.ManyToManyField(user, related_name="liked_posts", blank=True)
-    saved_by = models.ManyToManyField(user, related_name="saved_posts", blank=True)
+    saved_by = models.ManyToManyField(
+        user, through="SavedPost", related_name="saved_posts", blank=True
+    )
+    hot_score = models.FloatField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    last_activity_at = models.DateTimeField(default=timezone.now)  # likes/comments
+    # title (A), author (B) and body text (C), maintained by posts.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="post_created_idx"),
+            models.Index(fields=["-like", "-created_at", "-id"], name="post_like_idx"),
+            models.Index(fields=["-hot_score", "-id"], name="post_hot_score_idx"),
+            models.Index(fields=["last_activity_at"], name="post_activity_idx"),
+            GinIndex(fields=["search_vector"], name="post_search_idx"),
+            # needs the pg_trgm extension; write_trigram_migration installs it
+            GinIndex(
+                fields=["title"], name="post_title_trgm_idx", opclasses=["gin_trgm_ops"]
+            ),
+        ]
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.author.username} - {self.title}"
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "content" in update_fields:
+            self.apply_content_metadata()
+            if update_fields is not None:
+                kwargs["update_fields"] = {
+                    *update_fields,
+                    "title",
+                    *self.CONTENT_DERIVED_FIELDS,
+                }
+        super().save(*args, **kwargs)
+
+    def apply_content_metadata(self, force=False):
+        content_hash = editorjs.content_hash(self.content)
+        if content_hash == self.content_hash and not force:
+            return
+
+        # an edit takes its title from the first header, as EditPost always
+        # did; a new post keeps the title it was submitted with, if any
+        title = editorjs.extract_title(self.content)
+        if title and (not self._state.adding or not self.title):
+            self.title = title
+        for field, value in editorjs.summarize(self.content).items():
+            setattr(self, field, value)
+        self.content_html = editorjs.render_html(self.content)
+        self.content_hash = content_hash
+
+
+class SavedPost(models.Model):
+    # through model for Post.saved_by; it keeps the table and column names of
+    # the auto-created one it replaced so existing saves carry over
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="saves")
+    user = models.ForeignKey(
+        user, on_delete=models.CASCADE, db_column="customuser_id", related_name="+"
+    )
+    saved_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = "posts_post_saved_by"
+        unique_together = ("post", "user")
+        indexes = [
+            models.Index(
+                fields=["user", "-saved_at", "-id"], name="saved_post_user_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} saved {self.post_id}"
+
+
+class LikeFlush(models.Model):
+    # ids of like-buffer batches already applied to Post.like, written in the
+    # same transaction as the counters so a batch is never applied twice
+    id = models.CharField(max_length=32, primary_key=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"like flush {self.id}"
+
 
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="comments")
@@ -53,6 +165,59 @@ class Follow(models.Model):
         return f"{self.follower.username} follows {self.following.username}"
 
 
+class PostRevision(models.Model):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="revisions")
+    number = models.PositiveIntegerField()
+    is_snapshot = models.BooleanField(default=False)
+    data = models.BinaryField()  # zlib-compressed JSON, full document or block delta
+    editor = models.ForeignKey(
+        user, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("post", "number")
+
+    def __str__(self):
+        return f"{self.post_id} r{self.number}"
+
+
+class TimelineEntry(models.Model):
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    author = models.ForeignKey(user, on_delete=models.CASCADE, related_name="+")
+    user = models.ForeignKey(user, on_delete=models.CASCADE, related_name="timeline")
+    created_at = models.DateTimeField()  # copy of post.created_at for the range scan
+
+    class Meta:
+        unique_together = ("user", "post")
+        indexes = [models.Index(fields=["user", "-created_at", "-post"])]
+
+    def __str__(self):
+        return f"{self.user_id} <- {self.post_id}"
+
+
+class SuggestPrefix(models.Model):
+    # edge n-grams of post titles and usernames for the typeahead
+    KIND_CHOICES = (("post", "Post"), ("user", "User"))
+
+    prefix = models.CharField(max_length=20)
+    kind = models.CharField(max_length=4, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    label = models.CharField(max_length=200)
+    weight = models.IntegerField(default=0)  # likes for posts, followers for users
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["prefix", "-weight"], name="suggest_prefix_idx"),
+            models.Index(fields=["kind", "object_id"], name="suggest_object_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.prefix} -> {self.kind} {self.object_id}"
+
+
 class Notifications(models.Model):
     NOTIFICACTION_TYPES = (
         ("comment", "comment"),
@@ -60,6 +225,8 @@ class Notifications(models.Model):
         ("follow", "Follow"),
     )
 
+    # one row per (recipient, type, post) group within
+    # NOTIFICATION_GROUP_WINDOW; sender is the most recent actor
     recipient = models.ForeignKey(
         CustomUser, on_delete=models.CASCADE, related_name="notifications"
     )
@@ -68,11 +235,32 @@ class Notifications(models.Model):
     )
     notification_type = models.CharField(max_length=20, choices=NOTIFICACTION_TYPES)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True)
-    comment = models.ForeignKey(
-        Comment, on_delete=models.CASCADE, null=True, blank=True
+    comment = models.ForeignKey(  # latest comment of the group
+        Comment, on_delete=models.SET_NULL, null=True, blank=True
     )
+    actor_count = models.PositiveIntegerField(default=1)
+    recent_actors = models.JSONField(default=list, blank=True)  # user ids, newest first
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now)  # last actor added
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["recipient", "notification_type", "post", "-created_at"],
+                name="notification_group_idx",
+            ),
+            models.Index(
+                fields=["recipient", "-created_at", "-id"],
+                name="notification_inbox_idx",
+            ),
+            models.Index(
+                fields=["recipient", "-created_at", "-id"],
+                condition=models.Q(is_read=False),
+                name="notification_unread_idx",
+            ),
+            models.Index(fields=["created_at"], name="notification_created_idx"),
+        ]
 
     def __str__(self):
         notification = (
@@ -81,3 +269,53 @@ class Notifications(models.Model):
             else "notification"
         )
         return f"{self.sender.username} {self.notification_type} {notification}"
+
+
+class NotificationActor(models.Model):
+    # one row per actor counted in a group's actor_count, so adding or
+    # removing an actor is idempotent and an unlike finds the group its like
+    # went to; no database foreign key, as Notifications may be partitioned
+    notification = models.ForeignKey(
+        Notifications, on_delete=models.CASCADE, db_constraint=False, related_name="+"
+    )
+    actor = models.ForeignKey(user, on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["notification", "actor"], name="unique_notification_actor"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.actor_id} in {self.notification_id}"
+
+
+class NotificationCounter(models.Model):
+    # unread notifications per user, maintained by posts.unread; kept off the
+    # user row so a full CustomUser.save() cannot write back a stale value
+    user = models.OneToOneField(
+        user, on_delete=models.CASCADE, primary_key=True, related_name="+"
+    )
+    unread = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread} unread"
+
+
+class NotificationArchive(models.Model):
+    # notifications pruned by posts.retention when NOTIFICATION_ARCHIVE is on;
+    # plain ids so archived rows outlive the users and posts they mention
+    id = models.BigIntegerField(primary_key=True)
+    recipient_id = models.BigIntegerField(db_index=True)
+    sender_id = models.BigIntegerField()
+    notification_type = models.CharField(max_length=20)
+    post_id = models.BigIntegerField(null=True, blank=True)
+    comment_id = models.BigIntegerField(null=True, blank=True)
+    actor_count = models.PositiveIntegerField(default=1)
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"archived {self.notification_type} for {self.recipient_id}"
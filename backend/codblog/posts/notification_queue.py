@@ -0,0 +1,449 @@
+import json
+import threading
+from datetime import timedelta
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import Comment, NotificationActor, Notifications, Post
+from . import event_log, unread
+
+User = get_user_model()
+
+KEY = "posts:notification-events"
+PROCESSING_KEY = "posts:notification-events:processing"
+SCHEDULED_KEY = "posts:notification-drain-scheduled"
+DRAIN_LOCK_KEY = "posts:notification-drain-lock"
+DRAIN_LOCK_TIMEOUT = 60
+BATCH_SIZE = getattr(settings, "NOTIFICATION_BATCH_SIZE", 500)
+DRAIN_DELAY = getattr(settings, "NOTIFICATION_DRAIN_DELAY", 1)  # seconds
+GROUP_WINDOW = getattr(settings, "NOTIFICATION_GROUP_WINDOW", timedelta(hours=24))
+RECENT_ACTORS = 3
+
+# event kinds and whether they add or remove a notification
+TOGGLES = {
+    "like": ("like", True),
+    "unlike": ("like", False),
+    "follow": ("follow", True),
+    "unfollow": ("follow", False),
+}
+
+
+# moves the next batch onto the processing list unless a batch from a failed
+# drain is still there, and returns whatever is on it
+CLAIM_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    local events = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+    if #events > 0 then
+        redis.call('RPUSH', KEYS[2], unpack(events))
+        redis.call('LTRIM', KEYS[1], #events, -1)
+    end
+end
+return redis.call('LRANGE', KEYS[2], 0, -1)
+"""
+
+
+class RedisEventQueue:
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.claim_script = self.client.register_script(CLAIM_SCRIPT)
+
+    def push(self, event):
+        self.client.rpush(KEY, json.dumps(event))
+
+    def claim(self, count):
+        events = self.claim_script(keys=[KEY, PROCESSING_KEY], args=[count])
+        return [json.loads(event) for event in events]
+
+    def ack(self):
+        self.client.delete(PROCESSING_KEY)
+
+
+class LocalEventQueue:
+    # single-process stand-in for development and tests
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = deque()
+        self.processing = []
+
+    def push(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def claim(self, count):
+        with self.lock:
+            if not self.processing:
+                self.processing = [
+                    self.events.popleft() for _ in range(min(count, len(self.events)))
+                ]
+            return list(self.processing)
+
+    def ack(self):
+        with self.lock:
+            self.processing = []
+
+
+_queue = None
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        url = getattr(settings, "NOTIFICATION_QUEUE_REDIS_URL", None)
+        _queue = RedisEventQueue(url) if url else LocalEventQueue()
+    return _queue
+
+
+def push(event):
+    get_queue().push(event)
+
+
+def claim_drain():
+    # only the first event of a burst schedules a drain; the rest ride along
+    return cache.add(SCHEDULED_KEY, 1, DRAIN_DELAY + DRAIN_LOCK_TIMEOUT)
+
+
+def drain():
+    cache.delete(SCHEDULED_KEY)
+    if not cache.add(DRAIN_LOCK_KEY, 1, DRAIN_LOCK_TIMEOUT):
+        return 0  # another worker is draining
+    try:
+        total = 0
+        queue = get_queue()
+        while True:
+            # a batch stays claimed until it is committed, so a failed drain
+            # leaves it for the next one instead of dropping it
+            events = queue.claim(BATCH_SIZE)
+            if not events:
+                return total
+            process(events)
+            queue.ack()
+            total += len(events)
+    finally:
+        cache.delete(DRAIN_LOCK_KEY)
+
+
+def net_toggles(events):
+    # a pair that flapped within one batch only counts if it ended where it
+    # started, e.g. like/unlike/like is one like and like/unlike is nothing
+    first, last = {}, {}
+    for event in events:
+        if event["kind"] in TOGGLES:
+            notification_type, added = TOGGLES[event["kind"]]
+            key = (
+                notification_type,
+                event["recipient"],
+                event["sender"],
+                event.get("post"),
+            )
+            first.setdefault(key, added)
+            last.pop(key, None)
+            last[key] = added
+    return {key: added for key, added in last.items() if first[key] == added}
+
+
+def process(events):
+    toggles = net_toggles(events)
+    comments = [event for event in events if event["kind"] == "comment"]
+
+    post_ids = {key[3] for key in toggles if key[3]} | {e["post"] for e in comments}
+    posts = Post.objects.only("id", "author_id", "title").in_bulk(post_ids)
+    comment_ids = set(
+        Comment.objects.filter(id__in=[e["comment"] for e in comments]).values_list(
+            "id", flat=True
+        )
+    )
+
+    # (group key, actor, added, comment) in event order; a group key is
+    # (type, recipient, post)
+    changes = [
+        ((notification_type, recipient, post_id), sender, added, None)
+        for (notification_type, recipient, sender, post_id), added in toggles.items()
+        if post_id is None or post_id in posts
+    ]
+    for event in comments:
+        post = posts.get(event["post"])
+        if (
+            post
+            and event["comment"] in comment_ids
+            and post.author_id != event["sender"]
+        ):
+            key = ("comment", post.author_id, post.id)
+            changes.append((key, event["sender"], True, event["comment"]))
+
+    actors = User.objects.only("id", "username").in_bulk(
+        {actor for _, actor, added, _ in changes if added}
+    )
+    changes = [change for change in changes if not change[2] or change[1] in actors]
+    if not changes:
+        return
+
+    with transaction.atomic():
+        touched, deltas = apply_changes(changes)
+        unread.adjust_many(deltas)
+
+    if touched:
+        push_updates(touched, posts)
+
+
+def apply_changes(changes):
+    now = timezone.now()
+    cutoff = now - GROUP_WINDOW
+    groups = open_groups({key for key, _, _, _ in changes}, cutoff)
+    members = member_groups(
+        {(key, actor) for key, actor, added, _ in changes if not added}, groups
+    )
+    counted = counted_actors(
+        groups.values(), {actor for _, actor, added, _ in changes if added}
+    )
+    created, changed, emptied = [], {}, []
+    joined, left = [], []  # (group, actor) memberships to add and remove
+    lost_recent = []  # groups whose recent_actors need refilling
+    touched = {}  # recipient -> groups that gained an actor
+    deltas = defaultdict(int)  # recipient -> change in unread notifications
+
+    for key, actor, added, comment_id in changes:
+        notification_type, recipient_id, post_id = key
+        group = groups.get(key) if added else members.get((key, actor))
+        if group is None and not added:
+            continue  # the actor is not counted in any group
+        activity = touched.setdefault(recipient_id, [])
+
+        if added:
+            if group is None:
+                group = Notifications(
+                    recipient_id=recipient_id,
+                    notification_type=notification_type,
+                    post_id=post_id,
+                    actor_count=0,
+                    recent_actors=[],
+                    created_at=now,
+                )
+                groups[key] = group
+                created.append(group)
+                deltas[recipient_id] += 1
+            elif group.is_read:
+                group.is_read = False  # new activity resurfaces a read group
+                deltas[recipient_id] += 1
+            if (id(group), actor) not in counted:
+                counted.add((id(group), actor))
+                joined.append((group, actor))
+                group.actor_count += 1
+            group.recent_actors = [actor] + [
+                other for other in group.recent_actors if other != actor
+            ][: RECENT_ACTORS - 1]
+            group.sender_id = actor
+            group.comment_id = comment_id or group.comment_id
+            group.updated_at = now
+            if group not in activity:
+                activity.append(group)
+        else:
+            # unlike/unfollow takes the actor off the group holding them
+            # instead of deleting and recounting rows
+            left.append((group, actor))
+            group.actor_count -= 1
+            if actor in group.recent_actors:
+                group.recent_actors.remove(actor)
+                lost_recent.append(group)
+            if group.actor_count <= 0:
+                if groups.get(key) is group:
+                    del groups[key]
+                if group in activity:
+                    activity.remove(group)
+                if not group.is_read:
+                    deltas[recipient_id] -= 1
+                emptied.append(group.pk)
+                changed.pop(group.pk, None)
+                continue
+
+        if group.pk is not None:
+            changed[group.pk] = group
+
+    if left:
+        condition = Q(pk__in=[])
+        for group, actor in left:
+            condition |= Q(notification_id=group.pk, actor_id=actor)
+        NotificationActor.objects.filter(condition).delete()
+    if emptied:
+        Notifications.objects.filter(id__in=emptied).delete()
+    refill_recent_actors(
+        {group.pk: group for group in lost_recent if group.pk in changed}.values()
+    )
+    if changed:
+        Notifications.objects.bulk_update(
+            changed.values(),
+            [
+                "sender",
+                "comment",
+                "actor_count",
+                "recent_actors",
+                "is_read",
+                "updated_at",
+            ],
+        )
+    Notifications.objects.bulk_create(created)
+    NotificationActor.objects.bulk_create(
+        [
+            NotificationActor(notification_id=group.pk, actor_id=actor)
+            for group, actor in joined
+            if group.pk not in emptied
+        ],
+        ignore_conflicts=True,
+    )
+    return touched, deltas
+
+
+def open_groups(keys, cutoff):
+    # the newest group of each key still inside the window, from one locked
+    # query
+    rows = (
+        Notifications.objects.select_for_update()
+        .filter(groups_filter(keys), created_at__gte=cutoff)
+        .order_by("created_at", "id")
+    )
+    return {(row.notification_type, row.recipient_id, row.post_id): row for row in rows}
+
+
+def member_groups(removals, groups):
+    # (key, actor) -> the newest group of the key counting that actor, open or
+    # not, with one lookup for all removals
+    if not removals:
+        return {}
+    condition = Q(pk__in=[])
+    for (notification_type, recipient_id, post_id), actor in removals:
+        condition |= Q(
+            actor_id=actor,
+            notification__notification_type=notification_type,
+            notification__recipient_id=recipient_id,
+            notification__post_id=post_id,
+        )
+    found = {}
+    for row in (
+        NotificationActor.objects.filter(condition)
+        .order_by("notification_id")
+        .values_list(
+            "actor_id",
+            "notification_id",
+            "notification__notification_type",
+            "notification__recipient_id",
+            "notification__post_id",
+        )
+    ):
+        actor, notification_id, *key = row
+        found[tuple(key), actor] = notification_id
+
+    loaded = {group.pk: group for group in groups.values()}
+    missing = set(found.values()) - set(loaded)
+    if missing:
+        loaded.update(
+            Notifications.objects.select_for_update().in_bulk(sorted(missing))
+        )
+    return {
+        member: loaded[notification_id]
+        for member, notification_id in found.items()
+        if notification_id in loaded
+    }
+
+
+def counted_actors(groups, actors):
+    # (id(group), actor) for the given actors already counted in the groups
+    groups = {group.pk: group for group in groups}
+    if not groups or not actors:
+        return set()
+    rows = NotificationActor.objects.filter(
+        notification_id__in=groups, actor_id__in=actors
+    ).values_list("notification_id", "actor_id")
+    return {(id(groups[notification_id]), actor) for notification_id, actor in rows}
+
+
+def refill_recent_actors(groups):
+    # tops recent_actors back up from the remaining members, newest joiners
+    # first, and moves sender off an actor who left
+    groups = {group.pk: group for group in groups}
+    if not groups:
+        return
+    ranked = (
+        NotificationActor.objects.filter(notification_id__in=groups)
+        .annotate(
+            rank=Window(
+                RowNumber(),
+                partition_by=[F("notification_id")],
+                order_by=F("id").desc(),
+            )
+        )
+        .filter(rank__lte=RECENT_ACTORS * 2 - 1)
+        .order_by("notification_id", "rank")
+        .values_list("notification_id", "actor_id")
+    )
+    candidates = defaultdict(list)
+    for notification_id, actor in ranked:
+        candidates[notification_id].append(actor)
+    for pk, group in groups.items():
+        recent = group.recent_actors
+        recent += [actor for actor in candidates[pk] if actor not in recent]
+        group.recent_actors = recent[:RECENT_ACTORS]
+        if group.recent_actors and group.sender_id not in group.recent_actors:
+            group.sender_id = group.recent_actors[0]
+
+
+def groups_filter(keys):
+    condition = Q(pk__in=[])
+    for notification_type, recipient_id, post_id in keys:
+        condition |= Q(
+            notification_type=notification_type,
+            recipient_id=recipient_id,
+            post_id=post_id,
+        )
+    return condition
+
+
+def message(group, sender, post):
+    event_type = f"{group.notification_type}_notification"
+    if sender is None:
+        return event_type, None  # the actor was deleted meanwhile
+    others = group.actor_count - 1
+    actors = f"{sender.username} and {others} others" if others else sender.username
+    if group.notification_type == "like":
+        return event_type, f"{actors} liked your post {post.title}"
+    if group.notification_type == "comment" and others:
+        return event_type, f"{actors} commented on {post.title[:11]}"
+    if group.notification_type == "comment":
+        return event_type, f"you have new comment on {post.title[:11]}"
+    return event_type, f"{actors} started following you."
+
+
+def push_updates(touched, posts):
+    counts = unread.get_many(touched)
+    senders = User.objects.only("id", "username").in_bulk(
+        {group.sender_id for groups in touched.values() for group in groups}
+    )
+    for recipient_id, groups in touched.items():
+        unread_count = counts.get(recipient_id, 0)
+        if not groups:
+            payload = {
+                "type": "send_count_update",
+                "event_type": "count_update",
+                "unread_count": unread_count,
+            }
+        else:
+            group = groups[-1]
+            event_type, text = message(
+                group, senders.get(group.sender_id), posts.get(group.post_id)
+            )
+            if len(groups) > 1 or text is None:
+                text = f"you have {len(groups)} new notifications"
+            payload = {
+                "type": "send_notification",
+                "event_type": event_type,
+                "message": text,
+                "unread_count": unread_count,
+            }
+        event_log.publish(recipient_id, payload)
@@ -0,0 +1,10 @@
+from rest_framework.renderers import BaseRenderer
+
+
+class PostHTMLRenderer(BaseRenderer):
+    media_type = "text/html"
+    format = "html"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f"<article>{data or ''}</article>".encode(self.charset)
@@ -0,0 +1,278 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import NotificationActor, NotificationArchive, Notifications
+from . import unread
+
+READ_TTL = getattr(settings, "NOTIFICATION_READ_TTL", timedelta(days=30))
+UNREAD_TTL = getattr(settings, "NOTIFICATION_UNREAD_TTL", timedelta(days=90))
+BATCH_SIZE = getattr(settings, "NOTIFICATION_RETENTION_BATCH_SIZE", 1000)
+MAX_BATCHES = getattr(settings, "NOTIFICATION_RETENTION_MAX_BATCHES", 100)
+ARCHIVE = getattr(settings, "NOTIFICATION_ARCHIVE", False)
+PARTITION_MONTHS_AHEAD = 3
+
+TABLE = Notifications._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+ARCHIVE_TABLE = NotificationArchive._meta.db_table
+ACTOR_TABLE = NotificationActor._meta.db_table
+ARCHIVED_FIELDS = [
+    "id",
+    "recipient_id",
+    "sender_id",
+    "notification_type",
+    "post_id",
+    "comment_id",
+    "actor_count",
+    "is_read",
+    "created_at",
+]
+
+
+def expired(now=None):
+    now = now or timezone.now()
+    return Notifications.objects.filter(
+        Q(is_read=True, created_at__lt=now - READ_TTL)
+        | Q(created_at__lt=now - UNREAD_TTL)
+    )
+
+
+def prune(batch_size=BATCH_SIZE, max_batches=MAX_BATCHES, archive=ARCHIVE, now=None):
+    # Whole expired months go with their partition when the table is
+    # partitioned; the rest leaves in short transactions of batch_size rows,
+    # skipping rows the notification drain holds, so no lock is held for long.
+    now = now or timezone.now()
+    removed = 0
+    if is_partitioned():
+        ensure_partitions(now)
+        removed += drop_expired_partitions(now - max(READ_TTL, UNREAD_TTL), archive)
+
+    for _ in range(max_batches):
+        with transaction.atomic():
+            rows = list(
+                expired(now)
+                .select_for_update(skip_locked=True)
+                .order_by("created_at", "id")
+                .values(*ARCHIVED_FIELDS)[:batch_size]
+            )
+            if not rows:
+                break
+            if archive:
+                NotificationArchive.objects.bulk_create(
+                    [NotificationArchive(archived_at=now, **row) for row in rows],
+                    ignore_conflicts=True,
+                )
+            Notifications.objects.filter(id__in=[row["id"] for row in rows]).delete()
+            unread_rows = Counter(
+                row["recipient_id"] for row in rows if not row["is_read"]
+            )
+            unread.adjust_many({user_id: -n for user_id, n in unread_rows.items()})
+        removed += len(rows)
+        if len(rows) < batch_size:
+            break
+    return removed
+
+
+def storage_report():
+    report = {
+        "rows": Notifications.objects.count(),
+        "table_bytes": None,
+        "index_bytes": None,
+    }
+    if connection.vendor == "postgresql":
+        # pg_partition_tree also covers a plain table, as its only member
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT coalesce(sum(pg_table_size(relid)), 0),"
+                " coalesce(sum(pg_indexes_size(relid)), 0)"
+                " FROM pg_partition_tree(%s::regclass)",
+                [TABLE],
+            )
+            report["table_bytes"], report["index_bytes"] = cursor.fetchone()
+    return report
+
+
+def month_start(moment):
+    moment = moment.astimezone(dt_timezone.utc)
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(start):
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def partition_name(start):
+    return f"{TABLE}_{start:%Y_%m}"
+
+
+def is_partitioned():
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def partitions():
+    # {month start: partition name} for the monthly partitions of TABLE
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid"
+            " WHERE i.inhparent = %s::regclass",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    months = {}
+    for name in names:
+        try:
+            start = datetime.strptime(name[len(TABLE) + 1 :], "%Y_%m")
+        except ValueError:
+            continue
+        months[start.replace(tzinfo=dt_timezone.utc)] = name
+    return months
+
+
+def create_partitions(cursor, start, end):
+    # Each month is built next to the table and then attached, after moving in
+    # any of its rows that landed in the default partition meanwhile; a
+    # default partition holding rows for the range would block a plain
+    # CREATE TABLE ... PARTITION OF.
+    quote = connection.ops.quote_name
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {quote(DEFAULT_PARTITION)}"
+        f" PARTITION OF {quote(TABLE)} DEFAULT"
+    )
+    existing = set(partitions().values())
+    created = []
+    while start < end:
+        upper = next_month(start)
+        name = partition_name(start)
+        if name not in existing:
+            bounds = f"FROM ('{start.isoformat()}') TO ('{upper.isoformat()}')"
+            with transaction.atomic():
+                cursor.execute(
+                    f"CREATE TABLE {quote(name)}"
+                    f" (LIKE {quote(TABLE)} INCLUDING DEFAULTS)"
+                )
+                cursor.execute(
+                    f"WITH moved AS (DELETE FROM {quote(DEFAULT_PARTITION)}"
+                    " WHERE created_at >= %s AND created_at < %s RETURNING *)"
+                    f" INSERT INTO {quote(name)} SELECT * FROM moved",
+                    [start, upper],
+                )
+                cursor.execute(
+                    f"ALTER TABLE {quote(TABLE)} ATTACH PARTITION {quote(name)}"
+                    f" FOR VALUES {bounds}"
+                )
+            created.append(name)
+        start = upper
+    return created
+
+
+def horizon(now, months_ahead):
+    end = month_start(now)
+    for _ in range(months_ahead + 1):
+        end = next_month(end)
+    return end
+
+
+def ensure_partitions(now=None, months_ahead=PARTITION_MONTHS_AHEAD):
+    # rows past the last month go to the default partition until their month
+    # is created here
+    now = now or timezone.now()
+    with connection.cursor() as cursor:
+        return create_partitions(cursor, month_start(now), horizon(now, months_ahead))
+
+
+def drop_expired_partitions(cutoff, archive=ARCHIVE):
+    # a month whose end is before the cutoff only holds expired rows
+    quote = connection.ops.quote_name
+    dropped = 0
+    for start, name in sorted(partitions().items()):
+        if next_month(start) > cutoff:
+            break
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT recipient_id, count(*) FROM {quote(name)}"
+                " WHERE NOT is_read GROUP BY recipient_id"
+            )
+            unread.adjust_many({user_id: -n for user_id, n in cursor.fetchall()})
+            if archive:
+                columns = ", ".join(quote(field) for field in ARCHIVED_FIELDS)
+                cursor.execute(
+                    f"INSERT INTO {quote(ARCHIVE_TABLE)} ({columns}, archived_at)"
+                    f" SELECT {columns}, now() FROM {quote(name)}"
+                    " ON CONFLICT DO NOTHING"
+                )
+            # members have no foreign key to cascade through
+            cursor.execute(
+                f"DELETE FROM {quote(ACTOR_TABLE)} WHERE notification_id IN"
+                f" (SELECT id FROM {quote(name)})"
+            )
+            cursor.execute(f"SELECT count(*) FROM {quote(name)}")
+            dropped += cursor.fetchone()[0]
+            cursor.execute(f"DROP TABLE {quote(name)}")
+    return dropped
+
+
+def convert_to_partitioned(months_ahead=PARTITION_MONTHS_AHEAD):
+    # One-off: rebuild TABLE as a range-partitioned table on created_at.
+    # Rows are copied under the ACCESS EXCLUSIVE lock taken by the rename, so
+    # run it in a quiet window. The primary key becomes (id, created_at) and
+    # ids keep coming from a sequence that continues after the current max.
+    quote = connection.ops.quote_name
+    old = f"{TABLE}_unpartitioned"
+    sequence = f"{TABLE}_partitioned_id_seq"  # the old identity goes with its table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s"
+            " AND indexname NOT IN (SELECT conname FROM pg_constraint"
+            " WHERE conrelid = %s::regclass AND contype = 'p')",
+            [TABLE, TABLE],
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint"
+            " WHERE conrelid = %s::regclass AND contype IN ('f', 'c')",
+            [TABLE],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute("SELECT min(created_at), max(id) FROM " + quote(TABLE))
+        first, max_id = cursor.fetchone()
+
+        cursor.execute(f"ALTER TABLE {quote(TABLE)} RENAME TO {quote(old)}")
+        cursor.execute(
+            f"CREATE TABLE {quote(TABLE)} (LIKE {quote(old)} INCLUDING DEFAULTS)"
+            " PARTITION BY RANGE (created_at)"
+        )
+        cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {quote(sequence)}")
+        cursor.execute(
+            f"ALTER TABLE {quote(TABLE)} ALTER COLUMN id"
+            f" SET DEFAULT nextval('{sequence}')"
+        )
+        cursor.execute(f"ALTER SEQUENCE {quote(sequence)} OWNED BY {quote(TABLE)}.id")
+        if max_id:
+            cursor.execute("SELECT setval(%s, %s)", [sequence, max_id])
+        cursor.execute(f"ALTER TABLE {quote(TABLE)} ADD PRIMARY KEY (id, created_at)")
+
+        now = timezone.now()
+        created = create_partitions(
+            cursor, month_start(first or now), horizon(now, months_ahead)
+        )
+
+        cursor.execute(f"INSERT INTO {quote(TABLE)} SELECT * FROM {quote(old)}")
+        cursor.execute(f"DROP TABLE {quote(old)}")
+        for definition in indexes:
+            cursor.execute(definition)
+        for name, definition in constraints:
+            cursor.execute(
+                f"ALTER TABLE {quote(TABLE)} ADD CONSTRAINT {quote(name)} {definition}"
+            )
+    return created
@@ -0,0 +1,134 @@
+import json
+import zlib
+
+from django.conf import settings
+
+from .editorjs import blocks_of
+from .models import PostRevision
+
+# Every Nth revision stores the whole document; the ones in between store only
+# the blocks that changed, so rebuilding never replays more than N deltas.
+SNAPSHOT_INTERVAL = getattr(settings, "POST_REVISION_SNAPSHOT_INTERVAL", 20)
+
+
+class RevisionNotFound(Exception):
+    pass
+
+
+def encode(value):
+    return zlib.compress(json.dumps(value, separators=(",", ":")).encode())
+
+
+def decode(data):
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+def keyed_blocks(content):
+    keyed = []
+    seen = set()
+    for index, block in enumerate(blocks_of(content)):
+        key = block.get("id") or f"#{index}"
+        if key in seen:
+            key = f"{key}#{index}"
+        seen.add(key)
+        keyed.append((key, block))
+    return keyed
+
+
+def compute_delta(old, new):
+    # block order is stored as runs of old positions ([start, length]) mixed
+    # with the keys of new blocks, so a one-block edit stays a few bytes
+    old_keyed = keyed_blocks(old)
+    old_blocks = dict(old_keyed)
+    old_index = {key: index for index, (key, _) in enumerate(old_keyed)}
+
+    order = []
+    changed = {}
+    for key, block in keyed_blocks(new):
+        index = old_index.get(key)
+        if old_blocks.get(key) != block:
+            changed[key] = block
+            order.append(key)
+        elif order and isinstance(order[-1], list) and sum(order[-1]) == index:
+            order[-1][1] += 1
+        else:
+            order.append([index, 1])
+
+    meta = {
+        field: value
+        for field, value in (new or {}).items()
+        if field != "blocks" and (old or {}).get(field) != value
+    }
+    return {"order": order, "blocks": changed, "meta": meta}
+
+
+def apply_delta(old, delta):
+    old_blocks = [block for _, block in keyed_blocks(old)]
+    content = dict(old or {})
+    content.update(delta["meta"])
+
+    blocks = []
+    for segment in delta["order"]:
+        if isinstance(segment, list):
+            start, length = segment
+            blocks.extend(old_blocks[start : start + length])
+        else:
+            blocks.append(delta["blocks"][segment])
+    content["blocks"] = blocks
+    return content
+
+
+def record_revision(post, previous_content, editor=None):
+    # called with the post already saved at its new revision number
+    latest = post.revisions.order_by("-number").values_list("number", flat=True).first()
+    is_snapshot = (
+        latest is None
+        or latest != post.revision - 1
+        or (post.revision - 1) % SNAPSHOT_INTERVAL == 0
+    )
+    data = (
+        post.content if is_snapshot else compute_delta(previous_content, post.content)
+    )
+    return PostRevision.objects.create(
+        post=post,
+        number=post.revision,
+        is_snapshot=is_snapshot,
+        data=encode(data),
+        editor=editor,
+    )
+
+
+def rebuild(post, number):
+    base = (
+        post.revisions.filter(number__lte=number, is_snapshot=True)
+        .order_by("-number")
+        .first()
+    )
+    if base is None:
+        raise RevisionNotFound(number)
+
+    deltas = list(
+        post.revisions.filter(number__gt=base.number, number__lte=number)
+        .order_by("number")
+        .values_list("number", "data")
+    )
+    if (deltas[-1][0] if deltas else base.number) != number:
+        raise RevisionNotFound(number)
+
+    content = decode(base.data)
+    for _, data in deltas:
+        content = apply_delta(content, decode(data))
+    return content
+
+
+def diff(old, new):
+    old_blocks = dict(keyed_blocks(old))
+    new_blocks = dict(keyed_blocks(new))
+    common_old = [key for key in old_blocks if key in new_blocks]
+    common_new = [key for key in new_blocks if key in old_blocks]
+    return {
+        "added": [key for key in new_blocks if key not in old_blocks],
+        "removed": [key for key in old_blocks if key not in new_blocks],
+        "changed": [key for key in common_new if old_blocks[key] != new_blocks[key]],
+        "reordered": common_old != common_new,
+    }
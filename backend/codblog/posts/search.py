@@ -0,0 +1,389 @@
+import heapq
+import html
+import math
+import re
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchHeadline,
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramSimilarity,
+)
+from django.db.models import F, Func, Q, TextField, Value
+from django.utils.module_loading import import_string
+
+from . import editorjs
+from .models import Post
+
+SEARCH_CONFIG = getattr(settings, "POST_SEARCH_CONFIG", "english")
+MAX_RESULTS = getattr(settings, "POST_SEARCH_MAX_RESULTS", 200)
+MAX_QUERY_TERMS = 8
+REINDEX_BATCH_SIZE = 500
+# ts_headline marks matches with these private-use characters; the stored text
+# is escaped before they become <mark> tags (see render_headline)
+MARK_START, MARK_STOP = "\ue000", "\ue001"
+HIGHLIGHT = {"start_sel": MARK_START, "stop_sel": MARK_STOP}
+
+
+def tokenize(text):
+    return re.findall(r"\w+", (text or "").lower())
+
+
+def query_terms(text):
+    return tokenize(text)[:MAX_QUERY_TERMS]
+
+
+def post_fields(post):
+    return post.title, post.author.username, editorjs.document_text(post.content)
+
+
+def indexed_posts():
+    return (
+        Post.objects.select_related("author")
+        .only("id", "title", "content", "author__username")
+        .order_by("id")
+    )
+
+
+class SearchBackend:
+    # index/remove are called from the Post signals; search returns Post rows
+    # carrying title_highlight and excerpt_highlight
+    def index(self, post):
+        raise NotImplementedError
+
+    def remove(self, post_id):
+        raise NotImplementedError
+
+    def search(self, text, offset=0, limit=20):
+        raise NotImplementedError
+
+    def reindex(self, batch_size=REINDEX_BATCH_SIZE):
+        raise NotImplementedError
+
+
+def search_vector(title, author_name, body):
+    def part(text, weight, config=SEARCH_CONFIG):
+        return SearchVector(
+            Value(text or "", output_field=TextField()), weight=weight, config=config
+        )
+
+    # author names are not words, so they skip stemming
+    return part(title, "A") + part(author_name, "B", config="simple") + part(body, "C")
+
+
+def without_markers(field):
+    # a stored title containing the marker characters must not open a <mark>
+    return Func(
+        F(field),
+        Value(MARK_START + MARK_STOP),
+        Value(""),
+        function="translate",
+        output_field=TextField(),
+    )
+
+
+def render_headline(text):
+    # ts_headline hands back the stored text unescaped (titles and excerpts
+    # are html.unescape()d plain text), so escape everything first and only
+    # then turn the markers into tags, as highlight() does
+    escaped = html.escape(text or "", quote=False)
+    return escaped.replace(MARK_START, "<mark>").replace(MARK_STOP, "</mark>")
+
+
+def prefix_query(text):
+    # every term is matched as a prefix so results show up while typing
+    terms = query_terms(text)
+    if not terms:
+        return None
+    return SearchQuery(
+        " & ".join(f"{term}:*" for term in terms),
+        search_type="raw",
+        config=SEARCH_CONFIG,
+    )
+
+
+class PostgresSearchBackend(SearchBackend):
+    def index(self, post):
+        Post.objects.filter(pk=post.pk).update(
+            search_vector=search_vector(*post_fields(post))
+        )
+
+    def remove(self, post_id):
+        pass  # the vector lives on the deleted row
+
+    def search(self, text, offset=0, limit=20):
+        query = prefix_query(text)
+        if query is None or offset >= MAX_RESULTS:
+            return []
+        limit = min(limit, MAX_RESULTS - offset)
+
+        # the trigram branch catches typos the tsquery cannot match
+        posts = list(
+            Post.objects.for_list()
+            .filter(Q(search_vector=query) | Q(title__trigram_similar=text))
+            .annotate(
+                rank=SearchRank(F("search_vector"), query)
+                + TrigramSimilarity("title", text),
+                title_highlight=SearchHeadline(
+                    without_markers("title"),
+                    query,
+                    config=SEARCH_CONFIG,
+                    highlight_all=True,
+                    **HIGHLIGHT,
+                ),
+                excerpt_highlight=SearchHeadline(
+                    without_markers("excerpt"),
+                    query,
+                    config=SEARCH_CONFIG,
+                    min_words=15,
+                    max_words=35,
+                    **HIGHLIGHT,
+                ),
+            )
+            .order_by("-rank", "-id")[offset : offset + limit]
+        )
+        for post in posts:
+            post.title_highlight = render_headline(post.title_highlight)
+            post.excerpt_highlight = render_headline(post.excerpt_highlight)
+        return posts
+
+    def reindex(self, batch_size=REINDEX_BATCH_SIZE):
+        indexed = 0
+        batch = []
+        for post in indexed_posts().iterator(chunk_size=batch_size):
+            # bulk_update turns the expressions into one CASE per batch
+            post.search_vector = search_vector(*post_fields(post))
+            batch.append(post)
+            if len(batch) == batch_size:
+                indexed += Post.objects.bulk_update(batch, ["search_vector"])
+                batch = []
+        if batch:
+            indexed += Post.objects.bulk_update(batch, ["search_vector"])
+        return indexed
+
+
+class MemorySearchBackend(SearchBackend):
+    # Per-process inverted index scored with BM25, for development and tests
+    # where Postgres search is not available. Each term keeps two parallel
+    # arrays (sorted post ids, weighted term frequencies); fields are folded
+    # in BM25F style by counting a title term three times and an author term
+    # twice. The index loads itself from the database on first use.
+    K1 = 1.2
+    B = 0.75
+    FIELD_WEIGHTS = (3, 2, 1)  # title, author, body
+    PREFIX_POSTINGS_BUDGET = 200_000
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.postings = {}  # term -> (array of post ids, array of frequencies)
+            self.vocabulary = []  # sorted terms, for prefix expansion
+            self.doc_terms = {}  # post id -> terms, to unindex on change
+            self.doc_lengths = {}
+            self.total_length = 0
+
+    def ensure_loaded(self):
+        if self.loaded:
+            return
+        with self.lock:
+            if not self.loaded:
+                self.reindex()
+
+    def add_document(self, post_id, title, author_name, body):
+        frequencies = Counter()
+        for text, weight in zip((title, author_name, body), self.FIELD_WEIGHTS):
+            for term in tokenize(text):
+                frequencies[term] += weight
+
+        with self.lock:
+            self.remove_document(post_id)
+            for term, frequency in frequencies.items():
+                entry = self.postings.get(term)
+                if entry is None:
+                    entry = self.postings[term] = (array("I"), array("H"))
+                    insort(self.vocabulary, term)
+                ids, counts = entry
+                # ids almost always arrive in increasing order
+                if not ids or ids[-1] < post_id:
+                    position = len(ids)
+                else:
+                    position = bisect_left(ids, post_id)
+                ids.insert(position, post_id)
+                counts.insert(position, min(frequency, 0xFFFF))
+            length = sum(frequencies.values())
+            self.doc_terms[post_id] = tuple(frequencies)
+            self.doc_lengths[post_id] = length
+            self.total_length += length
+
+    def remove_document(self, post_id):
+        with self.lock:
+            terms = self.doc_terms.pop(post_id, None)
+            if terms is None:
+                return
+            self.total_length -= self.doc_lengths.pop(post_id)
+            for term in terms:
+                ids, counts = self.postings[term]
+                position = bisect_left(ids, post_id)
+                del ids[position]
+                del counts[position]
+                if not ids:
+                    del self.postings[term]
+                    del self.vocabulary[bisect_left(self.vocabulary, term)]
+
+    def expand(self, prefix):
+        start = bisect_left(self.vocabulary, prefix)
+        candidates = []
+        for index in range(start, len(self.vocabulary)):
+            term = self.vocabulary[index]
+            if not term.startswith(prefix):
+                break
+            candidates.append(term)
+
+        # the exact term first, then the most common completions until the
+        # posting budget is spent, so short prefixes stay cheap
+        candidates.sort(key=lambda term: (term != prefix, -len(self.postings[term][0])))
+        expansions = []
+        budget = self.PREFIX_POSTINGS_BUDGET
+        for term in candidates:
+            size = len(self.postings[term][0])
+            if expansions and size > budget:
+                break
+            expansions.append(term)
+            budget -= size
+        return expansions
+
+    def score(self, terms, top):
+        with self.lock:
+            document_count = len(self.doc_lengths)
+            if not document_count:
+                return []
+            average_length = self.total_length / document_count or 1
+            base = self.K1 * (1 - self.B)
+            per_length = self.K1 * self.B / average_length
+            lengths = self.doc_lengths
+
+            # rarest term first, so later terms only look up surviving posts
+            groups = sorted(
+                (self.expand(prefix) for prefix in terms),
+                key=lambda group: sum(len(self.postings[term][0]) for term in group),
+            )
+            matched = None
+            for group in groups:
+                scores = {}
+                for term in group:
+                    ids, counts = self.postings[term]
+                    idf = math.log(
+                        1 + (document_count - len(ids) + 0.5) / (len(ids) + 0.5)
+                    ) * (self.K1 + 1)
+                    if matched is not None and len(matched) * 8 < len(ids):
+                        pairs = self.lookup(ids, counts, matched)
+                    else:
+                        pairs = zip(ids, counts)
+                    for post_id, count in pairs:
+                        scores[post_id] = scores.get(post_id, 0.0) + idf * count / (
+                            count + base + per_length * lengths[post_id]
+                        )
+                # every term has to match, like the tsquery AND
+                if matched is None:
+                    matched = scores
+                else:
+                    matched = {
+                        post_id: score + scores[post_id]
+                        for post_id, score in matched.items()
+                        if post_id in scores
+                    }
+                if not matched:
+                    return []
+
+        return heapq.nlargest(top, matched.items(), key=lambda item: (item[1], item[0]))
+
+    @staticmethod
+    def lookup(ids, counts, post_ids):
+        for post_id in post_ids:
+            position = bisect_left(ids, post_id)
+            if position < len(ids) and ids[position] == post_id:
+                yield post_id, counts[position]
+
+    def index(self, post):
+        self.ensure_loaded()
+        self.add_document(post.pk, *post_fields(post))
+
+    def remove(self, post_id):
+        self.ensure_loaded()
+        self.remove_document(post_id)
+
+    def search(self, text, offset=0, limit=20):
+        terms = query_terms(text)
+        if not terms or offset >= MAX_RESULTS:
+            return []
+        limit = min(limit, MAX_RESULTS - offset)
+
+        self.ensure_loaded()
+        ranked = self.score(terms, offset + limit)[offset:]
+        posts = Post.objects.for_list().in_bulk([post_id for post_id, _ in ranked])
+
+        pattern = re.compile(
+            r"\b(%s\w*)" % "|".join(re.escape(term) for term in terms), re.IGNORECASE
+        )
+        results = []
+        for post_id, rank in ranked:
+            post = posts.get(post_id)
+            if post is None:
+                continue
+            post.rank = rank
+            post.title_highlight = highlight(pattern, post.title)
+            post.excerpt_highlight = highlight(pattern, post.excerpt)
+            results.append(post)
+        return results
+
+    def reindex(self, batch_size=REINDEX_BATCH_SIZE):
+        with self.lock:
+            self.clear()
+            indexed = 0
+            for post in indexed_posts().iterator(chunk_size=batch_size):
+                self.add_document(post.pk, *post_fields(post))
+                indexed += 1
+            self.loaded = True
+            return indexed
+
+    def memory_usage(self):
+        return sum(
+            ids.itemsize * len(ids) + counts.itemsize * len(counts)
+            for ids, counts in self.postings.values()
+        )
+
+
+def highlight(pattern, text):
+    # split() alternates plain text and matches; escape both before marking
+    return "".join(
+        (
+            f"<mark>{html.escape(part, quote=False)}</mark>"
+            if index % 2
+            else html.escape(part, quote=False)
+        )
+        for index, part in enumerate(pattern.split(text or ""))
+    )
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(
+            getattr(
+                settings, "POST_SEARCH_BACKEND", "posts.search.PostgresSearchBackend"
+            )
+        )()
+    return _backend
@@ -1,5 +1,9 @@
 from rest_framework import serializers
-from .models import Follow, Post, Comment
+from django.db.models import QuerySet
+from django.db.models.manager import BaseManager
+from .models import Follow, Post, Comment, Notifications, PostRevision
+from .viewer_state import resolve_viewer_state
+from . import like_buffer
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -11,12 +15,69 @@ class AuthorSerializer(serializers.ModelSerializer):
         fields = ["id", "username", "profile_image", "email"]
 
 
-class PostSerializer(serializers.ModelSerializer):
-    author = AuthorSerializer(read_only=True)
+class ViewerStateMixin(serializers.Serializer):
+    # Resolved once for the whole page being serialized; views may also pass a
+    # precomputed "viewer_state" in the context.
     is_liked = serializers.SerializerMethodField()
+    is_saved = serializers.SerializerMethodField()
+    author_is_following = serializers.SerializerMethodField()
+
+    def get_viewer_state(self):
+        state = self.context.get("viewer_state")
+        if state is None:
+            request = self.context.get("request")
+            posts = self.root.instance
+            if not isinstance(posts, (list, tuple, QuerySet)):
+                posts = [posts]
+            state = resolve_viewer_state(request.user if request else None, posts)
+            self.context["viewer_state"] = state
+        return state
+
+    def get_is_liked(self, obj):
+        return self.get_viewer_state().is_liked(obj)
+
+    def get_is_saved(self, obj):
+        return self.get_viewer_state().is_saved(obj)
+
+    def get_author_is_following(self, obj):
+        return self.get_viewer_state().is_following(obj.author_id)
+
+
+class PendingLikesListSerializer(serializers.ListSerializer):
+    # looks up the buffered likes of every post in the list with one call,
+    # whether the list is the response itself or nested under another object
+    def to_representation(self, data):
+        posts = list(data.all() if isinstance(data, BaseManager) else data)
+        if like_buffer.enabled():
+            pending = self.context.setdefault("pending_likes", {})
+            missing = [post for post in posts if post.pk not in pending]
+            if missing:
+                pending.update(like_buffer.pending(missing))
+        return super().to_representation(posts)
+
+
+class PendingLikesMixin(serializers.Serializer):
+    # adds likes still waiting in the write-behind buffer to Post.like; set
+    # Meta.list_serializer_class = PendingLikesListSerializer alongside it
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if "like" in data and like_buffer.enabled():
+            data["like"] += self.get_pending_likes(instance)
+        return data
+
+    def get_pending_likes(self, post):
+        pending = self.context.setdefault("pending_likes", {})
+        if post.pk not in pending:
+            pending.update(like_buffer.pending([post]))
+        return pending.get(post.pk, 0)
+
+
+class PostSerializer(PendingLikesMixin, ViewerStateMixin, serializers.ModelSerializer):
+    author = AuthorSerializer(read_only=True)
 
     class Meta:
         model = Post
+        list_serializer_class = PendingLikesListSerializer
         fields = [
             "id",
             "title",
@@ -25,70 +86,140 @@ class PostSerializer(serializers.ModelSerializer):
             "created_at",
             "updated_at",
             "like",
+            "comment_count",
+            "reply_count",
+            "excerpt",
+            "word_count",
+            "reading_time",
+            "cover_image",
+            "revision",
             "is_liked",
+            "is_saved",
+            "author_is_following",
+        ]
+        read_only_fields = [
+            "revision",
+            "like",
+            "comment_count",
+            "reply_count",
+            "excerpt",
+            "word_count",
+            "reading_time",
+            "cover_image",
         ]
-
-    def get_is_liked(self, obj):
-        request = self.context.get("request")
-        user = request.user if request else None
-
-        if user and user.is_authenticated:
-            return obj.liked_by.filter(id=user.id).exists()
-        return False
 
 
 class PostEditSerializer(serializers.ModelSerializer):
     class Meta:
         model = Post
-        fields = ["title", "content"]
+        fields = ["title", "content", "revision"]
+        read_only_fields = ["revision"]
+
 
+class PostPatchSerializer(serializers.Serializer):
+    base_revision = serializers.IntegerField(min_value=1)
+    ops = serializers.ListField(child=serializers.DictField(), allow_empty=False)
 
-class HomePostSerializer(serializers.ModelSerializer):
+
+class HomePostSerializer(
+    PendingLikesMixin, ViewerStateMixin, serializers.ModelSerializer
+):
     author = AuthorSerializer(read_only=True)
-    comment_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
-        fields = ["id", "author", "title", "like", "created_at", "comment_count"]
+        list_serializer_class = PendingLikesListSerializer
+        fields = [
+            "id",
+            "author",
+            "title",
+            "like",
+            "created_at",
+            "comment_count",
+            "reply_count",
+            "excerpt",
+            "word_count",
+            "reading_time",
+            "cover_image",
+            "is_liked",
+            "is_saved",
+            "author_is_following",
+        ]
+        read_only_fields = fields
+
 
-    def get_comment_count(self, obj):
-        return Comment.objects.filter(post=obj, parent=None).count()
+class SimplePostSerializer(PendingLikesMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Post
+        list_serializer_class = PendingLikesListSerializer
+        fields = [
+            "id",
+            "title",
+            "created_at",
+            "like",
+            "comment_count",
+            "reply_count",
+            "excerpt",
+            "reading_time",
+            "cover_image",
+        ]
+        read_only_fields = fields
 
 
-class SimplePostSerializer(serializers.ModelSerializer):
-    comment_count = serializers.SerializerMethodField()
+class PostRevisionSerializer(serializers.ModelSerializer):
+    editor_username = serializers.CharField(
+        source="editor.username", read_only=True, default=None
+    )
+    size = serializers.SerializerMethodField()
 
     class Meta:
-        model = Post
-        fields = ["id", "title", "created_at", "like", "comment_count"]
+        model = PostRevision
+        fields = ["number", "is_snapshot", "size", "editor_username", "created_at"]
 
-    def get_comment_count(self, obj):
-        return Comment.objects.filter(post=obj, parent=None).count()
+    def get_size(self, obj):
+        return len(obj.data)
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
-    posts = SimplePostSerializer(source="post_set", many=True, read_only=True)
+    # the posts themselves are paged through user-posts/<id>/
+    post_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
-        fields = ["id", "username", "email", "profile_image", "posts", "bio"]
+        fields = ["id", "username", "email", "profile_image", "post_count", "bio"]
 
+    def get_post_count(self, obj):
+        if hasattr(obj, "post_count"):
+            return obj.post_count
+        return obj.post_set.count()
 
-class PostSearchSerializer(serializers.ModelSerializer):
+
+class PostSearchSerializer(
+    PendingLikesMixin, ViewerStateMixin, serializers.ModelSerializer
+):
     author_username = serializers.CharField(source="author.username", read_only=True)
     author_first_name = serializers.CharField(
         source="author.first_name", read_only=True
     )
+    # <mark>-wrapped matches produced by the search query
+    title_highlight = serializers.CharField(read_only=True, default=None)
+    excerpt_highlight = serializers.CharField(read_only=True, default=None)
 
     class Meta:
         model = Post
+        list_serializer_class = PendingLikesListSerializer
         fields = [
             "id",
             "title",
+            "title_highlight",
+            "excerpt_highlight",
             "like",
             "created_at",
             "author_username",
             "author_first_name",
+            "is_liked",
+            "is_saved",
+            "author_is_following",
         ]
 
 
@@ -138,3 +269,62 @@ class CommentSerializer(serializers.ModelSerializer):
             data = obj.replies.all()
             return CommentSerializer(data, many=True).data
         return []
+
+
+class NotificationSenderSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ["id", "username", "profile_image"]
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    sender = NotificationSenderSerializer(read_only=True)
+    post_title = serializers.CharField(source="post.title", read_only=True)
+    comment_content = serializers.CharField(source="comment.comment", read_only=True)
+    actors = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Notifications
+        fields = [
+            "id",
+            "sender",
+            "notification_type",
+            "post",
+            "post_title",
+            "comment",
+            "comment_content",
+            "actor_count",
+            "actors",
+            "is_read",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = fields
+
+    def get_actors(self, obj):
+        # usernames of the recent actors, looked up once for the whole page
+        names = self.context.get("actor_names")
+        if names is None:
+            notifications = self.root.instance
+            if not isinstance(notifications, (list, tuple, QuerySet)):
+                notifications = [notifications]
+            actor_ids = {a for n in notifications for a in n.recent_actors}
+            names = dict(
+                User.objects.filter(id__in=actor_ids).values_list("id", "username")
+            )
+            self.context["actor_names"] = names
+        return [names[actor] for actor in obj.recent_actors if actor in names]
+
+
+class NotificationBulkActionSerializer(serializers.Serializer):
+    ACTIONS = ("mark_all_read", "mark_read", "mark_unread", "delete")
+
+    action = serializers.ChoiceField(choices=ACTIONS)
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), max_length=500, required=False
+    )
+
+    def validate(self, attrs):
+        if attrs["action"] != "mark_all_read" and not attrs.get("ids"):
+            raise serializers.ValidationError({"ids": "This action needs ids."})
+        return attrs
@@ -1,171 +1,249 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
 from django.db.models.signals import post_save, m2m_changed, post_delete
 from django.dispatch import receiver
-from .models import Comment, Follow, Post, Notifications
-from .tasks import create_notifications, send_notification_count
+from .models import Comment, Follow, Post
+from .tasks import (
+    backfill_timeline,
+    drain_notifications,
+    fan_out_post,
+)
+from . import cache as response_cache
+from . import like_buffer
+from . import notification_queue
+from . import search
+from . import suggest
+from . import timeline
 from django.contrib.auth import get_user_model
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+import logging
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+def bump_post_cache(post_id):
+    transaction.on_commit(lambda: response_cache.bump_post(post_id))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_cache(sender, instance, **kwargs):
+    bump_post_cache(instance.id)
+
+
+@receiver(post_save, sender=Post)
+def update_search_index(sender, instance, update_fields, **kwargs):
+    # counter and score updates leave the indexed text alone
+    if update_fields is None or {"title", "content"} & set(update_fields):
+        search.get_backend().index(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def touch_author_activity(sender, instance, created=None, origin=None, **kwargs):
+    # the public profile counts posts; edits leave it alone, and an author
+    # being deleted takes the row with them
+    if created is False:
+        return
+    if isinstance(origin, User) or getattr(origin, "model", None) is User:
+        return
+    User.objects.filter(pk=instance.author_id).update(last_activity_at=timezone.now())
+
+
+@receiver(post_delete, sender=Post)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.get_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def update_post_suggestions(sender, instance, update_fields, **kwargs):
+    # like changes reach the weights through suggest.refresh_post_weights
+    if update_fields is None or "title" in update_fields:
+        suggest.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_suggestions(sender, instance, **kwargs):
+    suggest.remove("post", instance.pk)
+
+
+@receiver(post_save, sender=User)
+def update_user_suggestions(sender, instance, update_fields, **kwargs):
+    # logins only write last_login
+    if update_fields is None or "username" in update_fields:
+        suggest.index_user(instance)
+
+
+@receiver(post_delete, sender=User)
+def remove_user_suggestions(sender, instance, **kwargs):
+    suggest.remove("user", instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def update_follower_weight(sender, instance, **kwargs):
+    suggest.index_user(instance.following)
 
 
 @receiver(post_save, sender=Comment)
-def notify_on_comment(sender, instance, created, **kwargs):
-    if created:
-        print("comment triggeredd....")
-        # not let post user get notifications
-        if instance.user != instance.post.author:
-            Notifications.objects.create(
-                recipient_id=instance.post.author.id,
-                sender=instance.user,
-                notification_type="comment",
-                post_id=instance.post.id,
-                comment_id=instance.id,
-            )
-            count = Notifications.objects.filter(
-                recipient=instance.post.author, is_read=False
-            ).count()
-            channel_layer = get_channel_layer()
-
-            async_to_sync(channel_layer.group_send)(
-                f"user_{instance.post.author.id}",
-                {
-                    "type": "send_notification",
-                    "event_type": "comment_notification",
-                    "message": f"you have new comment on {instance.post.title[:11]}",
-                    "unread_count": count,
-                },
-            )
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_post_cache(sender, instance, **kwargs):
+    bump_post_cache(instance.post_id)
+
+
+@receiver(m2m_changed, sender=Post.liked_by.through)
+def invalidate_like_post_cache(sender, instance, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_post_cache(instance.id)
+
+
+@receiver(m2m_changed, sender=Post.liked_by.through)
+def touch_post_activity_on_like(sender, instance, action, **kwargs):
+    # buffered likes touch the row when they are flushed
+    if action in ("post_add", "post_remove") and not like_buffer.enabled():
+        Post.objects.filter(pk=instance.id).update(last_activity_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Post.saved_by.through)
+def invalidate_viewer_on_save(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove"):
+        for user_id in {instance.pk} if reverse else pk_set:
+            response_cache.bump_viewer(user_id)
 
 
 @receiver(post_save, sender=Follow)
-def notify_on_follow(sender, instance, created, **kwargs):
-    if created:
+@receiver(post_delete, sender=Follow)
+def invalidate_viewer_on_follow(sender, instance, **kwargs):
+    response_cache.bump_viewer(instance.follower_id)
 
-        Notifications.objects.create(
-            recipient=instance.following,
-            sender=instance.follower,
-            notification_type="follow",
-        )
-        print(
-            f"✅ Notification created: {instance.follower} followed {instance.following}"
+
+def comment_counter_field(comment):
+    return "reply_count" if comment.parent_id else "comment_count"
+
+
+@receiver(post_save, sender=Comment)
+def update_post_on_comment_save(sender, instance, created, **kwargs):
+    updates = {"last_activity_at": timezone.now()}
+    if created:
+        field = comment_counter_field(instance)
+        updates[field] = F(field) + 1
+    Post.objects.filter(pk=instance.post_id).update(**updates)
+
+
+@receiver(post_delete, sender=Comment)
+def update_post_on_comment_delete(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Post) or getattr(origin, "model", None) is Post:
+        # the post row goes in the same delete
+        return
+    if isinstance(origin, Comment) and origin is not instance:
+        # a reply cascaded from a deleted comment; counted with that comment
+        return
+
+    field = comment_counter_field(instance)
+    updates = {
+        field: Greatest(F(field) - 1, Value(0)),
+        "last_activity_at": timezone.now(),
+    }
+    if isinstance(origin, Comment):
+        # the whole thread is already gone, so one recount covers its replies
+        replies = (
+            Comment.objects.filter(post=OuterRef("pk"), parent__isnull=False)
+            .order_by()
+            .values("post")
+            .annotate(total=Count("pk"))
+            .values("total")
         )
-        channel_layers = get_channel_layer()
-        count = Notifications.objects.filter(
-            recipient=instance.following, is_read=False
-        ).count()
-
-        async_to_sync(channel_layers.group_send)(
-            f"user_{instance.following.id}",
-            {
-                "type": "send_notification",
-                "event_type": "follow_notification",
-                "message": f"{instance.following.username} started following you.",
-                "unread_count": count,
-            },
+        updates["reply_count"] = Coalesce(Subquery(replies), Value(0))
+    Post.objects.filter(pk=instance.post_id).update(**updates)
+
+
+def schedule(task, *args):
+    # the row is already committed; a broker outage is logged and the
+    # repair_timelines beat job redoes the work
+    try:
+        task.delay(*args)
+    except Exception:
+        logger.exception("Could not schedule %s", task.name)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: schedule(fan_out_post, instance.id))
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline_on_follow(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(
+            lambda: schedule(
+                backfill_timeline, instance.follower_id, instance.following_id
+            )
         )
 
 
 @receiver(post_delete, sender=Follow)
-def remove_follow_notification(sender, instance, **kwargs):
+def trim_timeline_on_unfollow(sender, instance, **kwargs):
+    timeline.trim(instance.follower_id, instance.following_id)
+
+
+def queue_notification(**event):
+    # notification rows and pushes are written by drain_notifications after
+    # the response, in batches
+    def push():
+        notification_queue.push(event)
+        if notification_queue.claim_drain():
+            try:
+                drain_notifications.apply_async(
+                    countdown=notification_queue.DRAIN_DELAY
+                )
+            except Exception:
+                # the periodic drain picks the event up; the request that
+                # caused it should not fail over a broker outage
+                logger.exception("Could not schedule drain_notifications")
 
-    recipient_user = instance.following
+    transaction.on_commit(push)
 
-    deleted, _ = Notifications.objects.filter(
-        recipient=instance.following,
-        sender=instance.follower,
-        notification_type="follow",
-    ).delete()
 
-    channel_layers = get_channel_layer()
-    count = Notifications.objects.filter(
-        recipient=instance.following, is_read=False
-    ).count()
+@receiver(post_save, sender=Comment)
+def notify_on_comment(sender, instance, created, **kwargs):
+    if created:
+        # the post author is resolved by the consumer
+        queue_notification(
+            kind="comment",
+            sender=instance.user_id,
+            post=instance.post_id,
+            comment=instance.id,
+        )
 
-    print("🔁 Sending unfollow notification...")
 
-    async_to_sync(channel_layers.group_send)(
-        f"user_{recipient_user.id}",  # Notify the one who got unfollowed
-        {
-            "type": "send_count_update",
-            "event_type": "unfollow_notification",
-            "unread_count": count,
-        },
-    )
-    if deleted:
-        print(
-            f"Notification deleted : {instance.follower.username} unfollowed {instance.following}"
+@receiver(post_save, sender=Follow)
+def notify_on_follow(sender, instance, created, **kwargs):
+    if created:
+        queue_notification(
+            kind="follow", recipient=instance.following_id, sender=instance.follower_id
         )
 
 
+@receiver(post_delete, sender=Follow)
+def remove_follow_notification(sender, instance, **kwargs):
+    queue_notification(
+        kind="unfollow", recipient=instance.following_id, sender=instance.follower_id
+    )
+
+
 @receiver(m2m_changed, sender=Post.liked_by.through)
 def notify_on_like(sender, instance, action, pk_set, **kwargs):
-    print(f"post action trigged : {action}")
-    if action == "post_add":
+    if action in ("post_add", "post_remove"):
+        kind = "like" if action == "post_add" else "unlike"
         for user_id in pk_set:
-            user = User.objects.get(id=user_id)
-            exists = Notifications.objects.filter(
-                recipient=instance.author,
-                sender=user,
-                notification_type="like",
-                post=instance,
-            ).exists()
-
-            if not exists and instance.author != user:
-                print("like is created")
-                Notifications.objects.create(
-                    recipient_id=instance.author.id,
-                    sender_id=user.id,
-                    notification_type="like",
-                    post=instance,
+            # not let post user get notifications
+            if user_id != instance.author_id:
+                queue_notification(
+                    kind=kind,
+                    recipient=instance.author_id,
+                    sender=user_id,
+                    post=instance.id,
                 )
-                print("Calling celery task with recipient:", instance.author.id)
-
-                # create_notifications.delay(
-                #     recipient_id = instance.author.id,
-                #     sender_id = user.id ,
-                #     notification_type = 'like',
-                #     post_id = instance.id
-                # )
-
-                channel_layer = get_channel_layer()
-                count = Notifications.objects.filter(
-                    recipient=instance.author, is_read=False
-                ).count()
-                async_to_sync(channel_layer.group_send)(
-                    f"user_{instance.author.id}",
-                    {
-                        "type": "send_notification",
-                        "event_type": "like_notification",
-                        "message": f"{user.username} liked your post {instance.title}",
-                        "unread_count": count,
-                    },
-                )
-
-    if action == "post_remove":
-        for user_id in pk_set:
-            user = User.objects.get(id=user_id)
-
-            deleted = Notifications.objects.filter(
-                recipient=instance.author,
-                sender=user,
-                notification_type="like",
-                post=instance,
-            ).delete()
-
-        recipient_id = instance.author.id
-        count = Notifications.objects.filter(
-            recipient=recipient_id, is_read=False
-        ).count()
-        channel_layer = get_channel_layer()
-
-        group_name = f"user_{recipient_id}"
-        print(f"unlike notification got updated : {group_name}")
-        async_to_sync(channel_layer.group_send)(
-            group_name,
-            {
-                "type": "send_count_update",
-                "event_type": "count_update",
-                "unread_count": count,
-            },
-        )
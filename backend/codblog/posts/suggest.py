@@ -0,0 +1,132 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+
+from .models import Post, SuggestPrefix
+
+User = get_user_model()
+
+MAX_PREFIX_LENGTH = 20
+MAX_WORDS = 12
+LIMIT = 10
+CACHE_TIMEOUT = getattr(settings, "POST_SUGGEST_CACHE_TIMEOUT", 30)
+BATCH_SIZE = 2000
+
+
+def normalize(text):
+    return " ".join((text or "").lower().split())
+
+
+def edge_ngrams(label):
+    # prefixes starting at every word, so "tips" finds "django tips" too
+    label = normalize(label)
+    grams = set()
+    start = 0
+    for word in label.split(" ")[:MAX_WORDS]:
+        start = label.index(word, start)
+        tail = label[start : start + MAX_PREFIX_LENGTH]
+        grams.update(tail[:length].rstrip() for length in range(1, len(tail) + 1))
+        start += len(word)
+    grams.discard("")
+    return grams
+
+
+def rows_for(kind, object_id, label, weight):
+    return [
+        SuggestPrefix(
+            prefix=prefix, kind=kind, object_id=object_id, label=label, weight=weight
+        )
+        for prefix in edge_ngrams(label)
+    ]
+
+
+def index(kind, object_id, label, weight):
+    rows = SuggestPrefix.objects.filter(kind=kind, object_id=object_id)
+    current = rows.values_list("label", flat=True).first()
+    if current == label:
+        # likes and follows only move the weight
+        rows.exclude(weight=weight).update(weight=weight)
+        return
+    with transaction.atomic():
+        rows.delete()
+        SuggestPrefix.objects.bulk_create(rows_for(kind, object_id, label, weight))
+
+
+def index_post(post):
+    index("post", post.pk, post.title, post.like)
+
+
+def refresh_post_weights():
+    # Likes are counted with queryset updates that send no post_save, so post
+    # weights are synced in bulk on a schedule rather than per like; only
+    # rows whose weight moved are written.
+    like = Subquery(Post.objects.filter(pk=OuterRef("object_id")).values("like")[:1])
+    return (
+        SuggestPrefix.objects.filter(kind="post")
+        .exclude(weight=like)
+        .update(weight=like)
+    )
+
+
+def index_user(user):
+    index("user", user.pk, user.username, user.followers.count())
+
+
+def remove(kind, object_id):
+    SuggestPrefix.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def rebuild():
+    SuggestPrefix.objects.all().delete()
+    total = 0
+    batch = []
+    sources = (
+        ("post", Post.objects.values_list("id", "title", "like")),
+        (
+            "user",
+            User.objects.annotate(follower_count=Count("followers")).values_list(
+                "id", "username", "follower_count"
+            ),
+        ),
+    )
+    for kind, rows in sources:
+        for object_id, label, weight in rows.iterator(chunk_size=BATCH_SIZE):
+            batch.extend(rows_for(kind, object_id, label, weight))
+            total += 1
+            if len(batch) >= BATCH_SIZE:
+                SuggestPrefix.objects.bulk_create(batch)
+                batch = []
+    SuggestPrefix.objects.bulk_create(batch)
+    return total
+
+
+def suggest(text):
+    query = normalize(text)
+    if not query:
+        return []
+
+    key = f"posts:suggest:{hashlib.md5(query.encode()).hexdigest()}"
+    results = cache.get(key)
+    if results is not None:
+        return results
+
+    prefix = query[:MAX_PREFIX_LENGTH]
+    truncated = len(query) > len(prefix)
+    rows = (
+        SuggestPrefix.objects.filter(prefix=prefix)
+        .order_by("-weight", "label")
+        .values_list("kind", "object_id", "label")
+    )[: LIMIT * 3 if truncated else LIMIT]
+
+    results = [
+        {"type": kind, "id": object_id, "label": label}
+        for kind, object_id, label in rows
+        # the table stops at MAX_PREFIX_LENGTH, longer queries are checked here
+        if not truncated or query in normalize(label)
+    ][:LIMIT]
+    cache.set(key, results, CACHE_TIMEOUT)
+    return results
@@ -1,55 +1,81 @@
 from celery import shared_task  # type: ignore
 from django.contrib.auth import get_user_model
-from .models import Notifications, Comment, Post
-import time
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from .models import Post
+from . import (
+    event_log,
+    like_buffer,
+    notification_queue,
+    retention,
+    suggest,
+    timeline,
+    trending,
+    unread,
+)
 
 User = get_user_model()
 
 
 @shared_task
-def create_notifications(
-    recipient_id, sender_id, notification_type, post_id=None, comment_id=None
-):
-    time.sleep(1)
-    print("processing...")
-    time.sleep(1)
-    print("processing...")
-    recipient = User.objects.get(id=recipient_id)
-    sender = User.objects.get(id=sender_id)
-    notification_data = {
-        "recipient": recipient,
-        "sender": sender,
-        "notification_type": notification_type,
-    }
-
-    if post_id:
-        notification_data["post"] = Post.objects.get(id=post_id)
-
-    if comment_id:
-        notification_data["comment"] = Comment.objects.get(id=comment_id)
-    Notifications.objects.create(**notification_data)
+def drain_notifications():
+    return notification_queue.drain()
 
 
 @shared_task
 def send_notification_count(recipient_id):
     try:
-        count = Notifications.objects.filter(
-            recipient=recipient_id, is_read=False
-        ).count()
+        count = unread.get(recipient_id)
 
-        channel_layer = get_channel_layer()
-        group_name = f"user_{recipient_id}"
-
-        async_to_sync(channel_layer.group_send)(
-            group_name,
+        event_log.publish(
+            recipient_id,
             {
                 "type": "send_count_update",
                 "event_type": "count_update",
-                "count": count,
+                "unread_count": count,
             },
         )
 
     except Exception as e:
         print(f"[CELERY] Failed to send unlike count to {recipient_id}: {e}")
+
+
+@shared_task
+def fan_out_post(post_id):
+    try:
+        return timeline.fan_out_post(post_id)
+    except Post.DoesNotExist:
+        return 0
+
+
+@shared_task
+def backfill_timeline(user_id, author_id):
+    timeline.backfill(user_id, author_id)
+
+
+@shared_task
+def repair_timelines():
+    return timeline.repair()
+
+
+@shared_task
+def recompute_hot_scores():
+    return trending.recompute_hot_scores()
+
+
+@shared_task
+def refresh_suggest_weights():
+    return suggest.refresh_post_weights()
+
+
+@shared_task
+def flush_like_buffer():
+    return like_buffer.flush()
+
+
+@shared_task
+def reconcile_unread_counts():
+    return unread.reconcile()
+
+
+@shared_task
+def prune_notifications():
+    return retention.prune()
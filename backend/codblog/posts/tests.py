@@ -1,10 +1,86 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import (
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 from django.urls import reverse
+from django.utils import timezone
+
+from . import cache as response_cache
+from . import (
+    conditional,
+    editorjs,
+    event_log,
+    like_buffer,
+    notification_queue,
+    retention,
+    revisions,
+    search,
+    suggest,
+    timeline,
+    trending,
+    unread,
+)
+from .consumers import MAX_FRAME_EVENTS, NotificationConsumer
+from .middleware import JWTAuthMiddleware
+from .models import (
+    Comment,
+    Follow,
+    NotificationActor,
+    NotificationArchive,
+    NotificationCounter,
+    Notifications,
+    Post,
+    SavedPost,
+    TimelineEntry,
+)
+from .routing import websocket_urlpatterns
+from .serializers import HomePostSerializer
+from .views import ViewerStateView
 
 # Create your tests here.
 
 
+IN_MEMORY_CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "channels.layers.InMemoryChannelLayer",
+        "CONFIG": {"capacity": 1000},
+    }
+}
+
+
+def notification_socket(user, query="", token=None):
+    # connects the way the frontend does, with the access token in the query
+    token = AccessToken.for_user(user) if token is None else token
+    return WebsocketCommunicator(
+        JWTAuthMiddleware(URLRouter(websocket_urlpatterns)),
+        f"/ws/notifications/{user.id}/?token={token}{query}",
+    )
+
+
 class TestCreatePost(TestCase):
     def setUp(self):
 
@@ -13,3 +89,2067 @@ class TestCreatePost(TestCase):
 
     def testpost(self):
         posts = {"title": ""}
+
+
+class TestUserProfilePosts(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="writer", email="writer@example.com", password="pass"
+        )
+        for index in range(20):
+            Post.objects.create(author=self.user, title=f"post {index}", content={})
+        self.client = APIClient()
+
+    def test_profile_counts_posts_without_embedding_them(self):
+        response = self.client.get(f"/api/posts/public-profile/{self.user.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["post_count"], 20)
+        self.assertNotIn("posts", response.data[0])
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get("/api/posts/author-profile/")
+        self.assertEqual(response.data["post_count"], 20)
+        self.assertNotIn("posts", response.data)
+
+    def test_user_posts_are_paged_newest_first(self):
+        url = f"/api/posts/user-posts/{self.user.id}/?page_size=8"
+        titles = []
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.data["results"]), 8)
+            titles += [post["title"] for post in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(titles, [f"post {index}" for index in reversed(range(20))])
+
+    def test_user_posts_skip_the_document_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f"/api/posts/user-posts/{self.user.id}/")
+        post_queries = [
+            query["sql"] for query in queries if '"posts_post"' in query["sql"]
+        ]
+        self.assertTrue(post_queries)
+        for sql in post_queries:
+            self.assertNotIn('"content_html"', sql)
+            self.assertNotIn('"search_vector"', sql)
+
+
+class TestTimelinePull(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.reader = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+        self.celebrity = User.objects.create_user(
+            username="celebrity", email="celebrity@example.com", password="pass"
+        )
+        Follow.objects.create(follower=self.reader, following=self.celebrity)
+        limit = mock.patch.object(timeline, "FANOUT_FOLLOWER_LIMIT", 0)
+        limit.start()
+        self.addCleanup(limit.stop)
+        for key in ("pull-authors", "pull-throttle", "pulled-until"):
+            cache.delete(f"timeline:{key}:{self.reader.id}")
+
+    def pulled_titles(self):
+        return set(
+            TimelineEntry.objects.filter(user=self.reader).values_list(
+                "post__title", flat=True
+            )
+        )
+
+    def test_late_commit_is_pulled(self):
+        first = Post.objects.create(author=self.celebrity, title="first", content={})
+        timeline.pull_into_timeline(self.reader.id)
+        self.assertEqual(self.pulled_titles(), {"first"})
+
+        # created before "first" was pulled but committed after it
+        late = Post.objects.create(author=self.celebrity, title="late", content={})
+        Post.objects.filter(id=late.id).update(
+            created_at=first.created_at - timedelta(seconds=1)
+        )
+        cache.delete(f"timeline:pull-throttle:{self.reader.id}")
+        timeline.pull_into_timeline(self.reader.id)
+        self.assertEqual(self.pulled_titles(), {"first", "late"})
+
+    def test_pull_is_throttled_per_reader(self):
+        Post.objects.create(author=self.celebrity, title="first", content={})
+        timeline.pull_into_timeline(self.reader.id)
+        with self.assertNumQueries(0):
+            timeline.pull_into_timeline(self.reader.id)
+
+    def test_timeline_rows_skip_the_document_columns(self):
+        Post.objects.create(author=self.celebrity, title="first", content={})
+        entries = timeline.read_timeline(self.reader.id)
+        self.assertEqual([entry.post.title for entry in entries], ["first"])
+        self.assertTrue(
+            {"content", "content_html", "search_vector"}
+            <= entries[0].post.get_deferred_fields()
+        )
+
+
+class TestTimelineRepair(TestCase):
+    def setUp(self):
+        cache.delete(timeline.REPAIR_KEY)
+        User = get_user_model()
+        self.reader = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def entries(self):
+        return set(
+            TimelineEntry.objects.filter(user=self.reader).values_list(
+                "post__title", flat=True
+            )
+        )
+
+    def broker_down(self, task):
+        return mock.patch(
+            f"posts.signals.{task}.delay",
+            side_effect=ConnectionError("broker went away"),
+        )
+
+    def test_follow_survives_a_broker_outage(self):
+        Post.objects.create(author=self.author, title="older", content={})
+        with self.broker_down("backfill_timeline"), self.assertLogs(
+            "posts.signals", "ERROR"
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    "/api/posts/follow/", {"following": self.author.id}
+                )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.entries(), set())
+
+        self.assertEqual(timeline.repair(), 1)
+        self.assertEqual(self.entries(), {"older"})
+
+    def test_new_post_survives_a_broker_outage(self):
+        Follow.objects.create(follower=self.reader, following=self.author)
+        with self.broker_down("fan_out_post"), self.assertLogs(
+            "posts.signals", "ERROR"
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                Post.objects.create(author=self.author, title="new", content={})
+        self.assertEqual(self.entries(), set())
+
+        self.assertEqual(timeline.repair(), 1)
+        self.assertEqual(self.entries(), {"new"})
+        # fanned-out posts are not redone
+        self.assertEqual(timeline.repair(), 0)
+
+
+class TestKeysetCursor(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = get_user_model().objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        for index in range(3):
+            Post.objects.create(author=author, title=f"post {index}", content={})
+        self.client = APIClient()
+
+    def forged(self, ordering, position):
+        payload = json.dumps({"o": ordering, "p": position, "r": 0})
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def titles(self, response):
+        return [post["title"] for post in response.data["results"]]
+
+    def test_next_link_continues_the_sort(self):
+        response = self.client.get("/api/posts/list-posts/?page_size=2")
+        self.assertEqual(self.titles(response), ["post 2", "post 1"])
+        response = self.client.get(response.data["next"])
+        self.assertEqual(self.titles(response), ["post 0"])
+
+    def test_cursor_from_another_sort_is_rejected(self):
+        response = self.client.get("/api/posts/list-posts/?page_size=1")
+        cursor = parse_qs(urlparse(response.data["next"]).query)["cursor"][0]
+        response = self.client.get(
+            "/api/posts/list-posts/", {"sort": "trending", "cursor": cursor}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_malformed_cursor_values_are_rejected(self):
+        newest = ["-created_at", "-id"]
+        trending = ["-hot_score", "-id"]
+        cursors = {
+            "newest": [
+                self.forged(newest, ["garbage", 1]),
+                self.forged(newest, [1.5, 2]),
+                self.forged(newest, [None, None]),
+                self.forged(newest, ["2024-01-01T00:00:00+00:00", "x"]),
+                self.forged(newest, [{}, []]),
+                "not-base64!",
+            ],
+            "trending": [
+                self.forged(trending, ["garbage", 1]),
+                self.forged(trending, ["2024-01-01T00:00:00+00:00", 1]),
+            ],
+        }
+        for sort, tokens in cursors.items():
+            for token in tokens:
+                response = self.client.get(
+                    "/api/posts/list-posts/", {"sort": sort, "cursor": token}
+                )
+                self.assertEqual(response.status_code, 404, (sort, token))
+
+
+class TestSavedPosts(TestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        self.reader = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+        self.posts = [
+            Post.objects.create(author=self.author, title=f"post {index}", content={})
+            for index in range(6)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def save(self, post, minutes_ago):
+        SavedPost.objects.create(
+            post=post,
+            user=self.reader,
+            saved_at=timezone.now() - timedelta(minutes=minutes_ago),
+        )
+
+    def titles(self, response):
+        return [post["title"] for post in response.data["results"]]
+
+    def test_saves_are_listed_newest_first_across_pages(self):
+        # saved in a different order than the posts were written
+        for minutes_ago, index in enumerate([1, 4, 0, 3]):
+            self.save(self.posts[index], minutes_ago)
+        SavedPost.objects.create(post=self.posts[5], user=self.author)
+
+        response = self.client.get("/api/posts/save-post/?page_size=3")
+        self.assertEqual(self.titles(response), ["post 1", "post 4", "post 0"])
+        self.assertTrue(all(post["is_saved"] for post in response.data["results"]))
+        response = self.client.get(response.data["next"])
+        self.assertEqual(self.titles(response), ["post 3"])
+        self.assertIsNone(response.data["next"])
+
+    def test_toggle_saves_and_unsaves(self):
+        url = f"/api/posts/save-post/{self.posts[0].id}/"
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            self.titles(self.client.get("/api/posts/save-post/")), ["post 0"]
+        )
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data["saved"])
+        self.assertEqual(self.titles(self.client.get("/api/posts/save-post/")), [])
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        for minutes_ago, post in enumerate(self.posts):
+            self.save(post, minutes_ago)
+
+        counts = []
+        for page_size in (1, 6):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    "/api/posts/save-post/", {"page_size": page_size}
+                )
+            self.assertEqual(len(response.data["results"]), page_size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_anonymous_users_are_rejected(self):
+        self.assertEqual(APIClient().get("/api/posts/save-post/").status_code, 401)
+
+
+INITIAL_POSTS_MIGRATION = """from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    initial = True
+    dependencies = [migrations.swappable_dependency(settings.AUTH_USER_MODEL)]
+    operations = [
+        migrations.CreateModel(
+            name="Post",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                (
+                    "saved_by",
+                    models.ManyToManyField(
+                        blank=True,
+                        related_name="saved_posts",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
+"""
+
+
+TRIGRAM_INDEX_MIGRATION = """from django.contrib.postgres.indexes import GinIndex
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [("posts", "0001_initial")]
+    operations = [
+        migrations.AddIndex(
+            model_name="post",
+            index=GinIndex(fields=["id"], name="post_title_trgm_idx"),
+        ),
+    ]
+"""
+
+
+class MigrationCommandTestCase(TestCase):
+    command = None
+
+    def migrations_package(self, *modules):
+        # a throwaway posts migrations package holding the given modules
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        name = f"posts_migrations_{id(directory)}"
+        package = os.path.join(directory.name, name)
+        os.mkdir(package)
+        for filename, source in (("__init__.py", ""), *modules):
+            with open(os.path.join(package, filename), "w") as module:
+                module.write(source)
+        sys.path.insert(0, directory.name)
+        self.addCleanup(sys.path.remove, directory.name)
+        return name, package
+
+    def write(self, name):
+        stdout = StringIO()
+        with override_settings(MIGRATION_MODULES={"posts": name}):
+            call_command(self.command, stdout=stdout)
+        return stdout.getvalue()
+
+
+class TestWriteSavedPostMigration(MigrationCommandTestCase):
+    command = "write_savedpost_migration"
+
+    def test_writes_the_migration_after_the_leaf(self):
+        name, package = self.migrations_package(
+            ("0001_initial.py", INITIAL_POSTS_MIGRATION)
+        )
+        self.assertIn("Wrote", self.write(name))
+
+        with open(os.path.join(package, "0002_savedpost_through.py")) as migration:
+            source = migration.read()
+        self.assertIn("('posts', '0001_initial')", source)
+        self.assertIn("migrations.SeparateDatabaseAndState(", source)
+        self.assertIn("'db_table': 'posts_post_saved_by'", source)
+        self.assertIn("name='saved_at'", source)
+        self.assertIn("name='saved_post_user_idx'", source)
+
+        # the history now has SavedPost, so a second run writes nothing
+        self.assertIn("already in the migration history", self.write(name))
+        self.assertEqual(
+            sorted(os.listdir(package)),
+            ["0001_initial.py", "0002_savedpost_through.py", "__init__.py"],
+        )
+
+    def test_fresh_project_needs_only_makemigrations(self):
+        name, package = self.migrations_package()
+        with self.assertRaisesMessage(CommandError, "only needs makemigrations"):
+            self.write(name)
+
+
+class TestWriteTrigramMigration(MigrationCommandTestCase):
+    command = "write_trigram_migration"
+
+    def test_fresh_project_gets_the_extension_first(self):
+        name, package = self.migrations_package()
+        self.assertIn("Wrote", self.write(name))
+        with open(os.path.join(package, "0001_trigram_extension.py")) as migration:
+            source = migration.read()
+        self.assertIn("initial = True", source)
+        self.assertIn("django.contrib.postgres.operations.TrigramExtension(", source)
+
+        self.assertIn("already installs pg_trgm", self.write(name))
+        self.assertEqual(
+            sorted(os.listdir(package)), ["0001_trigram_extension.py", "__init__.py"]
+        )
+
+    def test_writes_the_migration_after_the_leaf(self):
+        name, package = self.migrations_package(
+            ("0001_initial.py", INITIAL_POSTS_MIGRATION)
+        )
+        self.write(name)
+        with open(os.path.join(package, "0002_trigram_extension.py")) as migration:
+            source = migration.read()
+        self.assertIn("('posts', '0001_initial')", source)
+        self.assertIn("TrigramExtension(", source)
+
+    def test_index_without_the_extension_is_reported(self):
+        name, package = self.migrations_package(
+            ("0001_initial.py", INITIAL_POSTS_MIGRATION),
+            ("0002_post_title_trgm_idx.py", TRIGRAM_INDEX_MIGRATION),
+        )
+        with self.assertRaisesMessage(CommandError, "add TrigramExtension()"):
+            self.write(name)
+
+
+class TestResponseCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = get_user_model().objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post = Post.objects.create(author=self.author, title="one", content={})
+        self.client = APIClient()
+
+    def test_list_is_cached_until_a_post_changes(self):
+        self.client.get("/api/posts/list-posts/")
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/posts/list-posts/")
+        self.assertEqual(len(response.data["results"]), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(author=self.author, title="two", content={})
+        response = self.client.get("/api/posts/list-posts/")
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_detail_cache_follows_edits(self):
+        url = f"/api/posts/show-post/{self.post.id}/"
+        self.client.get(url)
+        with self.assertNumQueries(1):  # only the conditional-GET stamp
+            self.assertEqual(self.client.get(url).data["title"], "one")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.title = "renamed"
+            self.post.save()
+        self.assertEqual(self.client.get(url).data["title"], "renamed")
+
+    def test_stale_entry_is_served_while_another_worker_rebuilds(self):
+        self.assertEqual(response_cache.cached_response("k", 1, lambda: "old"), "old")
+
+        cache.add("k:lock", 1)  # someone else is rebuilding version 2
+        rebuilt = mock.Mock(return_value="new")
+        self.assertEqual(response_cache.cached_response("k", 2, rebuilt), "old")
+        rebuilt.assert_not_called()
+
+        cache.delete("k:lock")
+        self.assertEqual(response_cache.cached_response("k", 2, rebuilt), "new")
+
+
+class TestConditionalGet(TestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        self.reader = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+        self.post = Post.objects.create(author=self.author, title="one", content={})
+        self.client = APIClient()
+
+    def revalidate(self, url):
+        etag = self.client.get(url)["ETag"]
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_resources_answer_304(self):
+        for url in (
+            f"/api/posts/show-post/{self.post.id}/",
+            f"/api/posts/public-profile/{self.author.id}/",
+            f"/api/posts/list-comment/{self.post.id}/",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.revalidate(url).status_code, 304)
+
+    def test_new_comment_changes_the_etag(self):
+        url = f"/api/posts/list-comment/{self.post.id}/"
+        etag = self.client.get(url)["ETag"]
+        Comment.objects.create(post=self.post, user=self.reader, comment="hi")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_profile_etag_follows_posts_and_the_user_row(self):
+        url = f"/api/posts/public-profile/{self.author.id}/"
+        etags = [self.client.get(url)["ETag"]]
+        Post.objects.create(author=self.author, title="two", content={})
+        etags.append(self.client.get(url)["ETag"])
+        self.post.delete()
+        etags.append(self.client.get(url)["ETag"])
+        self.author.bio = "new bio"
+        self.author.save()
+        etags.append(self.client.get(url)["ETag"])
+        self.assertEqual(len(set(etags)), 4)
+
+        # edits do not change the profile body
+        Post.objects.filter(title="two").get().save()
+        self.assertEqual(self.revalidate(url).status_code, 304)
+
+    def test_profile_stamp_is_one_lookup(self):
+        for index in range(5):
+            Post.objects.create(author=self.author, title=f"post {index}", content={})
+        request = mock.Mock(user=self.reader)
+        with self.assertNumQueries(1):
+            conditional.user_profile_stamp(request, self.author.id)
+
+    @override_settings(LIKE_WRITE_BEHIND=True)
+    def test_buffered_likes_change_the_detail_etag(self):
+        buffer = like_buffer.LocalLikeBuffer()
+        with mock.patch.object(like_buffer, "_buffer", buffer):
+            url = f"/api/posts/show-post/{self.post.id}/"
+            etag = self.client.get(url)["ETag"]
+            liker = APIClient()
+            liker.force_authenticate(self.reader)
+            with self.captureOnCommitCallbacks(execute=True):
+                liker.post(f"/api/posts/post-like/{self.post.id}/")
+            self.assertEqual(Post.objects.get(pk=self.post.pk).like, 0)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["like"], 1)
+            # the row has not moved, so no date that would allow a stale 304
+            self.assertFalse(response.has_header("Last-Modified"))
+
+    def test_viewer_specific_body_gets_its_own_etag(self):
+        url = f"/api/posts/show-post/{self.post.id}/"
+        anonymous = self.client.get(url)
+        self.client.force_authenticate(self.reader)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=anonymous["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Last-Modified"))
+
+
+class TestContentMetadata(TestCase):
+    def setUp(self):
+        self.author = get_user_model().objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+
+    def document(self, *blocks):
+        return {"blocks": [{"type": kind, "data": data} for kind, data in blocks]}
+
+    def test_summarize_counts_words_across_block_types(self):
+        content = self.document(
+            ("header", {"text": "A <b>bold</b> title", "level": 1}),
+            ("paragraph", {"text": "one two&nbsp;three"}),
+            ("list", {"items": ["four", {"content": "five", "items": ["six"]}]}),
+            ("quote", {"text": "seven", "caption": "eight"}),
+            ("code", {"code": "not counted"}),
+            ("image", {"file": {"url": "https://example.com/a.png"}, "caption": "x"}),
+            ("image", {"url": "https://example.com/b.png"}),
+        )
+        summary = editorjs.summarize(content)
+        self.assertEqual(summary["word_count"], 12)
+        self.assertEqual(summary["reading_time"], 1)
+        self.assertEqual(summary["excerpt"], "one two three")
+        self.assertEqual(summary["cover_image"], "https://example.com/a.png")
+        self.assertEqual(editorjs.extract_title(content), "A bold title")
+
+    def test_reading_time_rounds_up(self):
+        words = " ".join(["word"] * (editorjs.WORDS_PER_MINUTE + 1))
+        summary = editorjs.summarize(self.document(("paragraph", {"text": words})))
+        self.assertEqual(summary["reading_time"], 2)
+
+    def test_excerpt_skips_empty_paragraphs_and_cuts_on_a_word(self):
+        text = "word " * 100
+        excerpt = editorjs.extract_excerpt(
+            self.document(
+                ("paragraph", {"text": "<br>"}),
+                ("paragraph", {"text": text}),
+            )
+        )
+        self.assertLessEqual(len(excerpt), editorjs.EXCERPT_LENGTH + 1)
+        self.assertTrue(excerpt.endswith("word…"))
+
+    def test_malformed_content_summarizes_to_defaults(self):
+        for content in (None, [], {"blocks": None}, {"blocks": ["x", {"type": 1}]}):
+            with self.subTest(content=content):
+                self.assertEqual(
+                    editorjs.summarize(content),
+                    {
+                        "excerpt": "",
+                        "word_count": 0,
+                        "reading_time": 1,
+                        "cover_image": "",
+                    },
+                )
+                self.assertIsNone(editorjs.extract_title(content))
+
+    def test_header_only_fills_in_a_missing_title_on_create(self):
+        content = self.document(("header", {"text": "From the header"}))
+        kept = Post.objects.create(
+            author=self.author, title="Submitted", content=content
+        )
+        self.assertEqual(kept.title, "Submitted")
+        filled = Post.objects.create(author=self.author, title="", content=content)
+        self.assertEqual(filled.title, "From the header")
+
+        # edits keep following the first header
+        kept.content = self.document(("header", {"text": "Edited"}))
+        kept.save(update_fields=["content"])
+        kept.refresh_from_db()
+        self.assertEqual(kept.title, "Edited")
+
+    def test_rebuilding_content_keeps_titles(self):
+        post = Post.objects.create(
+            author=self.author,
+            title="Submitted",
+            content=self.document(
+                ("header", {"text": "Header"}), ("paragraph", {"text": "body"})
+            ),
+        )
+        Post.objects.filter(pk=post.pk).update(excerpt="", word_count=0)
+        call_command("rebuild_post_content", stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(
+            (post.title, post.excerpt, post.word_count), ("Submitted", "body", 2)
+        )
+
+
+class TestEditorJSSanitizer(TestCase):
+    def render(self, text):
+        return editorjs.render_html(
+            {"blocks": [{"type": "paragraph", "data": {"text": text}}]}
+        )
+
+    def test_unsafe_hrefs_are_dropped(self):
+        for href in (
+            "javascript:alert(1)",
+            " JavaScript:alert(1)",
+            "java\tscript:alert(1)",
+            "data:text/html;base64,PHNjcmlwdD4=",
+            "//evil.example",
+            "/\\evil.example",
+            "/\t/evil.example",
+            "\\\\evil.example",
+        ):
+            with self.subTest(href=href):
+                self.assertEqual(
+                    self.render(f'<a href="{href}">x</a>'),
+                    '<p><a rel="nofollow noopener">x</a></p>',
+                )
+
+        self.assertEqual(
+            self.render('<a href="/posts/1">x</a>'),
+            '<p><a href="/posts/1" rel="nofollow noopener">x</a></p>',
+        )
+
+    def test_event_handlers_and_unknown_attributes_are_dropped(self):
+        self.assertEqual(
+            self.render(
+                '<b onclick="alert(1)" style="color:red">bold</b>'
+                '<a href="https://example.com" onmouseover="alert(1)">link</a>'
+                '<img src="x" onerror="alert(1)">'
+            ),
+            '<p><b>bold</b><a href="https://example.com" rel="nofollow noopener">'
+            "link</a></p>",
+        )
+
+    def test_script_and_style_bodies_are_dropped(self):
+        self.assertEqual(
+            self.render(
+                "a<script>alert('<b>x</b>')</script>b<style>p{display:none}</style>c"
+            ),
+            "<p>abc</p>",
+        )
+
+    def test_nested_inline_markup(self):
+        self.assertEqual(
+            self.render("<b>bold <i>both <div>text</div></i> bold</b> plain"),
+            "<p><b>bold <i>both text</i> bold</b> plain</p>",
+        )
+        # unclosed and stray tags still produce balanced markup
+        self.assertEqual(self.render("<b><i>open"), "<p><b><i>open</i></b></p>")
+        self.assertEqual(self.render("text</i></b>"), "<p>text</p>")
+
+    def test_embeds_are_limited_to_known_hosts(self):
+        def embed(url):
+            return editorjs.render_embed(
+                {"embed": url, "source": "https://example.com/video"}
+            )
+
+        self.assertIn(
+            '<iframe src="https://www.youtube.com/embed/abc"',
+            embed("https://www.youtube.com/embed/abc"),
+        )
+        for url in (
+            "https://www.youtube.com.evil.example/embed/abc",
+            "javascript:alert(1)",
+            "//www.youtube.com/embed/abc",
+        ):
+            with self.subTest(url=url):
+                rendered = embed(url)
+                self.assertNotIn("<iframe", rendered)
+                self.assertIn('href="https://example.com/video"', rendered)
+
+    def test_html_format_serves_the_sanitized_document(self):
+        author = get_user_model().objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        post = Post.objects.create(
+            author=author,
+            title="post",
+            content={
+                "blocks": [
+                    {
+                        "type": "paragraph",
+                        "data": {
+                            "text": '<a href="javascript:alert(1)" onclick="x()">'
+                            "hi</a><script>alert(1)</script>"
+                        },
+                    }
+                ]
+            },
+        )
+        response = APIClient().get(f"/api/posts/show-post/{post.id}/?format=html")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/html; charset=utf-8")
+        self.assertEqual(
+            response.content.decode(),
+            '<article><p><a rel="nofollow noopener">hi</a></p></article>',
+        )
+
+        missing = APIClient().get("/api/posts/show-post/0/?format=html")
+        self.assertEqual(missing.status_code, 404)
+
+
+class TestBlockPatch(TestCase):
+    DOCUMENT = {
+        "blocks": [
+            {"id": "h", "type": "header", "data": {"text": "Title", "level": 1}},
+            {"id": "p", "type": "paragraph", "data": {"text": "body"}},
+        ]
+    }
+
+    def setUp(self):
+        User = get_user_model()
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        self.other = User.objects.create_user(
+            username="other", email="other@example.com", password="pass"
+        )
+        self.post = Post.objects.create(
+            author=self.author, title="Title", content=self.DOCUMENT
+        )
+        self.url = f"/api/posts/edit-post/{self.post.id}/"
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def patch(self, *ops, base_revision=1):
+        return self.client.patch(
+            self.url, {"base_revision": base_revision, "ops": list(ops)}, format="json"
+        )
+
+    def block_ids(self):
+        self.post.refresh_from_db()
+        return [block.get("id") for block in self.post.content["blocks"]]
+
+    def test_ops_apply_in_order_and_bump_the_revision(self):
+        response = self.patch(
+            {
+                "op": "replace",
+                "id": "h",
+                "block": {"type": "header", "data": {"text": "New", "level": 1}},
+            },
+            {"op": "insert", "after": "h", "block": {"id": "q", "type": "quote"}},
+            {"op": "move", "id": "p", "after": None},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"revision": 2, "title": "New"})
+        self.assertEqual(self.block_ids(), ["p", "h", "q"])
+        self.assertEqual(self.post.revisions.count(), 1)
+
+    def test_ops_without_an_id_are_rejected(self):
+        for op in (
+            {"op": "delete"},
+            {"op": "move", "after": "h"},
+            {"op": "replace", "block": {"type": "paragraph"}},
+            {"op": "insert", "block": {"type": "paragraph"}},
+            {"op": "delete", "id": 7},
+        ):
+            with self.subTest(op=op):
+                self.assertEqual(self.patch(op).status_code, 400)
+        self.assertEqual(self.block_ids(), ["h", "p"])
+
+    def test_stale_base_revision_conflicts(self):
+        self.patch({"op": "delete", "id": "p"})
+        response = self.patch({"op": "delete", "id": "h"})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["revision"], 2)
+
+    def test_only_the_author_can_edit(self):
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.patch({"op": "delete", "id": "p"}).status_code, 404)
+        response = self.client.put(self.url, {"content": {"blocks": []}}, format="json")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.block_ids(), ["h", "p"])
+
+
+class TestPostRevisions(TestCase):
+    def setUp(self):
+        self.author = get_user_model().objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        self.post = Post.objects.create(
+            author=self.author, title="draft", content=self.document(0)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    @staticmethod
+    def document(version):
+        blocks = [
+            {"id": f"b{index}", "type": "paragraph", "data": {"text": f"text {index}"}}
+            for index in range(10)
+        ]
+        blocks[version % 10]["data"]["text"] = f"edit {version}"
+        if version % 3 == 0:
+            blocks.reverse()
+        return {"time": version, "blocks": blocks[: 10 - version % 4]}
+
+    def test_delta_round_trip(self):
+        for version in range(1, 12):
+            old, new = self.document(version - 1), self.document(version)
+            delta = revisions.compute_delta(old, new)
+            self.assertEqual(revisions.apply_delta(old, delta), new)
+
+    def test_every_revision_rebuilds_with_bounded_snapshots(self):
+        with mock.patch.object(revisions, "SNAPSHOT_INTERVAL", 4):
+            for version in range(1, 11):
+                response = self.client.put(
+                    f"/api/posts/edit-post/{self.post.id}/",
+                    {"content": self.document(version)},
+                    format="json",
+                )
+                self.assertEqual(response.status_code, 200)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.revision, 11)
+        for number in range(2, 12):
+            self.assertEqual(
+                revisions.rebuild(self.post, number), self.document(number - 1)
+            )
+        self.assertEqual(
+            list(
+                self.post.revisions.filter(is_snapshot=True).values_list(
+                    "number", flat=True
+                )
+            ),
+            [2, 5, 9],
+        )
+        with self.assertRaises(revisions.RevisionNotFound):
+            revisions.rebuild(self.post, 12)
+
+    def test_diff_endpoint(self):
+        for version in (1, 2):
+            self.client.put(
+                f"/api/posts/edit-post/{self.post.id}/",
+                {"content": self.document(version)},
+                format="json",
+            )
+        response = self.client.get(
+            f"/api/posts/post-revisions/{self.post.id}/diff/?from=2&to=3"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["changed"], ["b1", "b2"])
+        self.assertEqual(response.data["removed"], ["b8"])
+        self.assertFalse(response.data["reordered"])
+
+
+class TestSearchHighlighting(TestCase):
+    # Editor.js stores markup escaped; the derived plain-text title is not
+    HOSTILE = "&lt;img src=x onerror=alert(1)&gt; hello world"
+
+    def setUp(self):
+        self.author = get_user_model().objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        self.post = Post.objects.create(
+            author=self.author,
+            title="",
+            content={
+                "blocks": [
+                    {"id": "h", "type": "header", "data": {"text": self.HOSTILE}},
+                    {"id": "p", "type": "paragraph", "data": {"text": self.HOSTILE}},
+                ]
+            },
+        )
+
+    def assert_escaped(self, post):
+        self.assertIn("<img", post.title)  # the raw title really is hostile
+        for field in (post.title_highlight, post.excerpt_highlight):
+            self.assertNotIn("<img", field)
+            self.assertIn("&lt;img", field)
+            self.assertIn("<mark>hello</mark>", field)
+
+    def test_memory_backend_escapes_highlights(self):
+        backend = search.MemorySearchBackend()
+        [post] = backend.search("hello")
+        self.assert_escaped(post)
+
+    @skipUnless(connection.vendor == "postgresql", "needs Postgres full-text search")
+    def test_postgres_backend_escapes_highlights(self):
+        backend = search.PostgresSearchBackend()
+        backend.index(self.post)
+        [post] = backend.search("hello")
+        self.assert_escaped(post)
+
+    def test_headline_is_escaped_before_marking(self):
+        self.assertEqual(
+            search.render_headline("<b>\ue000a\ue001</b>"),
+            "&lt;b&gt;<mark>a</mark>&lt;/b&gt;",
+        )
+
+
+class TestMemorySearch(TestCase):
+    def setUp(self):
+        backend = mock.patch.object(search, "_backend", search.MemorySearchBackend())
+        backend.start()
+        self.addCleanup(backend.stop)
+        self.author = get_user_model().objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        self.client = APIClient()
+
+    def create(self, title, body=""):
+        return Post.objects.create(
+            author=self.author,
+            title=title,
+            content={
+                "blocks": [
+                    {"id": "p", "type": "paragraph", "data": {"text": body}},
+                ]
+            },
+        )
+
+    def titles(self, query, **params):
+        response = self.client.get("/api/posts/search/", {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [post["title"] for post in response.data["results"]]
+
+    def test_title_matches_rank_above_body_matches(self):
+        self.create("Gardening notes", "a post that mentions python once")
+        self.create("Python tips", "short")
+        self.create("Cooking", "nothing relevant")
+        self.assertEqual(self.titles("python"), ["Python tips", "Gardening notes"])
+
+    def test_terms_match_as_prefixes_and_all_must_match(self):
+        self.create("Python tips", "about decorators")
+        self.create("Python packaging")
+        self.assertEqual(self.titles("pyth deco"), ["Python tips"])
+
+    def test_index_follows_edits_and_deletes(self):
+        post = self.create("Python tips")
+        self.assertEqual(self.titles("python"), ["Python tips"])
+
+        post.content = {
+            "blocks": [{"id": "h", "type": "header", "data": {"text": "Rust"}}]
+        }
+        post.save()
+        self.assertEqual(self.titles("python"), [])
+        self.assertEqual(self.titles("rust"), ["Rust"])
+
+        post.delete()
+        self.assertEqual(self.titles("rust"), [])
+
+    def test_results_are_paged(self):
+        for index in range(5):
+            self.create(f"Python {index}")
+        response = self.client.get("/api/posts/search/?q=python&page_size=2&page=3")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNone(response.data["next"])
+        self.assertIsNotNone(response.data["previous"])
+
+
+class TestSuggest(TestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.author = User.objects.create_user(
+            username="djangonaut", email="author@example.com", password="pass"
+        )
+        self.reader = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+        self.tips = Post.objects.create(
+            author=self.author, title="Django tips", content={}
+        )
+        self.tricks = Post.objects.create(
+            author=self.author, title="Django tricks", content={}
+        )
+        self.client = APIClient()
+
+    def labels(self, query):
+        cache.clear()
+        return [item["label"] for item in suggest.suggest(query)]
+
+    def test_prefixes_match_at_every_word(self):
+        self.assertEqual(self.labels("tri"), ["Django tricks"])
+        self.assertEqual(
+            sorted(self.labels("djang")), ["Django tips", "Django tricks", "djangonaut"]
+        )
+
+    def test_like_weights_catch_up_on_refresh(self):
+        self.client.force_authenticate(self.reader)
+        self.client.post(f"/api/posts/post-like/{self.tricks.id}/")
+        self.assertEqual(self.labels("django t"), ["Django tips", "Django tricks"])
+
+        self.assertEqual(
+            suggest.refresh_post_weights(), len(suggest.edge_ngrams("Django tricks"))
+        )
+        self.assertEqual(self.labels("django t"), ["Django tricks", "Django tips"])
+        self.assertEqual(suggest.refresh_post_weights(), 0)
+
+    def test_renamed_post_is_reindexed(self):
+        self.tips.title = "Flask tips"
+        self.tips.save()
+        self.assertEqual(self.labels("flask"), ["Flask tips"])
+        self.assertEqual(self.labels("django t"), ["Django tricks"])
+
+
+@override_settings(LIKE_WRITE_BEHIND=True)
+class TestLikeWriteBehind(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.buffer = like_buffer.LocalLikeBuffer()
+        patcher = mock.patch.object(like_buffer, "_buffer", self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        User = get_user_model()
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        self.reader = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+        self.posts = [
+            Post.objects.create(author=self.author, title=f"post {index}", content={})
+            for index in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        with self.captureOnCommitCallbacks(execute=True):
+            for post in self.posts:
+                self.client.post(f"/api/posts/post-like/{post.id}/")
+
+    def stored_likes(self):
+        return list(Post.objects.order_by("id").values_list("like", flat=True))
+
+    def test_pending_likes_are_shown_before_the_flush(self):
+        self.assertEqual(self.stored_likes(), [0, 0, 0])
+        with mock.patch.object(
+            self.buffer, "pending", wraps=self.buffer.pending
+        ) as pending:
+            response = self.client.get(f"/api/posts/user-posts/{self.author.id}/")
+        self.assertEqual([post["like"] for post in response.data["results"]], [1, 1, 1])
+        pending.assert_called_once()
+
+    def test_flush_applies_each_batch_once(self):
+        with mock.patch.object(
+            self.buffer, "release", side_effect=ConnectionError("redis went away")
+        ):
+            with self.assertRaises(ConnectionError):
+                like_buffer.flush()
+        self.assertEqual(self.stored_likes(), [1, 1, 1])
+        cache.delete(like_buffer.FLUSH_LOCK_KEY)
+
+        # the batch is still claimed, but its LikeFlush row says it is applied
+        self.assertEqual(like_buffer.flush(), 0)
+        self.assertEqual(self.stored_likes(), [1, 1, 1])
+        post = Post.objects.get(pk=self.posts[0].id)
+        self.assertEqual(like_buffer.pending([post]), {post.id: 0})
+
+    def test_applied_batch_is_not_counted_twice_before_release(self):
+        url = f"/api/posts/user-posts/{self.author.id}/"
+        with mock.patch.object(self.buffer, "release"):
+            like_buffer.flush()
+        # committed, still claimed in the buffer
+        self.assertEqual(self.stored_likes(), [1, 1, 1])
+        self.assertIsNotNone(self.buffer.inflight)
+        response = self.client.get(url)
+        self.assertEqual([post["like"] for post in response.data["results"]], [1, 1, 1])
+
+        # a row read before the commit does not have the batch yet
+        post = Post.objects.get(pk=self.posts[0].pk)
+        post.like, post.last_like_flush = 0, ""
+        self.assertEqual(like_buffer.pending([post]), {post.pk: 1})
+
+    def test_rebuilding_counters_drains_the_buffer_first(self):
+        call_command("rebuild_post_counters", stdout=StringIO())
+        self.assertEqual(self.stored_likes(), [1, 1, 1])
+        self.assertEqual(like_buffer.flush(), 0)
+        self.assertEqual(self.stored_likes(), [1, 1, 1])
+
+        cache.add(like_buffer.FLUSH_LOCK_KEY, 1)
+        with mock.patch.object(like_buffer.time, "sleep"), mock.patch.object(
+            like_buffer.time, "monotonic", side_effect=[0, 0, 100]
+        ):
+            with self.assertRaisesMessage(CommandError, "still running"):
+                call_command("rebuild_post_counters", stdout=StringIO())
+
+    def test_failed_write_keeps_the_batch(self):
+        with mock.patch.object(
+            Post.objects, "filter", side_effect=RuntimeError("database went away")
+        ):
+            with self.assertRaises(RuntimeError):
+                like_buffer.flush()
+        self.assertEqual(self.stored_likes(), [0, 0, 0])
+        self.buffer.add(self.posts[0].id, 1)  # a like arriving meanwhile
+
+        self.assertEqual(like_buffer.flush(), 3)
+        self.assertEqual(self.stored_likes(), [1, 1, 1])
+        self.assertEqual(like_buffer.flush(), 1)
+        self.assertEqual(self.stored_likes(), [2, 1, 1])
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class TestNotificationDrain(TestCase):
+    def setUp(self):
+        cache.clear()
+        event_log._log = None
+        self.queue = notification_queue.LocalEventQueue()
+        patcher = mock.patch.object(notification_queue, "_queue", self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        User = get_user_model()
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        self.readers = [
+            User.objects.create_user(
+                username=f"reader{index}",
+                email=f"reader{index}@example.com",
+                password="pass",
+            )
+            for index in range(5)
+        ]
+        self.post = Post.objects.create(author=self.author, title="post", content={})
+
+    def push(self, kind, sender, **event):
+        notification_queue.push(
+            {"kind": kind, "recipient": self.author.id, "sender": sender.id, **event}
+        )
+
+    def test_flapping_toggles_net_out(self):
+        first, second = self.readers[:2]
+        for kind in ("like", "unlike", "like"):
+            self.push(kind, first, post=self.post.id)
+        for kind in ("like", "unlike"):
+            self.push(kind, second, post=self.post.id)
+        self.push("follow", second)
+        self.push("unfollow", second)
+
+        self.assertEqual(notification_queue.drain(), 7)
+        group = Notifications.objects.get()
+        self.assertEqual(group.notification_type, "like")
+        self.assertEqual(group.actor_count, 1)
+        self.assertEqual(group.recent_actors, [first.id])
+
+    def test_events_are_processed_in_batches(self):
+        for reader in self.readers:
+            self.push("follow", reader)
+
+        with mock.patch.object(notification_queue, "BATCH_SIZE", 2), mock.patch.object(
+            notification_queue, "process", wraps=notification_queue.process
+        ) as process:
+            self.assertEqual(notification_queue.drain(), 5)
+        self.assertEqual(
+            [len(call.args[0]) for call in process.call_args_list], [2, 2, 1]
+        )
+        self.assertEqual(Notifications.objects.get().actor_count, 5)
+
+    def test_failed_batch_is_kept_for_the_next_drain(self):
+        for reader in self.readers[:2]:
+            self.push("follow", reader)
+
+        with mock.patch.object(
+            notification_queue,
+            "process",
+            side_effect=RuntimeError("database went away"),
+        ):
+            with self.assertRaises(RuntimeError):
+                notification_queue.drain()
+        self.assertFalse(Notifications.objects.exists())
+
+        self.assertEqual(notification_queue.drain(), 2)
+        self.assertEqual(Notifications.objects.get().actor_count, 2)
+        self.assertEqual(notification_queue.drain(), 0)
+
+    def test_unlike_leaves_the_group_the_like_went_to(self):
+        first, second = self.readers[:2]
+        self.push("like", first, post=self.post.id)
+        notification_queue.drain()
+        old_group = Notifications.objects.get()
+        Notifications.objects.filter(pk=old_group.pk).update(
+            created_at=old_group.created_at - timedelta(days=2)
+        )
+        self.push("like", second, post=self.post.id)
+        notification_queue.drain()
+
+        self.push("unlike", first, post=self.post.id)
+        notification_queue.drain()
+        group = Notifications.objects.get()
+        self.assertNotEqual(group.pk, old_group.pk)
+        self.assertEqual(group.actor_count, 1)
+        self.assertEqual(
+            list(
+                NotificationActor.objects.filter(notification=group).values_list(
+                    "actor_id", flat=True
+                )
+            ),
+            [second.id],
+        )
+
+        # the actor is gone from every group, so a repeat is a no-op
+        self.push("unlike", first, post=self.post.id)
+        notification_queue.drain()
+        self.assertEqual(Notifications.objects.get().actor_count, 1)
+
+    def test_unlikes_refill_recent_actors_and_sender(self):
+        first = self.readers[0]
+        for reader in self.readers[:4]:
+            self.push("like", reader, post=self.post.id)
+        notification_queue.drain()
+        for reader in self.readers[1:4]:
+            self.push("unlike", reader, post=self.post.id)
+        notification_queue.drain()
+        group = Notifications.objects.get()
+        self.assertEqual(group.actor_count, 1)
+        self.assertEqual(group.recent_actors, [first.id])
+        self.assertEqual(group.sender_id, first.id)
+
+    def test_repeat_actors_are_counted_once(self):
+        for reader in self.readers[:4] + self.readers[:1]:
+            comment = Comment.objects.create(
+                post=self.post, user=reader, comment="nice"
+            )
+            self.push("comment", reader, post=self.post.id, comment=comment.id)
+        notification_queue.drain()
+        group = Notifications.objects.get()
+        self.assertEqual(group.actor_count, 4)
+        self.assertEqual(len(group.recent_actors), notification_queue.RECENT_ACTORS)
+        self.assertEqual(group.recent_actors[0], self.readers[0].id)
+
+        # a batch drained twice leaves the counts where they were
+        for _ in range(2):
+            self.push("follow", self.readers[1])
+            notification_queue.drain()
+        self.assertEqual(
+            Notifications.objects.get(notification_type="follow").actor_count, 1
+        )
+
+    def test_broker_outage_does_not_fail_the_request(self):
+        client = APIClient()
+        client.force_authenticate(self.readers[0])
+        with mock.patch(
+            "posts.signals.drain_notifications.apply_async",
+            side_effect=ConnectionError("broker went away"),
+        ), self.assertLogs("posts.signals", "ERROR"):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.post(f"/api/posts/post-like/{self.post.id}/")
+        self.assertEqual(response.status_code, 200)
+
+        # the beat drain still finds the event
+        self.assertEqual(notification_queue.drain(), 1)
+        self.assertEqual(Notifications.objects.get().notification_type, "like")
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class TestUnreadCounter(TestCase):
+    def setUp(self):
+        cache.clear()
+        event_log._log = None
+        patcher = mock.patch.object(
+            notification_queue, "_queue", notification_queue.LocalEventQueue()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        User = get_user_model()
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        self.readers = [
+            User.objects.create_user(
+                username=f"reader{index}",
+                email=f"reader{index}@example.com",
+                password="pass",
+            )
+            for index in range(2)
+        ]
+        self.post = Post.objects.create(author=self.author, title="post", content={})
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def stored_count(self):
+        return NotificationCounter.objects.get(user=self.author).unread
+
+    def toggle(self, kind, reader):
+        notification_queue.push(
+            {
+                "kind": kind,
+                "recipient": self.author.id,
+                "sender": reader.id,
+                "post": self.post.id,
+            }
+        )
+        notification_queue.drain()
+
+    def add_notification(self, **fields):
+        return Notifications.objects.create(
+            recipient=self.author,
+            sender=self.readers[0],
+            notification_type="follow",
+            **fields,
+        )
+
+    def action(self, notification, action):
+        return self.client.post(
+            f"/api/posts/notification-actions/{notification.id}/",
+            {"action": action},
+            format="json",
+        )
+
+    def test_drain_moves_the_counter(self):
+        first, second = self.readers
+        self.toggle("like", first)
+        self.assertEqual(self.stored_count(), 1)
+        # a second actor joins the same group
+        self.toggle("like", second)
+        self.assertEqual(self.stored_count(), 1)
+
+        self.toggle("unlike", first)
+        self.assertEqual(self.stored_count(), 1)
+        self.toggle("unlike", second)
+        self.assertEqual(self.stored_count(), 0)
+        self.assertFalse(Notifications.objects.exists())
+
+    def test_repeated_actions_move_the_counter_once(self):
+        notification = self.add_notification()
+        other = self.add_notification()
+        self.assertEqual(unread.get(self.author.id), 2)
+
+        for _ in range(2):
+            self.assertEqual(self.action(notification, "mark_read").status_code, 200)
+        self.assertEqual(self.stored_count(), 1)
+
+        for _ in range(2):
+            self.assertEqual(self.action(notification, "mark_unread").status_code, 200)
+        self.assertEqual(self.stored_count(), 2)
+
+        self.assertEqual(self.action(notification, "delete").status_code, 200)
+        self.assertEqual(self.action(notification, "delete").status_code, 404)
+        self.assertEqual(self.stored_count(), 1)
+
+        self.action(other, "mark_read")
+        self.action(other, "delete")
+        self.assertEqual(self.stored_count(), 0)
+
+    def test_missing_counter_is_seeded_from_the_rows(self):
+        self.add_notification()
+        self.add_notification(is_read=True)
+        self.add_notification()
+        self.assertFalse(NotificationCounter.objects.exists())
+
+        self.assertEqual(unread.get(self.author.id), 2)
+        self.assertEqual(self.stored_count(), 2)
+
+    def test_reconcile_fixes_drift(self):
+        self.add_notification()
+        unread.get(self.author.id)
+        NotificationCounter.objects.filter(user=self.author).update(unread=7)
+        unread.get(self.readers[0].id)  # a counter that is already right
+
+        self.assertEqual(unread.reconcile(batch_size=1), 1)
+        self.assertEqual(self.stored_count(), 1)
+        self.assertEqual(unread.reconcile(), 0)
+
+
+class TestNotificationInbox(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+        self.other = User.objects.create_user(
+            username="other", email="other@example.com", password="pass"
+        )
+        post = Post.objects.create(author=self.user, title="post", content={})
+        self.notifications = [
+            Notifications.objects.create(
+                recipient=self.user,
+                sender=self.other,
+                notification_type=notification_type,
+                post=post if notification_type == "like" else None,
+                recent_actors=[self.other.id],
+                is_read=index in (1, 2),
+            )
+            for index, notification_type in enumerate(
+                ["like", "follow", "like", "follow", "like"]
+            )
+        ]
+        self.foreign = Notifications.objects.create(
+            recipient=self.other, sender=self.user, notification_type="follow"
+        )
+        unread.get(self.user.id)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def ids(self, response):
+        return [notification["id"] for notification in response.data["results"]]
+
+    def bulk(self, action, ids=None):
+        data = {"action": action}
+        if ids is not None:
+            data["ids"] = ids
+        return self.client.post("/api/posts/notifications/bulk/", data, format="json")
+
+    def test_pages_through_own_notifications(self):
+        seen = []
+        url = "/api/posts/notifications/?page_size=2"
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        while True:
+            self.assertEqual(response.data["unread_count"], 3)
+            seen += self.ids(response)
+            if not response.data["next"]:
+                break
+            response = self.client.get(response.data["next"])
+
+        newest_first = [n.id for n in reversed(self.notifications)]
+        self.assertEqual(seen, newest_first)
+        self.assertEqual(response.data["results"][0]["actors"], ["other"])
+
+    def test_filters(self):
+        response = self.client.get("/api/posts/notifications/?unread=1&type=like")
+        self.assertEqual(
+            self.ids(response), [self.notifications[4].id, self.notifications[0].id]
+        )
+        response = self.client.get("/api/posts/notifications/?type=mention")
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_authentication(self):
+        self.assertEqual(APIClient().get("/api/posts/notifications/").status_code, 401)
+
+    def test_bulk_actions(self):
+        first, second = self.notifications[:2]
+        response = self.bulk("mark_read", [first.id, second.id, self.foreign.id])
+        self.assertEqual(response.data, {"updated": 1, "unread_count": 2})
+
+        response = self.bulk("mark_unread", [first.id, second.id])
+        self.assertEqual(response.data, {"updated": 2, "unread_count": 4})
+
+        response = self.bulk("delete", [first.id, self.foreign.id])
+        self.assertEqual(response.data, {"updated": 1, "unread_count": 3})
+        self.assertTrue(Notifications.objects.filter(pk=self.foreign.pk).exists())
+
+        response = self.bulk("mark_all_read")
+        self.assertEqual(response.data, {"updated": 3, "unread_count": 0})
+        self.assertFalse(Notifications.objects.get(pk=self.foreign.pk).is_read)
+
+    def test_bulk_action_needs_ids(self):
+        self.assertEqual(self.bulk("delete").status_code, 400)
+        self.assertEqual(self.bulk("delete", list(range(1, 502))).status_code, 400)
+
+
+class TestNotificationRetention(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+        self.other = User.objects.create_user(
+            username="other", email="other@example.com", password="pass"
+        )
+        self.now = timezone.now()
+        # (age in days, is_read): only the read 40-day and unread 100-day rows
+        # are past their TTL
+        self.rows = {
+            (age, is_read): self.add_notification(age, is_read)
+            for age, is_read in [(1, True), (40, True), (40, False), (100, False)]
+        }
+        unread.get(self.user.id)
+
+    def add_notification(self, age, is_read):
+        notification = Notifications.objects.create(
+            recipient=self.user,
+            sender=self.other,
+            notification_type="follow",
+            is_read=is_read,
+        )
+        Notifications.objects.filter(pk=notification.pk).update(
+            created_at=self.now - timedelta(days=age)
+        )
+        return notification
+
+    def remaining(self):
+        return set(Notifications.objects.values_list("id", flat=True))
+
+    def test_prunes_expired_rows(self):
+        self.assertEqual(retention.prune(now=self.now), 2)
+        self.assertEqual(
+            self.remaining(),
+            {self.rows[1, True].id, self.rows[40, False].id},
+        )
+        self.assertEqual(unread.get(self.user.id), 1)
+        self.assertFalse(NotificationArchive.objects.exists())
+
+    def test_batches_are_bounded(self):
+        self.assertEqual(retention.prune(batch_size=1, max_batches=1, now=self.now), 1)
+        # oldest first
+        self.assertNotIn(self.rows[100, False].id, self.remaining())
+        self.assertEqual(retention.prune(batch_size=1, now=self.now), 1)
+        self.assertEqual(retention.prune(batch_size=1, now=self.now), 0)
+
+    def test_archives_pruned_rows(self):
+        retention.prune(archive=True, now=self.now)
+        archived = NotificationArchive.objects.order_by("created_at")
+        self.assertEqual(
+            [(row.id, row.is_read) for row in archived],
+            [(self.rows[100, False].id, False), (self.rows[40, True].id, True)],
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "table partitioning needs Postgres")
+class TestNotificationPartitions(TransactionTestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+        self.other = User.objects.create_user(
+            username="other", email="other@example.com", password="pass"
+        )
+        self.now = timezone.now()
+
+    def add_notification(self, created_at):
+        notification = Notifications.objects.create(
+            recipient=self.user, sender=self.other, notification_type="follow"
+        )
+        Notifications.objects.filter(pk=notification.pk).update(created_at=created_at)
+        return notification.pk
+
+    def partition_rows(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT id FROM {connection.ops.quote_name(name)}")
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_conversion_and_partition_upkeep(self):
+        self.add_notification(self.now - timedelta(days=200))
+        current = self.add_notification(self.now)
+        unread.get(self.user.id)
+
+        retention.convert_to_partitioned()
+        self.assertTrue(retention.is_partitioned())
+        months = retention.partitions()
+        this_month = retention.month_start(self.now)
+        self.assertIn(retention.month_start(self.now - timedelta(days=200)), months)
+        self.assertIn(current, self.partition_rows(months[this_month]))
+
+        # past the created months the row lands in the default partition and
+        # moves into its own month once that is created
+        later = self.now + timedelta(days=365)
+        future = self.add_notification(later)
+        self.assertEqual(self.partition_rows(retention.DEFAULT_PARTITION), {future})
+        retention.ensure_partitions(later, months_ahead=0)
+        months = retention.partitions()
+        self.assertEqual(self.partition_rows(retention.DEFAULT_PARTITION), set())
+        self.assertEqual(
+            self.partition_rows(months[retention.month_start(later)]), {future}
+        )
+
+        self.assertEqual(retention.prune(now=self.now), 1)
+        self.assertNotIn(
+            retention.month_start(self.now - timedelta(days=200)),
+            retention.partitions(),
+        )
+        self.assertEqual(
+            set(Notifications.objects.values_list("id", flat=True)), {current, future}
+        )
+        # the counter was seeded before the future row was added
+        self.assertEqual(unread.get(self.user.id), 1)
+
+
+class TestCommentCounters(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        self.reader = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+        self.post = Post.objects.create(author=self.author, title="post", content={})
+
+    def comment(self, parent=None):
+        return Comment.objects.create(
+            post=self.post, user=self.reader, comment="hi", parent=parent
+        )
+
+    def counters(self):
+        self.post.refresh_from_db(fields=["comment_count", "reply_count"])
+        return self.post.comment_count, self.post.reply_count
+
+    def thread(self, replies):
+        parent = self.comment()
+        for _ in range(replies):
+            self.comment(parent=self.comment(parent=parent))
+        return parent
+
+    def test_comments_and_replies_are_counted_apart(self):
+        parent = self.comment()
+        self.comment()
+        reply = self.comment(parent=parent)
+        self.assertEqual(self.counters(), (2, 1))
+
+        # edits touch the activity time only
+        reply.comment = "edited"
+        reply.save()
+        self.assertEqual(self.counters(), (2, 1))
+
+        reply.delete()
+        self.assertEqual(self.counters(), (2, 0))
+        Comment.objects.filter(parent__isnull=True).first().delete()
+        self.assertEqual(self.counters(), (1, 0))
+
+    def test_deleting_a_comment_removes_its_thread_in_one_update(self):
+        self.comment()
+        other = self.thread(1)
+        self.assertEqual(self.counters(), (2, 2))
+
+        updates = []
+        for replies in (1, 4):
+            parent = self.thread(replies)
+            with CaptureQueriesContext(connection) as queries:
+                parent.delete()
+            updates.append(
+                [
+                    query["sql"]
+                    for query in queries
+                    if query["sql"].startswith('UPDATE "posts_post"')
+                ]
+            )
+            self.assertEqual(self.counters(), (2, 2))
+        self.assertEqual([len(statements) for statements in updates], [1, 1])
+
+        # a reply with replies of its own takes them along
+        Comment.objects.get(parent=other).delete()
+        self.assertEqual(self.counters(), (2, 0))
+
+    def test_queryset_deletes_count_each_comment(self):
+        self.thread(2)
+        self.comment()
+        Comment.objects.filter(parent__isnull=False).delete()
+        self.assertEqual(self.counters(), (2, 0))
+
+    def test_deleting_the_post_skips_the_counters(self):
+        self.thread(3)
+        with CaptureQueriesContext(connection) as queries:
+            self.post.delete()
+        self.assertFalse(
+            [
+                query["sql"]
+                for query in queries
+                if query["sql"].startswith('UPDATE "posts_post"')
+            ]
+        )
+        self.assertFalse(Comment.objects.exists())
+
+
+class TestViewerState(TestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.reader = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+        self.authors = [
+            User.objects.create_user(
+                username=f"author{index}",
+                email=f"author{index}@example.com",
+                password="pass",
+            )
+            for index in range(3)
+        ]
+        self.posts = [
+            Post.objects.create(
+                author=self.authors[index % 3], title=f"post {index}", content={}
+            )
+            for index in range(9)
+        ]
+        self.posts[0].liked_by.add(self.reader)
+        SavedPost.objects.create(post=self.posts[1], user=self.reader)
+        Follow.objects.create(follower=self.reader, following=self.authors[2])
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def serialize(self, posts, user=None):
+        request = mock.Mock(user=user or self.reader)
+        return HomePostSerializer(posts, many=True, context={"request": request}).data
+
+    def test_flags_follow_the_viewer(self):
+        data = {post["title"]: post for post in self.serialize(self.posts)}
+        self.assertTrue(data["post 0"]["is_liked"])
+        self.assertFalse(data["post 0"]["is_saved"])
+        self.assertTrue(data["post 1"]["is_saved"])
+        self.assertTrue(data["post 2"]["author_is_following"])
+        self.assertFalse(data["post 3"]["author_is_following"])
+
+        anonymous = self.serialize(self.posts, user=mock.Mock(is_authenticated=False))
+        self.assertFalse(
+            any(
+                post["is_liked"] or post["is_saved"] or post["author_is_following"]
+                for post in anonymous
+            )
+        )
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        # likes, saves and follows are one query each for the whole page
+        for size in (1, 4, 9):
+            posts = list(Post.objects.for_list()[:size])
+            with self.subTest(size=size), self.assertNumQueries(3):
+                self.assertEqual(len(self.serialize(posts)), size)
+
+        counts = []
+        for size in (2, 9):
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    "/api/posts/list-posts/", {"page_size": size}
+                )
+            self.assertEqual(len(response.data["results"]), size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def viewer_state(self, ids, client=None):
+        return (client or self.client).get("/api/posts/viewer-state/", {"ids": ids})
+
+    def test_endpoint_returns_flags_by_post_id(self):
+        own = Post.objects.create(author=self.reader, title="mine", content={})
+        ids = f"{self.posts[0].id},{self.posts[1].id},{self.posts[2].id},{own.id},0"
+        response = self.viewer_state(ids)
+        self.assertEqual(response.status_code, 200)
+        results = response.data["results"]
+        self.assertEqual(
+            set(results), {self.posts[0].id, self.posts[1].id, self.posts[2].id, own.id}
+        )
+        self.assertTrue(results[self.posts[0].id]["is_liked"])
+        self.assertTrue(results[self.posts[1].id]["is_saved"])
+        self.assertTrue(results[self.posts[2].id]["author_is_following"])
+        self.assertTrue(results[own.id]["is_own_post"])
+        self.assertFalse(results[self.posts[0].id]["is_own_post"])
+
+    def test_endpoint_rejects_bad_and_too_many_ids(self):
+        for ids in ("1,x", "1.5", "-"):
+            with self.subTest(ids=ids):
+                self.assertEqual(self.viewer_state(ids).status_code, 400)
+        too_many = ",".join(str(index) for index in range(ViewerStateView.max_ids + 1))
+        self.assertEqual(self.viewer_state(too_many).status_code, 400)
+        # repeats count once
+        repeated = ",".join([str(self.posts[0].id)] * (ViewerStateView.max_ids + 1))
+        self.assertEqual(self.viewer_state(repeated).status_code, 200)
+        self.assertEqual(self.viewer_state("").data["results"], {})
+
+    def test_endpoint_needs_a_login(self):
+        response = self.viewer_state(str(self.posts[0].id), client=APIClient())
+        self.assertEqual(response.status_code, 401)
+
+    def test_endpoint_query_count_does_not_depend_on_id_count(self):
+        # the posts, then likes, saves and follows
+        for posts in (self.posts[:1], self.posts):
+            ids = ",".join(str(post.id) for post in posts)
+            with self.subTest(count=len(posts)), self.assertNumQueries(4):
+                self.assertEqual(
+                    len(self.viewer_state(ids).data["results"]), len(posts)
+                )
+
+
+class TestTrending(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = get_user_model().objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        self.now = timezone.now()
+        self.client = APIClient()
+
+    def post(self, title, hours_ago, like=0, comments=0, replies=0, active_hours_ago=0):
+        post = Post.objects.create(author=self.author, title=title, content={})
+        Post.objects.filter(pk=post.pk).update(
+            created_at=self.now - timedelta(hours=hours_ago),
+            last_activity_at=self.now - timedelta(hours=active_hours_ago),
+            like=like,
+            comment_count=comments,
+            reply_count=replies,
+        )
+        return post
+
+    def scores(self):
+        return dict(Post.objects.values_list("title", "hot_score"))
+
+    def test_hot_scores_weigh_engagement_against_age(self):
+        fresh, old, commented, replied = trending.hot_scores(
+            [10, 10, 0, 0], [0, 0, 5, 0], [0, 0, 0, 10], [1, 48, 1, 1]
+        )
+        self.assertGreater(fresh, old)
+        # a comment counts twice, a reply once
+        self.assertAlmostEqual(commented, fresh)
+        self.assertAlmostEqual(replied, fresh)
+        self.assertAlmostEqual(fresh, 10 / 3**trending.GRAVITY)
+        self.assertEqual(trending.hot_scores([0], [0], [0], [5]), [0])
+
+    def test_refresh_orders_posts_and_zeroes_those_outside_the_window(self):
+        window = trending.WINDOW.total_seconds() / 3600
+        self.post("fresh", hours_ago=2, like=10)
+        self.post("busy", hours_ago=30, like=10, comments=20)
+        self.post("quiet", hours_ago=1)
+        stale = self.post("stale", hours_ago=window + 1, like=500)
+        Post.objects.filter(pk=stale.pk).update(
+            hot_score=99, last_activity_at=self.now - trending.WINDOW * 2
+        )
+        # old, but a recent comment brings it back into the window
+        self.post("revived", hours_ago=window + 1, like=500, active_hours_ago=1)
+
+        self.assertEqual(trending.recompute_hot_scores(), 4)
+        scores = self.scores()
+        self.assertEqual(scores["stale"], 0)
+        self.assertEqual(scores["quiet"], 0)
+        self.assertGreater(scores["revived"], 0)
+        self.assertEqual(
+            sorted(scores, key=scores.get, reverse=True)[:3],
+            ["fresh", "busy", "revived"],
+        )
+
+    def test_trending_sort_pages_by_score(self):
+        for index in range(5):
+            self.post(f"post {index}", hours_ago=1, like=index)
+        trending.recompute_hot_scores()
+
+        url = "/api/posts/list-posts/?sort=trending&page_size=2"
+        titles = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            titles += [post["title"] for post in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(titles, [f"post {index}" for index in (4, 3, 2, 1, 0)])
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class TestConcurrentLikeToggle(TransactionTestCase):
+    # needs a database with real row locking (Postgres); sqlite serializes writers
+    THREADS = 10
+
+    def setUp(self):
+        User = get_user_model()
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        self.users = [
+            User.objects.create_user(
+                username=f"liker{index}",
+                email=f"liker{index}@example.com",
+                password="pass",
+            )
+            for index in range(self.THREADS)
+        ]
+        self.post = Post.objects.create(author=self.author, title="Popular", content={})
+
+    def run_concurrently(self, users):
+        barrier = threading.Barrier(len(users))
+        responses = []
+
+        def click(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                responses.append(client.post(f"/api/posts/post-like/{self.post.id}/"))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=click, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def assert_counter_matches_rows(self):
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like, self.post.liked_by.count())
+
+    def test_concurrent_likes_and_unlikes(self):
+        responses = self.run_concurrently(self.users)
+        self.assertTrue(all(response.data["is_liked"] for response in responses))
+        self.assertEqual(
+            sorted(response.data["likes"] for response in responses),
+            list(range(1, self.THREADS + 1)),
+        )
+        self.assert_counter_matches_rows()
+        self.assertEqual(self.post.like, self.THREADS)
+
+        responses = self.run_concurrently(self.users)
+        self.assertFalse(any(response.data["is_liked"] for response in responses))
+        self.assert_counter_matches_rows()
+        self.assertEqual(self.post.like, 0)
+
+    def test_same_user_clicking_concurrently(self):
+        self.run_concurrently([self.users[0]] * self.THREADS)
+        self.assert_counter_matches_rows()
+        self.assertIn(self.post.like, (0, 1))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class TestNotificationCoalescing(TransactionTestCase):
+    BURST = 200
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+        self.group = f"user_{self.user.id}"
+
+    async def send_burst(self, layer, start):
+        for index in range(start, start + self.BURST):
+            await layer.group_send(
+                self.group,
+                {
+                    "type": "send_notification",
+                    "event_type": "like_notification",
+                    "message": f"like {index}",
+                    "unread_count": index + 1,
+                },
+            )
+
+    async def collect_frames(self):
+        communicator = notification_socket(self.user)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        layer = get_channel_layer()
+        quiet = NotificationConsumer.coalesce_window * 2
+
+        frames = []
+        for start in (0, self.BURST):
+            await self.send_burst(layer, start)
+            await layer.group_send(
+                self.group, {"type": "send_count_update", "unread_count": start + 1}
+            )
+            while not await communicator.receive_nothing(timeout=quiet):
+                frames.append(json.loads(await communicator.receive_from()))
+        await communicator.disconnect()
+        return frames
+
+    def test_burst_is_sent_as_one_frame_per_window(self):
+        frames = async_to_sync(self.collect_frames)()
+
+        self.assertEqual(len(frames), 2)
+        for burst, frame in enumerate(frames):
+            self.assertEqual(frame["type"], "like_notification")
+            self.assertEqual(
+                frame["message"], f"you have {self.BURST} new notifications"
+            )
+            # the count update arrived last, so its count wins
+            self.assertEqual(frame["unread_count"], burst * self.BURST + 1)
+            self.assertEqual(len(frame["events"]), MAX_FRAME_EVENTS)
+            self.assertEqual(
+                frame["events"][-1]["message"], f"like {(burst + 1) * self.BURST - 1}"
+            )
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class TestNotificationReplay(TransactionTestCase):
+    def setUp(self):
+        event_log._log = None
+        self.user = get_user_model().objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+
+    def publish(self, count):
+        for index in range(count):
+            event_log.publish(
+                self.user.id,
+                {
+                    "type": "send_notification",
+                    "event_type": "like_notification",
+                    "message": f"like {index}",
+                    "unread_count": index + 1,
+                },
+            )
+
+    async def first_frame(self, query=""):
+        communicator = notification_socket(self.user, query)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        frame = json.loads(await communicator.receive_from(timeout=2))
+        await communicator.disconnect()
+        return frame
+
+    async def seen_live(self):
+        communicator = notification_socket(self.user)
+        await communicator.connect()
+        await sync_to_async(self.publish)(3)
+        frame = json.loads(await communicator.receive_from(timeout=2))
+        await communicator.disconnect()
+        return frame
+
+    def test_reconnect_replays_only_missed_events(self):
+        live = async_to_sync(self.seen_live)()
+        self.assertEqual(live["message"], "you have 3 new notifications")
+
+        self.publish(5)  # sent while the socket was down
+        frame = async_to_sync(self.first_frame)(f"&last_seen={live['seq']}")
+
+        self.assertEqual(frame["message"], "you have 5 new notifications")
+        self.assertEqual(
+            [event["message"] for event in frame["events"]],
+            [f"like {index}" for index in range(5)],
+        )
+        self.assertEqual(frame["seq"], event_log.latest(self.user.id))
+        self.assertEqual(frame["unread_count"], 0)  # no notification rows
+
+    def test_trimmed_log_resyncs_with_count_only(self):
+        self.publish(event_log.MAX_LENGTH + 1)
+        frame = async_to_sync(self.first_frame)("&last_seen=0-1")
+
+        self.assertEqual(frame["type"], "count_update")
+        self.assertNotIn("events", frame)
+        self.assertEqual(frame["seq"], event_log.latest(self.user.id))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class TestNotificationSocketAuth(TransactionTestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+        self.other = User.objects.create_user(
+            username="other", email="other@example.com", password="pass"
+        )
+
+    async def connects(self, query="", token=None):
+        if token is None:
+            communicator = WebsocketCommunicator(
+                JWTAuthMiddleware(URLRouter(websocket_urlpatterns)),
+                f"/ws/notifications/{self.user.id}/{query}",
+            )
+        else:
+            communicator = notification_socket(self.user, token=token)
+        connected, _ = await communicator.connect()
+        await communicator.disconnect()
+        return connected
+
+    def test_only_the_owner_can_join(self):
+        connects = async_to_sync(self.connects)
+        self.assertTrue(connects(token=AccessToken.for_user(self.user)))
+        self.assertFalse(connects("?last_seen=0-1"))
+        self.assertFalse(connects(token="not-a-jwt"))
+        self.assertFalse(connects(token=AccessToken.for_user(self.other)))
@@ -0,0 +1,150 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef
+from django.utils import timezone
+
+from .models import Follow, Post, TimelineEntry
+
+# Authors above this many followers are not fanned out on write; their posts
+# are pulled into a follower's timeline when that follower reads it.
+FANOUT_FOLLOWER_LIMIT = getattr(settings, "TIMELINE_FANOUT_FOLLOWER_LIMIT", 5000)
+BACKFILL_SIZE = getattr(settings, "TIMELINE_BACKFILL_SIZE", 200)
+BATCH_SIZE = 1000
+PULL_AUTHORS_TTL = 60
+PULL_INTERVAL = getattr(settings, "TIMELINE_PULL_INTERVAL", 60)  # seconds
+PULL_OVERLAP = timedelta(minutes=5)
+REPAIR_KEY = "timeline:repaired-until"
+REPAIR_OVERLAP = timedelta(minutes=5)
+
+
+def entry_for(user_id, post):
+    return TimelineEntry(
+        user_id=user_id,
+        post_id=post.id,
+        author_id=post.author_id,
+        created_at=post.created_at,
+    )
+
+
+def is_pull_author(author_id):
+    return Follow.objects.filter(following_id=author_id).count() > FANOUT_FOLLOWER_LIMIT
+
+
+def fan_out_post(post_id):
+    post = Post.objects.only("id", "author_id", "created_at").get(id=post_id)
+    if is_pull_author(post.author_id):
+        return 0
+
+    follower_ids = Follow.objects.filter(following_id=post.author_id).values_list(
+        "follower_id", flat=True
+    )
+    entries = [entry_for(follower_id, post) for follower_id in follower_ids.iterator()]
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+    return len(entries)
+
+
+def backfill(user_id, author_id):
+    posts = (
+        Post.objects.filter(author_id=author_id)
+        .only("id", "author_id", "created_at")
+        .order_by("-created_at")[:BACKFILL_SIZE]
+    )
+    TimelineEntry.objects.bulk_create(
+        [entry_for(user_id, post) for post in posts], ignore_conflicts=True
+    )
+
+
+def repair(now=None):
+    # Redoes fan-outs and backfills whose task never reached the broker:
+    # recent posts with followers but no timeline entries, and recent follows
+    # of authors with posts but no entries from them. Runs from beat.
+    now = now or timezone.now()
+    since = cache.get(REPAIR_KEY, now - timedelta(hours=1)) - REPAIR_OVERLAP
+    post_ids = list(
+        Post.objects.filter(created_at__gte=since)
+        .filter(Exists(Follow.objects.filter(following_id=OuterRef("author_id"))))
+        .exclude(Exists(TimelineEntry.objects.filter(post_id=OuterRef("pk"))))
+        .values_list("id", flat=True)
+    )
+    for post_id in post_ids:
+        fan_out_post(post_id)
+    follows = list(
+        Follow.objects.filter(created_at__gte=since)
+        .filter(Exists(Post.objects.filter(author_id=OuterRef("following_id"))))
+        .exclude(
+            Exists(
+                TimelineEntry.objects.filter(
+                    user_id=OuterRef("follower_id"), author_id=OuterRef("following_id")
+                )
+            )
+        )
+        .values_list("follower_id", "following_id")
+    )
+    for user_id, author_id in follows:
+        backfill(user_id, author_id)
+    cache.set(REPAIR_KEY, now, None)
+    return len(post_ids) + len(follows)
+
+
+def trim(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def pull_author_ids(user_id):
+    key = f"timeline:pull-authors:{user_id}"
+    author_ids = cache.get(key)
+    if author_ids is None:
+        author_ids = list(
+            Follow.objects.filter(follower_id=user_id)
+            .annotate(follower_total=Count("following__followers"))
+            .filter(follower_total__gt=FANOUT_FOLLOWER_LIMIT)
+            .values_list("following_id", flat=True)
+        )
+        cache.set(key, author_ids, PULL_AUTHORS_TTL)
+    return author_ids
+
+
+def pull_into_timeline(user_id):
+    # Fan-out-on-read for high-follower authors, materialized into
+    # TimelineEntry. It runs at most once per PULL_INTERVAL per reader, so
+    # most feed reads are just the range scan; the trade-off is that posts by
+    # those authors can reach the feed up to PULL_INTERVAL late.
+    if not cache.add(f"timeline:pull-throttle:{user_id}", 1, PULL_INTERVAL):
+        return
+    author_ids = pull_author_ids(user_id)
+    if not author_ids:
+        return
+
+    key = f"timeline:pulled-until:{user_id}"
+    pulled_until = cache.get(key)
+    posts = Post.objects.filter(author_id__in=author_ids).only(
+        "id", "author_id", "created_at"
+    )
+    if pulled_until is not None:
+        # created_at is set before the row commits, so a post can become
+        # visible after a newer one was pulled; look back PULL_OVERLAP and
+        # let ignore_conflicts skip what is already there
+        posts = posts.filter(created_at__gt=pulled_until - PULL_OVERLAP)
+    posts = list(posts.order_by("-created_at")[:BACKFILL_SIZE])
+    if not posts:
+        return
+
+    TimelineEntry.objects.bulk_create(
+        [entry_for(user_id, post) for post in posts], ignore_conflicts=True
+    )
+    newest = posts[0].created_at
+    if pulled_until is None or newest > pulled_until:
+        cache.set(key, newest, None)
+
+
+def read_timeline(user_id):
+    pull_into_timeline(user_id)
+    return (
+        TimelineEntry.objects.filter(user_id=user_id)
+        .select_related("post__author")
+        .defer("post__content", "post__content_html", "post__search_vector")
+    )
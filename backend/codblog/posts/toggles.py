@@ -0,0 +1,58 @@
+from functools import partial
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed
+
+from .models import Post
+
+
+def toggle_membership(post, relation, user, counter=None, defer_counter=None):
+    # One DELETE decides the direction: if no row went away, insert one. The
+    # unique (post, user) constraint settles concurrent inserts, and the
+    # counter only moves when a row really changed, inside the same
+    # transaction, so it stays equal to the number of through rows. With
+    # defer_counter the delta is handed to it after commit instead.
+    through = relation.through
+    keys = {
+        f"{relation.field.m2m_field_name()}_id": post.pk,
+        f"{relation.field.m2m_reverse_field_name()}_id": user.pk,
+    }
+    rows = Post.objects.filter(pk=post.pk)
+
+    with transaction.atomic():
+        changed = through.objects.filter(**keys).delete()[0] > 0
+        added = not changed
+        if added:
+            try:
+                with transaction.atomic():
+                    through.objects.create(**keys)
+                changed = True
+            except IntegrityError:
+                pass  # a concurrent request added it first
+
+        count = None
+        if counter is not None:
+            if changed and defer_counter is not None:
+                transaction.on_commit(
+                    partial(defer_counter, post.pk, 1 if added else -1)
+                )
+            elif changed:
+                step = F(counter) + 1 if added else Greatest(F(counter) - 1, Value(0))
+                rows.update(**{counter: step})
+            # the row lock taken by the update makes this read our own write
+            count = rows.values_list(counter, flat=True).get()
+
+    if changed:
+        # .add()/.remove() are bypassed, so their receivers are fired by hand
+        m2m_changed.send(
+            sender=through,
+            instance=post,
+            action="post_add" if added else "post_remove",
+            reverse=False,
+            model=type(user),
+            pk_set={user.pk},
+            using=rows.db,
+        )
+    return added, count
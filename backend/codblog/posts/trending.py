@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Post
+
+GRAVITY = getattr(settings, "TRENDING_GRAVITY", 1.8)
+WINDOW = timedelta(days=getattr(settings, "TRENDING_WINDOW_DAYS", 7))
+COMMENT_WEIGHT = 2
+REPLY_WEIGHT = 1
+BATCH_SIZE = 2000
+
+
+def hot_scores(likes, comments, replies, ages):
+    # computed column-wise over a whole batch; ages are in hours
+    return [
+        (like + COMMENT_WEIGHT * comment + REPLY_WEIGHT * reply) / (age + 2) ** GRAVITY
+        for like, comment, reply, age in zip(likes, comments, replies, ages)
+    ]
+
+
+def recompute_hot_scores():
+    now = timezone.now()
+    since = now - WINDOW
+    active = (
+        Post.objects.filter(Q(created_at__gte=since) | Q(last_activity_at__gte=since))
+        .only("id", "like", "comment_count", "reply_count", "created_at")
+        .order_by()
+    )
+
+    updated = 0
+    batch = []
+    for post in active.iterator(chunk_size=BATCH_SIZE):
+        batch.append(post)
+        if len(batch) == BATCH_SIZE:
+            updated += score_batch(batch, now)
+            batch = []
+    if batch:
+        updated += score_batch(batch, now)
+
+    # posts that left the window stop competing instead of keeping a frozen score
+    Post.objects.filter(
+        created_at__lt=since, last_activity_at__lt=since, hot_score__gt=0
+    ).update(hot_score=0)
+    return updated
+
+
+def score_batch(posts, now):
+    scores = hot_scores(
+        [post.like for post in posts],
+        [post.comment_count for post in posts],
+        [post.reply_count for post in posts],
+        [(now - post.created_at).total_seconds() / 3600 for post in posts],
+    )
+    for post, score in zip(posts, scores):
+        post.hot_score = score
+    return Post.objects.bulk_update(posts, ["hot_score"], batch_size=BATCH_SIZE)
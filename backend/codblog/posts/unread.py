@@ -0,0 +1,108 @@
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import NotificationCounter, Notifications
+
+User = get_user_model()
+
+RECONCILE_BATCH_SIZE = 1000
+
+
+def count_unread(user_ids):
+    return dict(
+        Notifications.objects.filter(recipient_id__in=user_ids, is_read=False)
+        .values("recipient_id")
+        .annotate(count=Count("id"))
+        .values_list("recipient_id", "count")
+    )
+
+
+def initialize(user_ids):
+    # users without a counter start from COUNT(*) once; the rows already
+    # include whatever change brought us here
+    user_ids = set(User.objects.filter(id__in=user_ids).values_list("id", flat=True))
+    counts = count_unread(user_ids)
+    NotificationCounter.objects.bulk_create(
+        [
+            NotificationCounter(user_id=user_id, unread=counts.get(user_id, 0))
+            for user_id in user_ids
+        ],
+        ignore_conflicts=True,
+    )
+    return {user_id: counts.get(user_id, 0) for user_id in user_ids}
+
+
+def get_many(user_ids):
+    user_ids = set(user_ids)
+    counts = dict(
+        NotificationCounter.objects.filter(user_id__in=user_ids).values_list(
+            "user_id", "unread"
+        )
+    )
+    missing = user_ids - set(counts)
+    if missing:
+        counts.update(initialize(missing))
+    return counts
+
+
+def get(user_id):
+    return get_many([user_id]).get(user_id, 0)
+
+
+def adjust_many(deltas):
+    # call inside the transaction that changed the rows; users with the same
+    # delta share one UPDATE
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    existing = set(
+        NotificationCounter.objects.filter(user_id__in=deltas).values_list(
+            "user_id", flat=True
+        )
+    )
+    by_delta = defaultdict(list)
+    for user_id in existing:
+        by_delta[deltas[user_id]].append(user_id)
+    for delta, user_ids in by_delta.items():
+        NotificationCounter.objects.filter(user_id__in=sorted(user_ids)).update(
+            unread=Greatest(F("unread") + delta, Value(0))
+        )
+    missing = set(deltas) - existing
+    if missing:
+        initialize(missing)
+
+
+def adjust(user_id, delta):
+    adjust_many({user_id: delta})
+
+
+def reconcile(batch_size=RECONCILE_BATCH_SIZE):
+    # rewrites counters that drifted from the rows (cascade deletes, races
+    # with the first counter insert), one bounded batch of users at a time
+    unread = (
+        Notifications.objects.filter(recipient_id=OuterRef("user_id"), is_read=False)
+        .order_by()
+        .values("recipient_id")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    actual = Coalesce(Subquery(unread), 0)
+    fixed = 0
+    last_id = 0
+    while True:
+        user_ids = list(
+            NotificationCounter.objects.filter(user_id__gt=last_id)
+            .order_by("user_id")
+            .values_list("user_id", flat=True)[:batch_size]
+        )
+        if not user_ids:
+            return fixed
+        fixed += (
+            NotificationCounter.objects.filter(user_id__in=user_ids)
+            .exclude(unread=actual)
+            .update(unread=actual)
+        )
+        last_id = user_ids[-1]
@@ -1,7 +1,6 @@
 from django.urls import path
 from .views import *
 
-
 urlpatterns = [
     path("create-posts/", CreatePostView.as_view(), name="create-posts"),
     path("upload-image/", upload_image, name="upload-image"),
@@ -19,10 +18,31 @@ urlpatterns = [
         ShowUserProfileView.as_view(),
         name="public-profile",
     ),
+    path(
+        "user-posts/<int:user_id>/",
+        UserPostsListView.as_view(),
+        name="user-posts",
+    ),
     path("author-profile/", AuthorProfileView.as_view(), name="author-profile"),
     path("delete-post/<int:pk>/", delete_post, name="delete-post"),
     path("edit-post/<int:pk>/", EditPost.as_view(), name="edit-post"),
+    path(
+        "post-revisions/<int:pk>/",
+        PostRevisionListView.as_view(),
+        name="post-revisions",
+    ),
+    path(
+        "post-revisions/<int:pk>/diff/",
+        PostRevisionDiffView.as_view(),
+        name="post-revision-diff",
+    ),
+    path(
+        "post-revisions/<int:pk>/<int:number>/",
+        PostRevisionDetailView.as_view(),
+        name="post-revision-detail",
+    ),
     path("search/", PostSearchAPIView.as_view(), name="search"),
+    path("suggest/", SuggestView.as_view(), name="suggest"),
     path("post-like/<int:post_id>/", PostLikeView.as_view(), name="post-like"),
     path("follow/", FollowUserView.as_view(), name="follow-user"),
     path("unfollow/", UnfollowUserView.as_view(), name="unfollow-user"),
@@ -35,10 +55,12 @@ urlpatterns = [
         name="follow-count",
     ),
     path("following-posts/", FollowedPostView.as_view(), name="following-posts"),
+    path("viewer-state/", ViewerStateView.as_view(), name="viewer-state"),
+    path("notifications/", NotificationInboxView.as_view(), name="notification-inbox"),
     path(
-        "list-notifications/<int:user_id>/",
-        list_notifications.as_view(),
-        name="list-notifications",
+        "notifications/bulk/",
+        NotificationBulkActionView.as_view(),
+        name="notification-bulk",
     ),
     path(
         "notification-actions/<int:notification_id>/",
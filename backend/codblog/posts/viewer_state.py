@@ -0,0 +1,41 @@
+from .models import Follow, Post, SavedPost
+
+
+class ViewerState:
+    def __init__(self, liked_ids=(), saved_ids=(), following_ids=()):
+        self.liked_ids = set(liked_ids)
+        self.saved_ids = set(saved_ids)
+        self.following_ids = set(following_ids)
+
+    def is_liked(self, post):
+        return post.id in self.liked_ids
+
+    def is_saved(self, post):
+        return post.id in self.saved_ids
+
+    def is_following(self, author_id):
+        return author_id in self.following_ids
+
+
+def resolve_viewer_state(user, posts):
+    # one query each for likes, saves and follows, whatever the page size
+    if user is None or not user.is_authenticated:
+        return ViewerState()
+
+    posts = [post for post in posts if post is not None]
+    post_ids = [post.id for post in posts]
+    author_ids = {post.author_id for post in posts}
+    if not post_ids:
+        return ViewerState()
+
+    liked_ids = Post.liked_by.through.objects.filter(
+        customuser_id=user.id, post_id__in=post_ids
+    ).values_list("post_id", flat=True)
+    saved_ids = SavedPost.objects.filter(
+        user_id=user.id, post_id__in=post_ids
+    ).values_list("post_id", flat=True)
+    following_ids = Follow.objects.filter(
+        follower_id=user.id, following_id__in=author_ids
+    ).values_list("following_id", flat=True)
+
+    return ViewerState(liked_ids, saved_ids, following_ids)
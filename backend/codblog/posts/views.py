@@ -10,14 +10,34 @@ from rest_framework.permissions import (
     IsAuthenticatedOrReadOnly,
 )
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
+from django.db import transaction
 from django.db.models import Q, Count
 from rest_framework.views import APIView
+from rest_framework.utils.urls import replace_query_param
 from rest_framework import status, generics
 from django.shortcuts import get_object_or_404
 from .serializers import *
 from django.contrib.auth import get_user_model
-from rest_framework.pagination import PageNumberPagination
 from .models import *
+from .pagination import KeysetPagination
+from .renderers import PostHTMLRenderer
+from .viewer_state import resolve_viewer_state
+from .conditional import (
+    comment_list_stamp,
+    conditional,
+    post_detail_stamp,
+    user_profile_stamp,
+)
+from . import cache as response_cache
+from . import editorjs
+from . import like_buffer
+from . import revisions
+from . import search
+from . import suggest
+from . import timeline
+from . import toggles
+from . import unread
 import logging
 
 User = get_user_model()
@@ -25,18 +45,16 @@ MAX_IMAGE_SIZE = 5  # MB
 logger = logging.getLogger(__name__)
 
 
-class CustomPaginationClass(PageNumberPagination):
-    page_size = 15
-
-
 class CreatePostView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
         print("this is the request data : ", request.data)
-        serializer = PostSerializer(data=request.data)
+        serializer = PostSerializer(data=request.data, context={"request": request})
         if serializer.is_valid():
-            serializer.save(author=request.user)
+            with transaction.atomic():
+                post = serializer.save(author=request.user)
+                revisions.record_revision(post, None, request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -88,40 +106,50 @@ class ListPostView(generics.ListAPIView):
     permission_classes = [AllowAny]
     authentication_classes = []
     serializer_class = HomePostSerializer
-    pagination_class = CustomPaginationClass
+    pagination_class = KeysetPagination
 
-    def get_queryset(self):
+    SORT_ORDERINGS = {
+        "trending": ("-hot_score", "-id"),
+        "newest": ("-created_at", "-id"),
+        "oldest": ("created_at", "id"),
+        "most_liked": ("-like", "-created_at", "-id"),
+        "least_liked": ("like", "created_at", "id"),
+    }
+
+    def get_cursor_ordering(self):
         sort_by = self.request.query_params.get("sort", "newest")
+        return self.SORT_ORDERINGS.get(sort_by, self.SORT_ORDERINGS["newest"])
 
-        queryset = Post.objects.all()
+    def get_queryset(self):
+        return Post.objects.for_list()
 
-        if sort_by == "newest":
-            queryset = queryset.order_by("-created_at")
-        elif sort_by == "oldest":
-            queryset = queryset.order_by("created_at")
-        elif sort_by == "most_liked":
-            queryset = queryset.annotate(like_count=Count("like")).order_by(
-                "like_count", "created_at"
-            )
-            print("most liked", queryset)
-        elif sort_by == "least_liked":
-            queryset = queryset.annotate(like_count=Count("like")).order_by(
-                "-like_count", "-created_at"
-            )
+    def list(self, request, *args, **kwargs):
+        data = response_cache.cached_response(
+            response_cache.request_key("list", request),
+            response_cache.list_version(),
+            lambda: super(ListPostView, self).list(request, *args, **kwargs).data,
+        )
+        return Response(data)
 
-            print("least liked", queryset)
-        else:
-            queryset = queryset.order_by("-created_at")
 
-        return queryset
+class SavedPostsListView(APIView):
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = ("-saved_at", "-id")
 
+    def get(self, request):
+        saves = (
+            SavedPost.objects.filter(user=request.user)
+            .select_related("post__author")
+            .defer("post__content", "post__content_html", "post__search_vector")
+        )
 
-class SavedPostsListView(generics.ListAPIView):
-    permission_classes = [IsAuthenticated]
-    serializer_class = HomePostSerializer
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(saves, request, view=self)
 
-    def get_queryset(self):
-        return Post.objects.filter(saved_by=self.request.user)
+        serializer = HomePostSerializer(
+            [save.post for save in page], many=True, context={"request": request}
+        )
+        return paginator.get_paginated_response(serializer.data)
 
 
 class ToggleSavePostView(APIView):
@@ -129,19 +157,13 @@ class ToggleSavePostView(APIView):
 
     def post(self, request, post_id):
         try:
-            post = Post.objects.get(id=post_id)
+            post = Post.objects.for_list().get(id=post_id)
         except Post.DoesNotExist:
             return Response(
                 {"detail": "Post not found."}, status=status.HTTP_404_NOT_FOUND
             )
 
-        user = request.user
-        saved = False
-        if user in post.saved_by.all():
-            post.saved_by.remove(user)
-        else:
-            post.saved_by.add(user)
-            saved = True
+        saved, _ = toggles.toggle_membership(post, Post.saved_by, request.user)
 
         return Response(
             {"saved": saved},
@@ -151,16 +173,42 @@ class ToggleSavePostView(APIView):
 
 class ShowPostDetailView(APIView):
     permission_classes = [AllowAny]
+    renderer_classes = [JSONRenderer, BrowsableAPIRenderer, PostHTMLRenderer]
 
+    @conditional(post_detail_stamp)
     def get(self, request, pk):
-        try:
-            post = Post.objects.get(pk=pk)
-            serializer = PostSerializer(post, context={"request": request})
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except Post.DoesNotExist:
+        if request.accepted_renderer.format == PostHTMLRenderer.format:
+            # pre-rendered at save time, so this is a single column fetch
+            content_html = (
+                Post.objects.filter(pk=pk)
+                .values_list("content_html", flat=True)
+                .first()
+            )
+            if content_html is None:
+                return Response("", status=status.HTTP_404_NOT_FOUND)
+            return Response(content_html, status=status.HTTP_200_OK)
+
+        if request.user.is_authenticated:
+            data = self.get_post_data(request, pk)
+        else:
+            data = response_cache.cached_response(
+                response_cache.request_key(f"detail:{pk}", request),
+                response_cache.post_version(pk),
+                lambda: self.get_post_data(request, pk),
+            )
+
+        if data is None:
             return Response(
                 {"error": "Post not found."}, status=status.HTTP_404_NOT_FOUND
             )
+        return Response(data, status=status.HTTP_200_OK)
+
+    def get_post_data(self, request, pk):
+        try:
+            post = Post.objects.select_related("author").get(pk=pk)
+        except Post.DoesNotExist:
+            return None
+        return PostSerializer(post, context={"request": request}).data
 
 
 class ShowUserProfileView(generics.ListAPIView):
@@ -168,9 +216,24 @@ class ShowUserProfileView(generics.ListAPIView):
     serializer_class = UserProfileSerializer
     lookup_url_kwarg = "user_id"
 
+    @conditional(user_profile_stamp)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        user_id = self.kwargs.get(self.lookup_url_kwarg)
+        return User.objects.filter(id=user_id).annotate(post_count=Count("post"))
+
+
+class UserPostsListView(generics.ListAPIView):
+    permission_classes = [AllowAny]
+    serializer_class = SimplePostSerializer
+    pagination_class = KeysetPagination
+    lookup_url_kwarg = "user_id"
+
     def get_queryset(self):
         user_id = self.kwargs.get(self.lookup_url_kwarg)
-        return User.objects.filter(id=user_id)
+        return Post.objects.for_list().filter(author_id=user_id)
 
 
 class AuthorProfileView(APIView):
@@ -215,48 +278,171 @@ class EditPost(APIView):
     permission_classes = [IsAuthenticated]
 
     def put(self, request, pk):
-        data = request.data
-        content = data.get("content", None)
-        print(content)
-
-        title = None
-        for block in content.get("blocks", []):
-            if block.get("type") == "header":
-                title = block.get("data", {}).get("text", "").strip()
-                if title:
-                    break
+        with transaction.atomic():
+            try:
+                post = Post.objects.select_for_update().get(pk=pk, author=request.user)
+            except Post.DoesNotExist:
+                return Response(
+                    {"error": "Post not found or unauthorized"},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+
+            # title, excerpt and reading stats are derived from content in Post.save
+            previous_content = post.content
+            serializer = PostEditSerializer(
+                instance=post, data=request.data, partial=True
+            )
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+            serializer.save(revision=post.revision + 1)
+            revisions.record_revision(post, previous_content, request.user)
+
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def patch(self, request, pk):
+        serializer = PostPatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        base_revision = serializer.validated_data["base_revision"]
+
+        with transaction.atomic():
+            try:
+                post = Post.objects.select_for_update().get(pk=pk, author=request.user)
+            except Post.DoesNotExist:
+                return Response(
+                    {"error": "Post not found or unauthorized"},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+
+            if post.revision != base_revision:
+                return Response(
+                    {"error": "revision conflict", "revision": post.revision},
+                    status=status.HTTP_409_CONFLICT,
+                )
+
+            previous_content = post.content
+            try:
+                post.content = editorjs.apply_block_ops(
+                    previous_content, serializer.validated_data["ops"]
+                )
+            except editorjs.BlockOperationError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            post.revision += 1
+            post.save(update_fields=["content", "revision", "updated_at"])
+            revisions.record_revision(post, previous_content, request.user)
+
+        return Response(
+            {"revision": post.revision, "title": post.title},
+            status=status.HTTP_200_OK,
+        )
+
+
+class PostRevisionListView(generics.ListAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = PostRevisionSerializer
+    pagination_class = KeysetPagination
+    cursor_ordering = ("-number",)
+
+    def get_queryset(self):
+        post = get_object_or_404(Post, pk=self.kwargs["pk"], author=self.request.user)
+        return post.revisions.select_related("editor")
+
+
+class PostRevisionDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk, number):
+        post = get_object_or_404(Post, pk=pk, author=request.user)
         try:
-            post = Post.objects.get(pk=pk)
-        except Post.DoesNotExist:
+            content = revisions.rebuild(post, number)
+        except revisions.RevisionNotFound:
             return Response(
-                {"error": "post not found"}, status=status.HTTP_404_NOT_FOUND
+                {"error": "revision not found"}, status=status.HTTP_404_NOT_FOUND
             )
-        data["title"] = title
-        print("this is the title", title)
-        serializer = PostEditSerializer(instance=post, data=data, partial=True)
+        return Response({"number": number, "content": content})
 
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
 
-        print(serializer.errors)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+class PostRevisionDiffView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        post = get_object_or_404(Post, pk=pk, author=request.user)
+        try:
+            old_number = int(request.query_params["from"])
+            new_number = int(request.query_params["to"])
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "from and to revision numbers are required"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            old = revisions.rebuild(post, old_number)
+            new = revisions.rebuild(post, new_number)
+        except revisions.RevisionNotFound:
+            return Response(
+                {"error": "revision not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(
+            {"from": old_number, "to": new_number, **revisions.diff(old, new)}
+        )
 
 
 class PostSearchAPIView(APIView):
     permission_classes = [AllowAny]
+    page_size = 20
+    max_page_size = 50
 
     def get(self, request):
-        query = request.GET.get("q", "")
-        if query:
-            posts = Post.objects.filter(
-                Q(title__icontains=query) | Q(author__username__icontains=query)
+        query = request.GET.get("q", "").strip()
+        try:
+            page = max(1, int(request.GET.get("page", 1)))
+            page_size = min(
+                self.max_page_size,
+                max(1, int(request.GET.get("page_size", self.page_size))),
+            )
+        except ValueError:
+            return Response(
+                {"error": "page and page_size must be integers"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-        else:
-            posts = Post.objects.none()
 
-        serializer = PostSearchSerializer(posts, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        offset = (page - 1) * page_size
+        # one extra row tells us whether there is a next page without a COUNT
+        posts = (
+            search.get_backend().search(query, offset, page_size + 1) if query else []
+        )
+        has_next = len(posts) > page_size
+        posts = posts[:page_size]
+
+        serializer = PostSearchSerializer(
+            posts, many=True, context={"request": request}
+        )
+        url = request.build_absolute_uri()
+        return Response(
+            {
+                "next": (
+                    replace_query_param(url, "page", page + 1) if has_next else None
+                ),
+                "previous": (
+                    replace_query_param(url, "page", page - 1) if page > 1 else None
+                ),
+                "results": serializer.data,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class SuggestView(APIView):
+    # typeahead: an indexed prefix lookup, no auth or serializer on the hot path
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request):
+        results = suggest.suggest(request.GET.get("q", ""))
+        return Response({"results": results}, status=status.HTTP_200_OK)
 
 
 class PostLikeView(APIView):
@@ -264,32 +450,26 @@ class PostLikeView(APIView):
 
     def post(self, request, post_id):
         try:
-            post = Post.objects.get(id=post_id)
+            post = Post.objects.for_list().get(id=post_id)
         except Post.DoesNotExist:
             return Response(
                 {"error": "Post does not exists"}, status=status.HTTP_404_NOT_FOUND
             )
 
-        user = request.user
-        if user in post.liked_by.all():
-            post.liked_by.remove(user)
-            post.like = max(0, post.like - 1)
-            post.save()
-            is_liked = False
-            message = "Like removed"
-            return Response(
-                {"message": message, "likes": post.like, "is_liked": is_liked}
-            )
-
-        else:
-            post.liked_by.add(user)
-            post.like += 1
-            post.save()
-            is_liked = True
-            message = "Like added"
-            return Response(
-                {"message": message, "likes": post.like, "is_liked": is_liked}
-            )
+        # in write-behind mode the count waits in the buffer for the next flush
+        is_liked, likes = toggles.toggle_membership(
+            post,
+            Post.liked_by,
+            request.user,
+            counter="like",
+            defer_counter=like_buffer.add if like_buffer.enabled() else None,
+        )
+        if like_buffer.enabled():
+            # the count and the id of the last batch in it, from one row read
+            post.refresh_from_db(fields=["like", "last_like_flush"])
+            likes = post.like + like_buffer.pending([post])[post.pk]
+        message = "Like added" if is_liked else "Like removed"
+        return Response({"message": message, "likes": likes, "is_liked": is_liked})
 
 
 # ----------------------------------------
@@ -346,6 +526,48 @@ class FollowStatusView(APIView):
         return Response({"is_following": is_following})
 
 
+class ViewerStateView(APIView):
+    # like/save/follow flags for a whole feed page in one round trip
+    permission_classes = [IsAuthenticated]
+    max_ids = 100
+
+    def get(self, request):
+        raw_ids = [
+            part
+            for value in request.GET.getlist("ids")
+            for part in value.split(",")
+            if part.strip()
+        ]
+        try:
+            post_ids = list(dict.fromkeys(int(part) for part in raw_ids))
+        except ValueError:
+            return Response(
+                {"error": "ids must be integers"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(post_ids) > self.max_ids:
+            return Response(
+                {"error": f"At most {self.max_ids} ids per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        posts = list(Post.objects.filter(id__in=post_ids).only("id", "author_id"))
+        state = resolve_viewer_state(request.user, posts)
+        return Response(
+            {
+                "results": {
+                    post.id: {
+                        "is_liked": state.is_liked(post),
+                        "is_saved": state.is_saved(post),
+                        "author_is_following": state.is_following(post.author_id),
+                        "is_own_post": post.author_id == request.user.id,
+                    }
+                    for post in posts
+                }
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
 class GetFollowCountView(APIView):
     permission_classes = [AllowAny]
 
@@ -362,89 +584,60 @@ class GetFollowCountView(APIView):
 
 class FollowedPostView(APIView):
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ("-created_at", "-post_id")
 
     def get(self, request):
-        user = request.user
-        followed_user_ids = Follow.objects.filter(follower=user).values_list(
-            "following", flat=True
-        )
-        posts = Post.objects.filter(author_id__in=followed_user_ids).order_by(
-            "-created_at"
-        )
-
-        paginator = CustomPaginationClass()
-        paninated_posts = paginator.paginate_queryset(posts, request, view=self)
-
-        serializer = PostSerializer(posts, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        entries = timeline.read_timeline(request.user.id)
 
+        paginator = KeysetPagination()
+        paginated_entries = paginator.paginate_queryset(entries, request, view=self)
 
-class list_notifications(APIView):
-    def get(self, request, user_id):
-        notifications = (
-            Notifications.objects.filter(recipient_id=user_id)
-            .select_related("sender")
-            .order_by("-created_at")
+        serializer = HomePostSerializer(
+            [entry.post for entry in paginated_entries],
+            many=True,
+            context={"request": request},
         )
-        print("noticount", notifications.count())
+        return paginator.get_paginated_response(serializer.data)
 
-        if not notifications.exists():
-            return Response(
-                {"message": "No notifications found"}, status=status.HTTP_404_NOT_FOUND
-            )
 
-        data = [
-            {
-                "id": n.id,
-                "sender": {
-                    "username": n.sender.username,
-                    "profile_image": (
-                        request.build_absolute_uri(n.sender.profile_image.url)
-                        if n.sender.profile_image
-                        else None
-                    ),
-                },
-                "notification_type": n.notification_type,
-                "post_title": n.post.title if n.post else None,
-                "comment_content": n.comment.comment if n.comment else None,
-                "is_read": n.is_read,
-                "created_at": n.created_at,
-            }
-            for n in notifications
-        ]
-
-        return Response(
-            {"notification_data": data, "count": notifications.count()},
-            status=status.HTTP_200_OK,
-        )
+def delete_notifications(notifications):
+    # delete() also counts the NotificationActor rows that go with them
+    return notifications.delete()[1].get(Notifications._meta.label, 0)
 
 
 class notification_actions(APIView):
     def post(self, request, notification_id):
+        # a second delete of the same notification is a 404, not a 500
+        notification = get_object_or_404(request.user.notifications, id=notification_id)
         try:
             data = request.data
             action = data.get("action")
 
-            notification = get_object_or_404(
-                request.user.notifications, id=notification_id
-            )
+            # the conditional UPDATE/DELETE decides whether the counter moves
+            notifications = request.user.notifications.filter(id=notification.id)
 
             if action == "mark_read":
-                notification.is_read = True
-                notification.save()
+                with transaction.atomic():
+                    if notifications.filter(is_read=False).update(is_read=True):
+                        unread.adjust(request.user.id, -1)
                 return Response(
                     {"message": "marked as read"}, status=status.HTTP_200_OK
                 )
 
             if action == "mark_unread":
-                notification.is_read = False
-                notification.save()
+                with transaction.atomic():
+                    if notifications.filter(is_read=True).update(is_read=False):
+                        unread.adjust(request.user.id, 1)
                 return Response(
                     {"message": "marked as unread"}, status=status.HTTP_200_OK
                 )
 
             elif action == "delete":
-                notification.delete()
+                with transaction.atomic():
+                    if delete_notifications(notifications.filter(is_read=False)):
+                        unread.adjust(request.user.id, -1)
+                    else:
+                        notifications.delete()
                 return Response(
                     {"message": "notification deleted"}, status=status.HTTP_200_OK
                 )
@@ -462,10 +655,79 @@ class notification_actions(APIView):
             )
 
 
+class NotificationInboxView(APIView):
+    # the requester's notification groups, newest first, one page at a time
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = ("-created_at", "-id")
+
+    def get(self, request):
+        notifications = Notifications.objects.filter(
+            recipient=request.user
+        ).select_related("sender", "post", "comment")
+
+        if request.query_params.get("unread") in ("1", "true"):
+            notifications = notifications.filter(is_read=False)
+        notification_type = request.query_params.get("type")
+        if notification_type:
+            if notification_type not in dict(Notifications.NOTIFICACTION_TYPES):
+                return Response(
+                    {"error": "Unknown notification type"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            notifications = notifications.filter(notification_type=notification_type)
+
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(notifications, request, view=self)
+        serializer = NotificationSerializer(
+            page, many=True, context={"request": request}
+        )
+        response = paginator.get_paginated_response(serializer.data)
+        response.data["unread_count"] = unread.get(request.user.id)
+        return response
+
+
+class NotificationBulkActionView(APIView):
+    # one UPDATE/DELETE for a whole selection instead of a call per row
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = NotificationBulkActionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        action = serializer.validated_data["action"]
+
+        notifications = request.user.notifications.all()
+        if action != "mark_all_read":
+            ids = serializer.validated_data["ids"]
+            notifications = notifications.filter(id__in=ids)
+
+        with transaction.atomic():
+            if action in ("mark_all_read", "mark_read"):
+                changed = notifications.filter(is_read=False).update(is_read=True)
+                unread.adjust(request.user.id, -changed)
+            elif action == "mark_unread":
+                changed = notifications.filter(is_read=True).update(is_read=False)
+                unread.adjust(request.user.id, changed)
+            else:
+                unread_deleted = delete_notifications(
+                    notifications.filter(is_read=False)
+                )
+                changed = unread_deleted + delete_notifications(notifications)
+                unread.adjust(request.user.id, -unread_deleted)
+
+        return Response(
+            {"updated": changed, "unread_count": unread.get(request.user.id)},
+            status=status.HTTP_200_OK,
+        )
+
+
 class ListCommentView(generics.ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = CommentSerializer
 
+    @conditional(comment_list_stamp)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
     def get_queryset(self):
         post_id = self.kwargs.get("post_id")
         try: